@@ -0,0 +1,129 @@
+"""
+Benchmark: concurrent get_daily_summary calls from asyncio
+
+Compares three ways of serving N concurrent summary requests on one event loop:
+  sync in loop     - MealDatabase called directly inside the coroutine (blocks the loop)
+  sync + executor  - MealDatabase called via loop.run_in_executor on a thread pool
+  AsyncMealDatabase
+
+A ticker task measures event loop lag: how late a 5 ms sleep wakes up while
+the calls run. A summary read from daily_totals takes tens of microseconds,
+so calling it inside the loop wins on raw throughput; the thread handoff is
+the cost of keeping the loop free when a call does wait on disk or on a
+locked database (busy_timeout), which a sync call would spend blocking every
+other request on the loop.
+
+Usage:
+    python benchmarks/bench_async_database.py [workers] [users]
+"""
+import sys
+import os
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from database import MealDatabase
+from async_database import AsyncMealDatabase
+
+DB_PATH = "data/bench_async.db"
+MEALS_PER_USER = 60
+
+
+def remove_db_files(db_path: str):
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+
+def seed(users: int):
+    db = MealDatabase(db_path=DB_PATH)
+    now = datetime.now()
+
+    def records():
+        for user in range(users):
+            for i in range(MEALS_PER_USER):
+                yield {
+                    'phone_number': f"whatsapp:+1{user:010d}",
+                    'meal_description': "bench meal",
+                    'total_calories': 300.0,
+                    'total_protein': 15.0,
+                    'parsed_items': '[]',
+                    'source': 'bench',
+                    'timestamp': now - timedelta(hours=i * 6),
+                }
+
+    db.log_meals(records())
+    db.close()
+
+
+async def measure(calls, concurrency: int):
+    """Run `concurrency` calls at once; return (calls/s, max loop lag in ms)"""
+    lag = [0.0]
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            before = time.perf_counter()
+            await asyncio.sleep(0.005)
+            lag[0] = max(lag[0], time.perf_counter() - before - 0.005)
+
+    tick = asyncio.ensure_future(ticker())
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    await asyncio.gather(*(calls(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await tick
+    return concurrency / elapsed, lag[0] * 1000
+
+
+async def run(workers: int, users: int):
+    phones = [f"whatsapp:+1{user:010d}" for user in range(users)]
+
+    sync_db = MealDatabase(db_path=DB_PATH, max_connections=workers)
+    executor = ThreadPoolExecutor(max_workers=workers)
+    async_db = AsyncMealDatabase(db_path=DB_PATH, max_workers=workers)
+
+    async def sync_in_loop(i):
+        return sync_db.get_daily_summary(phones[i % users])
+
+    async def sync_executor(i):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, sync_db.get_daily_summary, phones[i % users])
+
+    async def facade(i):
+        return await async_db.get_daily_summary(phones[i % users])
+
+    print(f"{'variant':<20} {'concurrent':>10} {'calls/s':>10} {'max lag ms':>11}")
+    for concurrency in (10, 100, 1000, 5000):
+        for label, calls in (("sync in loop", sync_in_loop),
+                             ("sync + executor", sync_executor),
+                             ("AsyncMealDatabase", facade)):
+            rate, lag = await measure(calls, concurrency)
+            print(f"{label:<20} {concurrency:>10} {rate:>10,.0f} {lag:>11.1f}")
+        print()
+
+    executor.shutdown()
+    sync_db.close()
+    await async_db.aclose()
+
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    print("=" * 70)
+    print(f"📊 Concurrent get_daily_summary: {workers} workers, {users} users")
+    print("=" * 70)
+
+    remove_db_files(DB_PATH)
+    seed(users)
+    asyncio.run(run(workers, users))
+    remove_db_files(DB_PATH)
+
+
+if __name__ == "__main__":
+    main()
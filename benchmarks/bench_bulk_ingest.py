@@ -0,0 +1,80 @@
+"""
+Benchmark: log_meals bulk ingestion vs per-call log_meal
+
+Usage:
+    python benchmarks/bench_bulk_ingest.py [rows]
+"""
+import sys
+import os
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from database import MealDatabase
+
+DB_PATH = "data/bench_bulk.db"
+USERS = 50
+
+
+def remove_db_files(db_path: str):
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+
+def records(count: int):
+    base = datetime.now() - timedelta(days=365)
+    for i in range(count):
+        yield {
+            'phone_number': f"whatsapp:+1{i % USERS:010d}",
+            'meal_description': "bench meal",
+            'total_calories': 300.0,
+            'total_protein': 15.0,
+            'parsed_items': '[]',
+            'items_extracted': 'bench',
+            'source': 'bench',
+            'timestamp': base + timedelta(minutes=i * 7),
+        }
+
+
+def per_call(rows: int) -> float:
+    remove_db_files(DB_PATH)
+    db = MealDatabase(db_path=DB_PATH)
+    start = time.perf_counter()
+    for record in records(rows):
+        db.log_meal(**record)
+    elapsed = time.perf_counter() - start
+    db.close()
+    return elapsed
+
+
+def bulk(rows: int, chunk_size: int) -> float:
+    remove_db_files(DB_PATH)
+    db = MealDatabase(db_path=DB_PATH)
+    start = time.perf_counter()
+    db.log_meals(records(rows), chunk_size=chunk_size)
+    elapsed = time.perf_counter() - start
+    db.close()
+    return elapsed
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    print("=" * 70)
+    print(f"📊 Ingesting {rows:,} meals")
+    print("=" * 70)
+
+    elapsed = per_call(rows)
+    print(f"{'log_meal per call':<28} {rows / elapsed:>10,.0f} rows/s")
+
+    for chunk_size in (100, 1000, 5000):
+        elapsed = bulk(rows, chunk_size)
+        print(f"{f'log_meals chunk={chunk_size}':<28} {rows / elapsed:>10,.0f} rows/s")
+
+    remove_db_files(DB_PATH)
+
+
+if __name__ == "__main__":
+    main()
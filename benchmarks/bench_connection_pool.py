@@ -0,0 +1,93 @@
+"""
+Benchmark: per-call sqlite3.connect() vs pooled connections
+
+Times the hot webhook pair (log_meal + get_daily_summary) both ways.
+
+Usage:
+    python benchmarks/bench_connection_pool.py [iterations]
+"""
+import sys
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from database import MealDatabase, get_meal_tag
+
+DB_PATH = "data/bench_pool.db"
+PHONE = "whatsapp:+10000000000"
+
+
+def remove_db_files(db_path: str):
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+
+def per_call_connect(db_path: str, iterations: int) -> float:
+    """Old behaviour: every call opens and closes its own connection"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        now = datetime.now()
+
+        # log_meal (+ add_user, which opened a second connection)
+        conn = sqlite3.connect(db_path)
+        user_conn = sqlite3.connect(db_path)
+        user_conn.execute('INSERT OR IGNORE INTO users (phone_number, name) VALUES (?, ?)', (PHONE, None))
+        user_conn.commit()
+        user_conn.close()
+        conn.execute('''
+            INSERT INTO meals (phone_number, meal_description, timestamp, total_calories,
+                             total_protein, parsed_items, items_extracted, source, meal_tag)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (PHONE, "bench meal", now.isoformat(), 250.0, 12.0, '[]', 'bench', 'bench', get_meal_tag(now)))
+        conn.commit()
+        conn.close()
+
+        # get_daily_summary
+        conn = sqlite3.connect(db_path)
+        conn.execute('''
+            SELECT COUNT(*), SUM(total_calories), SUM(total_protein)
+            FROM meals WHERE phone_number = ? AND DATE(timestamp) = ?
+        ''', (PHONE, now.strftime('%Y-%m-%d'))).fetchone()
+        conn.close()
+    return time.perf_counter() - start
+
+
+def pooled(db: MealDatabase, iterations: int) -> float:
+    """Current behaviour: MealDatabase methods check out pooled connections"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        db.log_meal(PHONE, "bench meal", 250.0, 12.0, '[]', 'bench', source="bench")
+        db.get_daily_summary(PHONE)
+    return time.perf_counter() - start
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    remove_db_files(DB_PATH)
+    db = MealDatabase(db_path=DB_PATH)
+
+    # Warm up both paths
+    per_call_connect(DB_PATH, 20)
+    pooled(db, 20)
+
+    per_call = per_call_connect(DB_PATH, iterations)
+    pool = pooled(db, iterations)
+
+    print("=" * 70)
+    print(f"📊 log_meal + get_daily_summary x {iterations}")
+    print("=" * 70)
+    print(f"Per-call connect: {per_call:8.3f}s  ({iterations / per_call:8.0f} pairs/s)")
+    print(f"Pooled:           {pool:8.3f}s  ({iterations / pool:8.0f} pairs/s)")
+    print(f"Speedup:          {per_call / pool:8.2f}x")
+
+    db.close()
+    remove_db_files(DB_PATH)
+
+
+if __name__ == "__main__":
+    main()
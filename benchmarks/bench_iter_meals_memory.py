@@ -0,0 +1,107 @@
+"""
+Benchmark: peak memory of get_all_meals (list) vs iter_meals (generator)
+
+Seeds a database once, then runs each variant in a fresh subprocess so the
+peak RSS it reports belongs to that variant alone.
+
+Usage:
+    python benchmarks/bench_iter_meals_memory.py [rows]
+"""
+import sys
+import os
+import resource
+import subprocess
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from database import MealDatabase
+
+DB_PATH = "data/bench_iter_meals.db"
+USERS = 200
+
+
+def remove_db_files(db_path: str):
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+
+def records(count: int):
+    base = datetime.now() - timedelta(days=365)
+    for i in range(count):
+        yield {
+            'phone_number': f"whatsapp:+1{i % USERS:010d}",
+            'meal_description': "2 rotis with dal and a bowl of rice",
+            'total_calories': 450.0,
+            'total_protein': 18.0,
+            'parsed_items': '[]',
+            'items_extracted': '[{"name": "roti", "quantity": 2}, {"name": "dal", "quantity": 1}]',
+            'source': 'bench',
+            'timestamp': base + timedelta(seconds=i * 30),
+        }
+
+
+def peak_rss_mib() -> float:
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_variant(variant: str):
+    """Child process: consume every meal one way and report memory"""
+    db = MealDatabase(db_path=DB_PATH)
+    baseline = peak_rss_mib()
+    start = time.perf_counter()
+
+    total = 0.0
+    count = 0
+    if variant == "list":
+        for meal in db.get_all_meals():
+            total += meal['calories']
+            count += 1
+    else:
+        chunk_size = int(variant.split("=")[1])
+        for meal in db.iter_meals(chunk_size=chunk_size):
+            total += meal['calories']
+            count += 1
+
+    elapsed = time.perf_counter() - start
+    db.close()
+    print(f"{count} {elapsed:.2f} {baseline:.1f} {peak_rss_mib():.1f}")
+
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == "--variant":
+        run_variant(sys.argv[2])
+        return
+
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+
+    print("=" * 70)
+    print(f"📊 Seeding {rows:,} meals")
+    print("=" * 70)
+    remove_db_files(DB_PATH)
+    db = MealDatabase(db_path=DB_PATH)
+    start = time.perf_counter()
+    db.log_meals(records(rows), chunk_size=5000)
+    db.close()
+    print(f"Seeded in {time.perf_counter() - start:.1f}s\n")
+
+    print(f"{'variant':<26} {'rows':>10} {'seconds':>9} {'baseline MiB':>13} {'peak MiB':>10}")
+    for variant in ("list", "iter chunk=100", "iter chunk=500", "iter chunk=5000"):
+        arg = "list" if variant == "list" else "chunk=" + variant.split("=")[1]
+        result = subprocess.run(
+            [sys.executable, __file__, "--variant", arg],
+            capture_output=True, text=True, check=True
+        )
+        count, elapsed, baseline, peak = result.stdout.split()
+        label = "get_all_meals" if variant == "list" else variant.replace("iter", "iter_meals")
+        print(f"{label:<26} {int(count):>10,} {float(elapsed):>9.2f} "
+              f"{float(baseline):>13.1f} {float(peak):>10.1f}")
+
+    remove_db_files(DB_PATH)
+
+
+if __name__ == "__main__":
+    main()
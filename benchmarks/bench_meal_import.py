@@ -0,0 +1,113 @@
+"""
+Benchmark: streaming import of meal history from .csv and .xlsx
+
+Writes a spreadsheet in export_to_excel's layout, then imports it into a
+fresh database in a subprocess so the peak RSS reported belongs to the
+import alone.
+
+Usage:
+    python benchmarks/bench_meal_import.py [rows]
+"""
+import sys
+import os
+import csv
+import resource
+import subprocess
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from database import MealDatabase
+
+DB_PATH = "data/bench_import.db"
+FILE_ROOT = "data/bench_import"
+USERS = 200
+HEADERS = ["Phone Number", "Original Message", "Timestamp", "Meal Tag",
+           "Items Extracted", "Total Calories", "Total Protein", "Source"]
+
+
+def remove_db_files(db_path: str):
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+
+def rows(count: int):
+    base = datetime.now() - timedelta(days=365)
+    for i in range(count):
+        yield [
+            f"whatsapp:+1{i % USERS:010d}",
+            "Had 2 rotis and dal for lunch",
+            (base + timedelta(seconds=i * 30)).isoformat(),
+            "Lunch",
+            "2x roti, 1x dal",
+            246.0,
+            13.8,
+            "bench",
+        ]
+
+
+def write_files(count: int):
+    with open(FILE_ROOT + ".csv", "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADERS)
+        writer.writerows(rows(count))
+
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Meal Logs")
+    ws.append(HEADERS)
+    for row in rows(count):
+        ws.append(row)
+    wb.save(FILE_ROOT + ".xlsx")
+
+
+def peak_rss_mib() -> float:
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_import(path: str, chunk_size: int):
+    """Child process: import one file and report rows, seconds and memory"""
+    remove_db_files(DB_PATH)
+    db = MealDatabase(db_path=DB_PATH)
+    baseline = peak_rss_mib()
+    result = db.import_meals(path, chunk_size=chunk_size)
+    db.close()
+    print(f"{result['imported']} {result['elapsed_seconds']:.2f} {baseline:.1f} {peak_rss_mib():.1f}")
+
+
+def main():
+    if len(sys.argv) > 3 and sys.argv[1] == "--import":
+        run_import(sys.argv[2], int(sys.argv[3]))
+        return
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+
+    print("=" * 70)
+    print(f"📊 Writing {count:,} rows as .csv and .xlsx")
+    print("=" * 70)
+    start = time.perf_counter()
+    write_files(count)
+    print(f"Written in {time.perf_counter() - start:.1f}s\n")
+
+    print(f"{'file':<8} {'chunk':>6} {'meals':>10} {'seconds':>9} {'rows/s':>9} "
+          f"{'baseline MiB':>13} {'peak MiB':>10}")
+    for extension in (".csv", ".xlsx"):
+        for chunk_size in (1000, 5000):
+            result = subprocess.run(
+                [sys.executable, __file__, "--import", FILE_ROOT + extension, str(chunk_size)],
+                capture_output=True, text=True, check=True
+            )
+            imported, elapsed, baseline, peak = result.stdout.split()
+            print(f"{extension:<8} {chunk_size:>6} {int(imported):>10,} {float(elapsed):>9.2f} "
+                  f"{int(imported) / float(elapsed):>9,.0f} {float(baseline):>13.1f} {float(peak):>10.1f}")
+
+    remove_db_files(DB_PATH)
+    for extension in (".csv", ".xlsx"):
+        os.remove(FILE_ROOT + extension)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark: multi-process write/read contention per storage profile
+
+Mimics gunicorn workers sharing one database file: writer processes call
+log_meal while reader processes alternate get_daily_summary with a full
+get_all_meals scan (the read pattern of export_to_excel).
+
+Usage:
+    python benchmarks/bench_storage_profiles.py [seconds] [writers] [readers]
+"""
+import sys
+import os
+import sqlite3
+import time
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from database import MealDatabase
+from storage_profiles import STORAGE_PROFILES
+
+DB_PATH = "data/bench_profiles.db"
+SEED_MEALS = 5000
+
+
+def remove_db_files(db_path: str):
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+
+def writer(profile: str, seconds: float, worker_id: int, results):
+    db = MealDatabase(db_path=DB_PATH, storage_profile=profile)
+    phone = f"whatsapp:+1000000{worker_id:04d}"
+    ops = errors = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        try:
+            db.log_meal(phone, "bench meal", 300.0, 15.0, '[]', 'bench', source="bench")
+            ops += 1
+        except sqlite3.OperationalError:
+            errors += 1
+    db.close()
+    results.put(('write', ops, errors))
+
+
+def reader(profile: str, seconds: float, worker_id: int, results):
+    db = MealDatabase(db_path=DB_PATH, storage_profile=profile)
+    phone = f"whatsapp:+1000000{worker_id:04d}"
+    ops = errors = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        try:
+            db.get_daily_summary(phone)
+            if ops % 20 == 0:
+                db.get_all_meals()
+            ops += 1
+        except sqlite3.OperationalError:
+            errors += 1
+    db.close()
+    results.put(('read', ops, errors))
+
+
+def run_profile(profile: str, seconds: float, writers: int, readers: int) -> dict:
+    remove_db_files(DB_PATH)
+    db = MealDatabase(db_path=DB_PATH, storage_profile=profile)
+    for i in range(SEED_MEALS):
+        db.log_meal(f"whatsapp:+1000000{i % 50:04d}", "seed meal", 300.0, 15.0, '[]', 'seed', source="bench")
+    db.close()
+
+    results = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=writer, args=(profile, seconds, i, results)) for i in range(writers)]
+    procs += [multiprocessing.Process(target=reader, args=(profile, seconds, i, results)) for i in range(readers)]
+    for p in procs:
+        p.start()
+
+    totals = {'write': [0, 0], 'read': [0, 0]}
+    for _ in procs:
+        kind, ops, errors = results.get()
+        totals[kind][0] += ops
+        totals[kind][1] += errors
+    for p in procs:
+        p.join()
+
+    remove_db_files(DB_PATH)
+    return totals
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    writers = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    readers = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+
+    print("=" * 70)
+    print(f"📊 {writers} writer / {readers} reader processes, {seconds:.0f}s per profile")
+    print("=" * 70)
+    print(f"{'Profile':<12} {'writes/s':>10} {'reads/s':>10} {'locked errors':>15}")
+
+    for profile in STORAGE_PROFILES:
+        totals = run_profile(profile, seconds, writers, readers)
+        writes, write_errors = totals['write']
+        reads, read_errors = totals['read']
+        print(f"{profile:<12} {writes / seconds:>10.0f} {reads / seconds:>10.0f} "
+              f"{write_errors + read_errors:>15}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Benchmark: `total` (get_daily_summary) latency as the meals table grows
+
+Fills the table with meals from many users spread over a year, then times
+get_daily_summary for one user at each size. With the
+(phone_number, timestamp) index the latency should stay flat.
+
+Usage:
+    python benchmarks/bench_summary_scaling.py [max_rows]
+"""
+import sys
+import os
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from database import MealDatabase
+
+DB_PATH = "data/bench_scaling.db"
+PHONE = "whatsapp:+10000000000"
+USERS = 500
+
+
+def remove_db_files(db_path: str):
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+
+def fill(db: MealDatabase, start_row: int, end_row: int):
+    """Insert synthetic meals directly (setup only, not part of the timing)"""
+    base = datetime.now() - timedelta(days=365)
+    with db.connection() as conn:
+        conn.executemany('''
+            INSERT INTO meals (phone_number, meal_description, timestamp, total_calories,
+                             total_protein, parsed_items, items_extracted, source, meal_tag)
+            VALUES (?, 'bench meal', ?, 300.0, 15.0, '[]', 'bench', 'bench', 'lunch')
+        ''', (
+            (f"whatsapp:+1{i % USERS:010d}", (base + timedelta(minutes=i % 525600)).isoformat())
+            for i in range(start_row, end_row)
+        ))
+
+
+def time_total(db: MealDatabase, repeats: int = 200) -> float:
+    """Average milliseconds per get_daily_summary call"""
+    start = time.perf_counter()
+    for _ in range(repeats):
+        db.get_daily_summary(PHONE)
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+def main():
+    max_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    sizes = [n for n in (10_000, 100_000, 1_000_000, 10_000_000) if n <= max_rows]
+
+    remove_db_files(DB_PATH)
+    db = MealDatabase(db_path=DB_PATH)
+
+    print("=" * 70)
+    print("📊 get_daily_summary latency vs table size")
+    print("=" * 70)
+
+    filled = 0
+    for size in sizes:
+        fill(db, filled, size)
+        filled = size
+        print(f"{size:>12,} rows: {time_total(db):8.3f} ms per total")
+
+    db.close()
+    remove_db_files(DB_PATH)
+
+
+if __name__ == "__main__":
+    main()
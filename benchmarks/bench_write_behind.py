@@ -0,0 +1,98 @@
+"""
+Benchmark: synchronous log_meal vs write-behind group commit
+
+Webhook-style load: several threads each log meals for their own users as
+fast as they can, and every 10th call reads the user's total straight after
+logging (forcing a read-your-writes flush). Reports meals/s and the latency
+a request spends in log_meal.
+
+Usage:
+    python benchmarks/bench_write_behind.py [seconds] [threads]
+"""
+import sys
+import os
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from database import MealDatabase
+from write_behind import WriteBehindMealDatabase
+
+DB_PATH = "data/bench_write_behind.db"
+
+
+def remove_db_files(db_path: str):
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run(db, seconds: float, threads: int):
+    latencies = [[] for _ in range(threads)]
+    reads = [0] * threads
+    deadline = time.perf_counter() + seconds
+
+    def worker(worker_id: int):
+        phone = f"whatsapp:+1000000{worker_id:04d}"
+        calls = 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            db.log_meal(phone, "bench meal", 300.0, 15.0, '[]', 'bench', source="bench")
+            latencies[worker_id].append(time.perf_counter() - start)
+            calls += 1
+            if calls % 10 == 0:
+                db.get_daily_summary(phone)
+                reads[worker_id] += 1
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    if isinstance(db, WriteBehindMealDatabase):
+        db.flush()
+    elapsed = time.perf_counter() - started
+
+    all_latencies = [value for per_thread in latencies for value in per_thread]
+    return len(all_latencies) / elapsed, all_latencies
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+    print("=" * 70)
+    print(f"📊 log_meal throughput: {threads} threads, {seconds:.0f}s per run")
+    print("=" * 70)
+    print(f"{'profile':<12} {'mode':<26} {'meals/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+
+    for profile in ("concurrent", "durable"):
+        for mode in ("sync", "write-behind 5ms", "write-behind 20ms"):
+            remove_db_files(DB_PATH)
+            db = MealDatabase(db_path=DB_PATH, storage_profile=profile, max_connections=threads + 1)
+            if mode != "sync":
+                interval = float(mode.split()[1].rstrip("ms")) / 1000
+                db = WriteBehindMealDatabase(db, flush_interval=interval)
+
+            rate, latencies = run(db, seconds, threads)
+            extra = ""
+            if isinstance(db, WriteBehindMealDatabase):
+                stats = db.stats()
+                extra = f"  ({stats['meals_written'] / max(1, stats['batches']):.0f} meals/commit)"
+            db.close()
+
+            print(f"{profile:<12} {mode:<26} {rate:>9,.0f} "
+                  f"{percentile(latencies, 50) * 1000:>8.2f} {percentile(latencies, 99) * 1000:>8.2f}{extra}")
+
+    remove_db_files(DB_PATH)
+
+
+if __name__ == "__main__":
+    main()
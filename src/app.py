@@ -1,11 +1,16 @@
 """Main Flask application with Twilio WhatsApp integration"""
+import hmac
 import os
 from flask import Flask, request
 from twilio.twiml.messaging_response import MessagingResponse
 from twilio.rest import Client
 from dotenv import load_dotenv
 from food_parser import FoodParser
-from database import MealDatabase
+from sharding import open_meal_database
+from write_behind import WriteBehindMealDatabase
+from retention import RetentionWorker
+from maintenance import MaintenanceWorker, maintenance_history
+from backup import BackupWorker, backup_history
 import json
 
 # Load environment variables
@@ -17,7 +22,58 @@ app.config['SECRET_KEY'] = os.getenv('FLASK_SECRET_KEY', 'dev-secret-key-change-
 
 # Initialize components
 # Initialize database first (needed for custom foods)
-db = MealDatabase(db_path=os.getenv('DATABASE_PATH', '../data/user_meals.db'))
+# DATABASE_PROFILE picks the SQLite storage profile: concurrent (default), durable or legacy
+# DATABASE_SHARDS > 1 spreads users across that many files (custom foods stay in DATABASE_PATH)
+db_path = os.getenv('DATABASE_PATH', '../data/user_meals.db')
+db = open_meal_database(
+    db_path=db_path,
+    shards=int(os.getenv('DATABASE_SHARDS', '1')),
+    storage_profile=os.getenv('DATABASE_PROFILE', 'concurrent'),
+    # Calls slower than this are kept with their SQL and query plans (see /metrics)
+    slow_query_ms=float(os.getenv('DATABASE_SLOW_QUERY_MS', '100'))
+)
+
+# DATABASE_WRITE_BEHIND=true queues meals and group-commits them in the background
+if os.getenv('DATABASE_WRITE_BEHIND', 'false').lower() == 'true':
+    db = WriteBehindMealDatabase(
+        db,
+        flush_interval=float(os.getenv('DATABASE_FLUSH_INTERVAL_MS', '5')) / 1000,
+        max_batch=int(os.getenv('DATABASE_FLUSH_BATCH', '500'))
+    )
+
+# MEAL_RETENTION_DAYS moves older meals to the archive table in the background
+# (rollups and exports still include them)
+retention_worker = None
+if os.getenv('MEAL_RETENTION_DAYS'):
+    retention_worker = RetentionWorker(
+        db,
+        older_than_days=int(os.getenv('MEAL_RETENTION_DAYS')),
+        interval_seconds=float(os.getenv('MEAL_RETENTION_INTERVAL_HOURS', '6')) * 3600
+    ).start()
+
+# Routine SQLite maintenance (statistics, incremental vacuum, WAL checkpoint),
+# due one interval after the last recorded run and claimed by one worker at a time;
+# DATABASE_MAINTENANCE_INTERVAL_HOURS=0 turns it off
+maintenance_interval = float(os.getenv('DATABASE_MAINTENANCE_INTERVAL_HOURS', '24'))
+if maintenance_interval > 0:
+    MaintenanceWorker(
+        db,
+        interval_seconds=maintenance_interval * 3600,
+        time_budget=float(os.getenv('DATABASE_MAINTENANCE_BUDGET_SECONDS', '5'))
+    ).start()
+
+# Online backups with the SQLite backup API (writers keep going while it copies),
+# due one interval after the newest snapshot; snapshots go next to the database
+# unless DATABASE_BACKUP_DIR says otherwise.
+# DATABASE_BACKUP_INTERVAL_HOURS=0 (the default) turns it off
+backup_interval = float(os.getenv('DATABASE_BACKUP_INTERVAL_HOURS', '0'))
+if backup_interval > 0:
+    BackupWorker(
+        db,
+        backup_dir=os.getenv('DATABASE_BACKUP_DIR', os.path.join(os.path.dirname(db_path), 'backups')),
+        interval_seconds=backup_interval * 3600,
+        keep=int(os.getenv('DATABASE_BACKUP_KEEP', '7'))
+    ).start()
 
 # By default, uses FREE regex-based parsing (no API costs!)
 # Set USE_LLM=true in .env to enable LLM parsing (requires API key)
@@ -184,7 +240,46 @@ def format_weekly_breakdown(breakdown: dict) -> str:
         f"💪 Total Protein: {breakdown['total_protein']}g\n"
         f"🍽️ Total Meals: {breakdown['total_meals']}\n"
         f"📈 Daily Average: {breakdown['avg_daily_calories']} kcal | {breakdown['avg_daily_protein']}g\n"
-        f"📆 Active Days: {breakdown['days_with_meals']}/7"
+        f"📆 Active Days: {breakdown['days_with_meals']}/{breakdown['days']}"
+    )
+
+    return "\n".join(response_lines)
+
+
+def format_monthly_summary(summary: dict) -> str:
+    """Format the month-to-date totals as a WhatsApp message"""
+    return (
+        f"📅 *Monthly Total - {summary['label']}*\n\n"
+        f"🔥 Total Calories: {summary['total_calories']} kcal\n"
+        f"💪 Total Protein: {summary['total_protein']}g\n"
+        f"🍽️ Total Meals: {summary['meal_count']}\n"
+        f"📈 Daily Average: {summary['avg_daily_calories']} kcal | {summary['avg_daily_protein']}g\n"
+        f"📆 Active Days: {summary['days_with_meals']}/{summary['days']}"
+    )
+
+
+def format_yearly_summary(summary: dict) -> str:
+    """Format the year's totals and per-month trend as a WhatsApp message"""
+    response_lines = [
+        f"📅 *Yearly Total - {summary['year']}*\n"
+    ]
+
+    for month in summary['months']:
+        if month['meal_count'] == 0:
+            response_lines.append(f"⚪ *{month['label']}* -")
+        else:
+            response_lines.append(
+                f"🟢 *{month['label']}* 🔥 {month['avg_daily_calories']} kcal/day | "
+                f"💪 {month['avg_daily_protein']}g/day | 📆 {month['days_with_meals']} days"
+            )
+
+    response_lines.append(
+        f"\n📊 *Year Summary:*\n"
+        f"🔥 Total Calories: {summary['total_calories']} kcal\n"
+        f"💪 Total Protein: {summary['total_protein']}g\n"
+        f"🍽️ Total Meals: {summary['meal_count']}\n"
+        f"📈 Daily Average: {summary['avg_daily_calories']} kcal | {summary['avg_daily_protein']}g\n"
+        f"📆 Active Days: {summary['days_with_meals']}/{summary['days']}"
     )
 
     return "\n".join(response_lines)
@@ -224,6 +319,8 @@ Just message what you ate naturally:
 *📊 VIEW STATS*
 • *total* - Today's calories & protein summary
 • *total week* - 7-day breakdown with daily stats
+• *total month* - This month's totals and daily average
+• *total year* - This year's totals with a month-by-month trend
 • *summary* or *stats* - Detailed today's stats with recent meals
 
 *➕ ADD CUSTOM FOOD*
@@ -272,6 +369,9 @@ def whatsapp_webhook():
             msg.body("Please send me a message about what you ate!")
             return str(resp)
 
+        # Pick up custom foods added or deleted through other workers
+        food_parser.sync_custom_foods()
+
         # Handle greeting messages (hi, hello, good morning, etc.)
         greeting_triggers = ['hi', 'hello', 'hey', 'good morning', 'good afternoon', 'good evening', 'start']
         if incoming_msg.lower() in greeting_triggers or incoming_msg.lower().startswith(tuple(greeting_triggers)):
@@ -347,6 +447,17 @@ def whatsapp_webhook():
             msg.body(response_text)
             return str(resp)
 
+        # Check if it's a total month / total year request (read from the monthly and yearly rollups)
+        if 'total month' in incoming_msg.lower() or 'month total' in incoming_msg.lower() or 'monthly' in incoming_msg.lower():
+            monthly_summary = db.get_monthly_summary(sender)
+            msg.body(format_monthly_summary(monthly_summary))
+            return str(resp)
+
+        if 'total year' in incoming_msg.lower() or 'year total' in incoming_msg.lower() or 'yearly' in incoming_msg.lower():
+            yearly_summary = db.get_yearly_summary(sender)
+            msg.body(format_yearly_summary(yearly_summary))
+            return str(resp)
+
         # Check if it's a total request (quick format)
         if incoming_msg.lower().strip() == 'total':
             daily_summary = db.get_daily_summary(sender)
@@ -377,7 +488,8 @@ def whatsapp_webhook():
                 total_protein=result['total_protein'],
                 parsed_items=json.dumps(result['parsed_items']),
                 items_extracted=items_extracted,
-                source="whatsapp"
+                source="whatsapp",
+                items=result['items']
             )
             
             # Format and send response
@@ -396,7 +508,8 @@ def whatsapp_webhook():
                 total_protein=result['total_protein'],
                 parsed_items=json.dumps(result['parsed_items']),
                 items_extracted=items_extracted,
-                source="whatsapp"
+                source="whatsapp",
+                items=result['items']
             )
             
             # Format response with warning
@@ -441,19 +554,58 @@ def health_check():
     try:
         db.get_daily_summary("health_check", datetime.datetime.now())
         db_status = "connected"
+        storage = db.get_storage_settings()
+        maintenance = maintenance_history(db)
+        backup = backup_history(db)
     except Exception as e:
         db_status = f"error: {str(e)}"
+        storage = None
+        maintenance = None
+        backup = None
 
     return {
         "status": "healthy",
         "message": "WhatsApp Calorie Tracker is running",
         "timestamp": datetime.datetime.now().isoformat(),
         "database": db_status,
+        "storage": storage,
+        "retention": retention_worker.last_run if retention_worker else None,
+        "maintenance": maintenance,
+        "backup": backup,
         "parser_mode": "LLM-powered" if use_llm else "FREE regex-based",
         "uptime": "ready"
     }, 200
 
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Database method latency histograms and recent slow calls (this worker only).
+
+    Off unless METRICS_TOKEN is set; callers send it as "Authorization: Bearer <token>".
+    Slow calls are listed without their bound parameters, which hold user data.
+    """
+    token = os.getenv('METRICS_TOKEN')
+    if not token:
+        return {"error": "not found"}, 404
+    supplied = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(supplied.encode(), f"Bearer {token}".encode()):
+        return {"error": "unauthorized"}, 401
+
+    limit = max(0, request.args.get('limit', 20, type=int))
+    slow_queries = []
+    for entry in db.get_slow_queries(limit=limit) if limit else []:
+        statements = [{key: value for key, value in statement.items() if key != 'parameters'}
+                      for statement in entry['statements']]
+        slow_queries.append(dict(entry, statements=statements))
+
+    return {
+        "pid": os.getpid(),
+        "methods": db.get_query_stats(),
+        "slow_queries": slow_queries
+    }, 200
+
+
 @app.route('/ping', methods=['GET'])
 def ping():
     """Simple ping endpoint for keep-alive services"""
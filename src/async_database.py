@@ -0,0 +1,126 @@
+"""Asyncio facade over MealDatabase"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import AsyncIterator, Dict, Optional
+
+from database import MealDatabase
+from storage_profiles import DEFAULT_STORAGE_PROFILE
+
+
+# MealDatabase methods exposed as coroutines with unchanged arguments and results
+_BLOCKING_METHODS = (
+    'init_database',
+    'get_schema_version',
+    'get_storage_settings',
+    'add_user',
+    'log_meal',
+    'log_meals',
+    'get_range_summary',
+    'get_daily_summary',
+    'get_recent_meals',
+    'get_meal_history',
+    'delete_last_meal',
+    'get_weekly_summary',
+    'get_weekly_breakdown',
+    'get_daily_breakdown',
+    'get_monthly_summary',
+    'get_yearly_summary',
+    'get_food_totals',
+    'export_to_excel',
+    'import_meals',
+    'get_all_meals',
+    'add_custom_food',
+    'get_all_custom_foods',
+    'get_custom_food_changes',
+    'delete_custom_food',
+    'rebuild_daily_totals',
+    'verify_daily_totals',
+    'get_query_stats',
+    'get_slow_queries',
+    'reset_query_stats',
+)
+
+
+class AsyncMealDatabase:
+    """
+    Awaitable MealDatabase for asyncio code.
+
+    Every call runs on a dedicated, bounded thread pool, so SQLite I/O never
+    blocks the event loop. The facade owns its MealDatabase and connection
+    pool; it doesn't borrow the connections of a sync MealDatabase opened on
+    the same file.
+
+    Usage:
+        async with AsyncMealDatabase("data/user_meals.db") as db:
+            summary = await db.get_daily_summary(phone_number)
+    """
+
+    def __init__(self, db_path: str = "data/user_meals.db", max_workers: int = 4,
+                 storage_profile: str = DEFAULT_STORAGE_PROFILE, **kwargs):
+        """
+        Args:
+            db_path: Path to the SQLite database file
+            max_workers: Threads running database calls; at most this many run at once
+            storage_profile: Storage profile passed to MealDatabase
+            **kwargs: Other MealDatabase options (e.g. known_users_cache_size)
+        """
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="meal-db")
+        # A worker thread holds one connection per call; the spare half serves
+        # iter_meals streams, which keep their own connection between chunks
+        self.db = MealDatabase(db_path=db_path, max_connections=max_workers * 2,
+                               storage_profile=storage_profile, **kwargs)
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def iter_meals(self, phone_number: Optional[str] = None, limit: Optional[int] = None,
+                         start=None, end=None, chunk_size: int = 500) -> AsyncIterator[Dict]:
+        """Async counterpart of MealDatabase.iter_meals; each chunk is fetched off the loop"""
+        rows = self.db.iter_meals(phone_number=phone_number, limit=limit,
+                                  start=start, end=end, chunk_size=chunk_size)
+        try:
+            while True:
+                chunk = await self._run(lambda: list(islice(rows, chunk_size)))
+                if not chunk:
+                    break
+                for meal in chunk:
+                    yield meal
+        finally:
+            # Hand the stream's connection back even if the caller stops early
+            await self._run(rows.close)
+
+    def close(self):
+        """Wait for running calls to finish, then close the connection pool"""
+        self._executor.shutdown(wait=True)
+        self.db.close()
+
+    async def aclose(self):
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+
+def _make_async(name: str):
+    method = getattr(MealDatabase, name)
+
+    @functools.wraps(method)
+    async def call(self, *args, **kwargs):
+        return await self._run(getattr(self.db, name), *args, **kwargs)
+
+    return call
+
+
+for _name in _BLOCKING_METHODS:
+    setattr(AsyncMealDatabase, _name, _make_async(_name))
@@ -0,0 +1,394 @@
+"""
+Online backups with the SQLite backup API, taken while the app keeps writing.
+
+Pages are copied a few at a time with a pause between steps. In WAL mode the
+copy reads from one held snapshot, so writers never wait on it and it never
+restarts. In rollback-journal mode each step holds the read lock only
+briefly instead. The newest `keep` snapshots of each file are kept. Every
+run is recorded in the backup_runs table of the file it copied.
+
+Run once from the command line:
+    python src/backup.py data/user_meals.db --dir data/backups --keep 7
+
+In the app it runs every DATABASE_BACKUP_INTERVAL_HOURS (default 0 = off),
+counted from the newest snapshot so restarts don't push it back, into
+DATABASE_BACKUP_DIR (default: a backups directory next to the database).
+The latest run is shown on /health.
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from database import MealDatabase
+from maintenance import _database_files, claim_scheduled_run, last_claimed_at
+from sharding import open_meal_database
+from storage_profiles import DEFAULT_STORAGE_PROFILE
+from write_behind import WriteBehindMealDatabase
+
+# Rows kept in backup_runs per file
+HISTORY_LIMIT = 200
+
+# Rollback-journal mode only: restarts tolerated before copying in one step
+MAX_RESTARTS = 3
+
+TIMESTAMP_FORMAT = '%Y%m%d-%H%M%S-%f'
+
+# db_meta key: wall-clock time (seconds) of the last claimed scheduled backup
+_CLAIM_KEY = 'backup_claimed_at'
+
+
+class _TooManyRestarts(Exception):
+    """Raised from the progress callback to abandon a paced copy"""
+
+
+def _backup_name(db_path: str, started: datetime) -> str:
+    root, ext = os.path.splitext(os.path.basename(db_path))
+    return f"{root}-{started.strftime(TIMESTAMP_FORMAT)}{ext or '.db'}"
+
+
+def _backup_started(backup_path: str) -> datetime:
+    """Start time encoded in a snapshot name by _backup_name"""
+    stem = os.path.splitext(os.path.basename(backup_path))[0]
+    return datetime.strptime('-'.join(stem.rsplit('-', 3)[1:]), TIMESTAMP_FORMAT)
+
+
+def list_backups(db_path: str, backup_dir: str) -> List[str]:
+    """Snapshots of db_path in backup_dir, oldest first"""
+    root, ext = os.path.splitext(os.path.basename(db_path))
+    pattern = re.compile(rf'^{re.escape(root)}-\d{{8}}-\d{{6}}-\d{{6}}{re.escape(ext or ".db")}$')
+    if not os.path.isdir(backup_dir):
+        return []
+    return [os.path.join(backup_dir, name)
+            for name in sorted(os.listdir(backup_dir)) if pattern.match(name)]
+
+
+def _rotate(db_path: str, backup_dir: str, keep: int) -> int:
+    """Delete all but the newest `keep` snapshots; returns how many were removed"""
+    stale = list_backups(db_path, backup_dir)[:-keep] if keep > 0 else []
+    removed = 0
+    for path in stale:
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass  # another process rotated it first
+    return removed
+
+
+def backup_file(db: MealDatabase, backup_dir: str, keep: int = 7, pages: int = 64,
+                step_sleep: float = 0.01, verify: bool = True) -> Dict:
+    """
+    Copy one database file into backup_dir with Connection.backup.
+
+    Args:
+        db: The MealDatabase to copy
+        backup_dir: Directory for the snapshots (created if missing)
+        keep: Snapshots of this file to keep, newest first (0 keeps all)
+        pages: Pages copied per step
+        step_sleep: Seconds to pause between steps
+        verify: Run PRAGMA quick_check on the copy before keeping it
+
+    The copy is written to a .partial file and renamed once complete, so a
+    crash mid-backup never leaves a torn snapshot behind.
+    """
+    if pages < 1:
+        raise ValueError("pages must be at least 1")
+
+    os.makedirs(backup_dir, exist_ok=True)
+    started_at = datetime.now()
+    started = time.perf_counter()
+    backup_path = os.path.join(backup_dir, _backup_name(db.db_path, started_at))
+    partial_path = backup_path + '.partial'
+    progress = {'steps': 0, 'restarts': 0, 'pages': 0, 'remaining': None}
+    integrity = None
+    removed = 0
+    error = None
+
+    def paced(status, remaining, total):
+        if progress['remaining'] is not None and remaining > progress['remaining']:
+            # The source changed under a copy without a held snapshot
+            progress['restarts'] += 1
+            if progress['restarts'] > MAX_RESTARTS:
+                raise _TooManyRestarts()
+        progress['steps'] += 1
+        progress['pages'] = total
+        progress['remaining'] = remaining
+        if remaining:
+            time.sleep(step_sleep)
+
+    try:
+        # Unshared checkout: the read transaction below must not leak into
+        # anything else this thread does
+        with db.read_pool.connection(shared=False) as source:
+            snapshot = source.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+            if snapshot:
+                # A read transaction pins one WAL snapshot for the whole copy
+                source.execute('BEGIN')
+                source.execute('SELECT 1 FROM sqlite_master LIMIT 1').fetchone()
+
+            target = sqlite3.connect(partial_path)
+            try:
+                try:
+                    source.backup(target, pages=pages, progress=paced)
+                except _TooManyRestarts:
+                    # Writers keep changing the file; copy it under one short read lock
+                    source.backup(target, pages=-1)
+                    progress['steps'] += 1
+            finally:
+                target.close()
+
+        if verify:
+            check = sqlite3.connect(partial_path)
+            try:
+                integrity = check.execute('PRAGMA quick_check').fetchone()[0]
+            finally:
+                check.close()
+            if integrity != 'ok':
+                raise sqlite3.DatabaseError(f"quick_check failed on the copy: {integrity}")
+
+        os.replace(partial_path, backup_path)
+    except (OSError, sqlite3.Error) as e:
+        error = str(e)
+        backup_path = None
+        for suffix in ('', '-wal', '-shm', '-journal'):
+            if os.path.exists(partial_path + suffix):
+                os.remove(partial_path + suffix)
+
+    # The snapshot is complete; a rotation problem doesn't make it a failed backup
+    if backup_path:
+        try:
+            removed = _rotate(db.db_path, backup_dir, keep)
+        except OSError as e:
+            print(f"⚠️ Couldn't rotate old backups in {backup_dir}: {e}")
+
+    elapsed = round(time.perf_counter() - started, 3)
+    size = os.path.getsize(backup_path) if backup_path else None
+
+    with db.connection() as conn:
+        conn.execute('''
+            INSERT INTO backup_runs
+                (started_at, elapsed_seconds, backup_path, bytes, pages, steps, restarts,
+                 removed, integrity, error)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (started_at.isoformat(), elapsed, backup_path, size, progress['pages'],
+              progress['steps'], progress['restarts'], removed, integrity, error))
+        conn.execute('DELETE FROM backup_runs WHERE id <= (SELECT MAX(id) FROM backup_runs) - ?',
+                     (HISTORY_LIMIT,))
+
+    return {
+        'db_path': db.db_path,
+        'started_at': started_at.isoformat(),
+        'elapsed_seconds': elapsed,
+        'backup_path': backup_path,
+        'bytes': size,
+        'pages': progress['pages'],
+        'steps': progress['steps'],
+        'restarts': progress['restarts'],
+        'removed': removed,
+        'integrity': integrity,
+        'error': error
+    }
+
+
+def run_backup(db, backup_dir: str = 'data/backups', keep: int = 7, pages: int = 64,
+               step_sleep: float = 0.01, verify: bool = True) -> Dict:
+    """
+    Back up every file behind db (catalogue and shards when sharded).
+
+    Args:
+        db: MealDatabase, ShardedMealDatabase or WriteBehindMealDatabase
+        backup_dir: Directory for the snapshots
+        keep: Snapshots kept per file
+        pages: Pages copied per step
+        step_sleep: Seconds to pause between steps
+        verify: Run PRAGMA quick_check on each copy
+
+    Each file is a consistent snapshot on its own; shards are copied one
+    after another, not at a single instant.
+
+    Returns:
+        Dictionary with total elapsed time, total bytes and one result per file
+    """
+    started = time.perf_counter()
+    if isinstance(db, WriteBehindMealDatabase):
+        # Queued meals aren't in the file yet
+        db.flush()
+    files = [backup_file(file_db, backup_dir, keep, pages, step_sleep, verify)
+             for file_db in _database_files(db)]
+    return {
+        'elapsed_seconds': round(time.perf_counter() - started, 3),
+        'backup_dir': backup_dir,
+        'bytes': sum(run['bytes'] or 0 for run in files),
+        'files': files
+    }
+
+
+def backup_history(db, limit: int = 1) -> List[Dict]:
+    """Most recent recorded backups, newest first, for every file behind db"""
+    runs = []
+    for file_db in _database_files(db):
+        with file_db.read_connection() as conn:
+            rows = conn.execute('''
+                SELECT started_at, elapsed_seconds, backup_path, bytes, pages, steps, restarts,
+                       removed, integrity, error
+                FROM backup_runs
+                ORDER BY id DESC
+                LIMIT ?
+            ''', (limit,)).fetchall()
+
+        for row in rows:
+            runs.append({
+                'db_path': file_db.db_path,
+                'started_at': row[0],
+                'elapsed_seconds': row[1],
+                'backup_path': row[2],
+                'bytes': row[3],
+                'pages': row[4],
+                'steps': row[5],
+                'restarts': row[6],
+                'removed': row[7],
+                'integrity': row[8],
+                'error': row[9]
+            })
+    return runs
+
+
+def claim_backup(db, min_interval_seconds: float) -> bool:
+    """
+    Claim the next scheduled backup of db for this process.
+
+    Of several processes asking at once exactly one gets True; later callers
+    get False until min_interval_seconds have passed (see claim_scheduled_run).
+    """
+    return claim_scheduled_run(db, _CLAIM_KEY, min_interval_seconds)
+
+
+def next_backup_due(db, backup_dir: str, interval_seconds: float) -> float:
+    """
+    Wall-clock time (seconds) the next scheduled backup of db is due.
+
+    One interval after the later of the newest snapshot in backup_dir
+    (manual ones included) and the last claim; now if neither exists.
+    """
+    last = []
+    for file_db in _database_files(db):
+        snapshots = list_backups(file_db.db_path, backup_dir)
+        if snapshots:
+            last.append(_backup_started(snapshots[-1]).timestamp())
+    claimed = last_claimed_at(db, _CLAIM_KEY)
+    if claimed is not None:
+        last.append(claimed)
+    return max(last) + interval_seconds if last else time.time()
+
+
+class BackupWorker:
+    """
+    Background thread that runs run_backup on an interval.
+
+    The schedule follows the snapshots on disk (next_backup_due), so a
+    restart doesn't postpone the next backup. Safe to run in every gunicorn
+    worker at once: each run first takes the claim_backup claim, so only one
+    worker per interval copies the files.
+    """
+
+    def __init__(self, db, backup_dir: str = 'data/backups', interval_seconds: float = 24 * 3600,
+                 keep: int = 7, pages: int = 64, step_sleep: float = 0.01):
+        self.db = db
+        self.backup_dir = backup_dir
+        self.interval_seconds = interval_seconds
+        self.keep = keep
+        self.pages = pages
+        self.step_sleep = step_sleep
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self) -> Optional[Dict]:
+        """Back up now unless another worker claimed this interval; returns the run_backup result"""
+        if not claim_backup(self.db, self.interval_seconds / 2):
+            return None
+        return run_backup(self.db, self.backup_dir, keep=self.keep,
+                          pages=self.pages, step_sleep=self.step_sleep)
+
+    def seconds_until_due(self) -> float:
+        """Seconds until the next scheduled backup (0 if it is overdue)"""
+        return max(0.0, next_backup_due(self.db, self.backup_dir, self.interval_seconds) - time.time())
+
+    def _run(self):
+        while True:
+            try:
+                wait = self.seconds_until_due()
+            except Exception as e:
+                print(f"❌ Database backup schedule unavailable: {e}")
+                wait = self.interval_seconds
+            if self._stop.wait(wait):
+                return
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"❌ Database backup failed: {e}")
+
+    def start(self) -> 'BackupWorker':
+        """Start the background thread"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="db-backup", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None):
+        """Ask the thread to stop after the current run"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Back up the meal database while it is in use")
+    parser.add_argument('db_path', help="Database file (catalogue path when sharded)")
+    parser.add_argument('--dir', default='data/backups', help="Backup directory (default: data/backups)")
+    parser.add_argument('--keep', type=int, default=7, help="Snapshots kept per file (default: 7, 0 = all)")
+    parser.add_argument('--pages', type=int, default=64, help="Pages copied per step (default: 64)")
+    parser.add_argument('--sleep', type=float, default=0.01,
+                        help="Seconds to pause between steps (default: 0.01)")
+    parser.add_argument('--no-verify', action='store_true', help="Skip PRAGMA quick_check on the copy")
+    parser.add_argument('--shards', type=int, default=1, help="Number of shard files (default: 1)")
+    parser.add_argument('--profile', default=DEFAULT_STORAGE_PROFILE, help="Storage profile")
+    parser.add_argument('--history', type=int, metavar='N',
+                        help="Print the last N recorded backups instead of running")
+    args = parser.parse_args(argv)
+
+    db = open_meal_database(args.db_path, shards=args.shards, storage_profile=args.profile)
+    try:
+        if args.history:
+            for run in backup_history(db, limit=args.history):
+                print(json.dumps(run))
+            return 0
+
+        result = run_backup(db, args.dir, keep=args.keep, pages=args.pages,
+                            step_sleep=args.sleep, verify=not args.no_verify)
+    finally:
+        db.close()
+
+    failed = False
+    for run in result['files']:
+        if run['error']:
+            failed = True
+            print(f"❌ {run['db_path']}: {run['error']}")
+            continue
+        print(f"✅ {run['db_path']} -> {run['backup_path']}: {run['bytes'] / 1024:,.0f} KiB, "
+              f"{run['pages']} pages in {run['steps']} steps, {run['elapsed_seconds']:.2f}s"
+              + (f", {run['restarts']} restarts" if run['restarts'] else '')
+              + (f", {run['removed']} old snapshots removed" if run['removed'] else ''))
+    print(f"Total {result['bytes'] / 1024:,.0f} KiB in {result['elapsed_seconds']:.2f}s")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,25 @@
 """Database handler for user meal tracking"""
 import sqlite3
+import calendar
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from typing import List, Dict, Iterable, Iterator, Optional, Set, Tuple
 import os
 import json
+import base64
+import binascii
+import threading
+import heapq
+from collections import OrderedDict
+from contextlib import closing
+from itertools import chain, islice
+
+from db_pool import ConnectionPool
+from migrations import migrate, get_schema_version
+from query_stats import QueryStats, TimedConnection, instrument
+from storage_profiles import (
+    DEFAULT_STORAGE_PROFILE, get_storage_profile, apply_journal_mode,
+    apply_connection_pragmas, read_storage_settings
+)
 
 
 def get_meal_tag(timestamp: datetime = None) -> str:
@@ -44,166 +60,665 @@ def get_meal_tag(timestamp: datetime = None) -> str:
         return "midnight_snack"
 
 
+def to_epoch(timestamp: datetime) -> int:
+    """
+    Convert a meal timestamp to integer seconds for the timestamp_epoch column.
+
+    Meals are logged in wall-clock time (that's what meal tags and days are
+    based on), so the wall-clock reading is counted as if it were UTC. That
+    keeps day bucketing pure arithmetic: day = timestamp_epoch // 86400.
+    """
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    return calendar.timegm(timestamp.timetuple())
+
+
+def from_epoch(seconds: int) -> datetime:
+    """Convert a timestamp_epoch value back to a naive wall-clock datetime"""
+    return datetime(1970, 1, 1) + timedelta(seconds=seconds)
+
+
+def _epoch_day(seconds: int) -> str:
+    """Return the 'YYYY-MM-DD' rollup day of a timestamp_epoch value"""
+    return from_epoch(seconds).strftime('%Y-%m-%d')
+
+
+_MEAL_INSERT_SQL = '''
+    INSERT INTO meals (phone_number, meal_description, timestamp, total_calories,
+                     total_protein, parsed_items, items_extracted, source, meal_tag,
+                     timestamp_epoch)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+_DAILY_TOTALS_UPSERT_SQL = '''
+    INSERT INTO daily_totals (phone_number, day, meal_count, calories, protein)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (phone_number, day) DO UPDATE SET
+        meal_count = meal_count + excluded.meal_count,
+        calories = calories + excluded.calories,
+        protein = protein + excluded.protein
+'''
+
+# Every column of meals, in the order meals_archive rows are written
+_MEAL_COLUMNS = (
+    'id, phone_number, meal_description, timestamp, total_calories, total_protein, '
+    'parsed_items, items_extracted, source, meal_tag, timestamp_epoch'
+)
+
+# Hot and cold meals together, for rebuilding and verifying rollups
+_ALL_MEALS_SQL = '''
+    (SELECT phone_number, timestamp_epoch, total_calories, total_protein FROM meals
+     UNION ALL
+     SELECT phone_number, timestamp_epoch, total_calories, total_protein FROM meals_archive)
+'''
+
+# db_meta key: every row in meals_archive has timestamp_epoch below this value
+_ARCHIVE_BOUNDARY_KEY = 'archive_boundary_epoch'
+
+_MEAL_ITEM_INSERT_SQL = '''
+    INSERT INTO meal_items (meal_id, phone_number, timestamp_epoch, food_name,
+                            quantity, calories, protein)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+def _meal_item_rows(parsed_items: str, items: Optional[List[Dict]],
+                    total_calories: float, total_protein: float) -> List[tuple]:
+    """
+    Normalize a meal's items to (food_name, quantity, calories, protein) rows.
+
+    `items` are FoodParser's matched items (name, quantity, calories, protein).
+    Without them the parsed_items JSON is used, which usually has no per-item
+    nutrition: a single-item meal gets the meal totals, otherwise they stay NULL.
+    Keep in step with the v8 backfill in migrations.py.
+    """
+    if items is None:
+        try:
+            items = json.loads(parsed_items) if parsed_items else []
+        except (TypeError, ValueError):
+            items = []
+        if not isinstance(items, list):
+            items = []
+
+    entries = [item for item in items
+               if isinstance(item, dict) and str(item.get('name') or item.get('food') or '').strip()]
+    single = len(entries) == 1
+
+    rows = []
+    for item in entries:
+        calories = item.get('calories')
+        protein = item.get('protein')
+        rows.append((
+            str(item.get('name') or item.get('food')).strip().lower(),
+            item.get('quantity') if item.get('quantity') is not None else 1,
+            calories if calories is not None else (total_calories if single else None),
+            protein if protein is not None else (total_protein if single else None),
+        ))
+    return rows
+
+
+def _meal_row(phone_number: str, meal_description: str,
+              total_calories: float, total_protein: float,
+              parsed_items: str, items_extracted: str = "",
+              source: str = "whatsapp", timestamp: datetime = None,
+              items: Optional[List[Dict]] = None) -> Tuple[tuple, List[tuple]]:
+    """
+    Build the meals INSERT parameters for one meal, tagging it by time of day,
+    plus its meal_items rows (see _meal_item_rows)
+    """
+    if timestamp is None:
+        timestamp = datetime.now()
+
+    # Handle string timestamps (same fallback as get_meal_tag)
+    if isinstance(timestamp, str):
+        try:
+            timestamp = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+        except ValueError:
+            timestamp = datetime.now()
+
+    # Determine meal tag based on timestamp
+    meal_tag = get_meal_tag(timestamp)
+
+    row = (phone_number, meal_description, timestamp.isoformat(), total_calories,
+           total_protein, parsed_items, items_extracted, source, meal_tag,
+           to_epoch(timestamp))
+    return row, _meal_item_rows(parsed_items, items, total_calories, total_protein)
+
+
+# Bucket key per granularity, computed from daily_totals.day: the bucket's first day
+_SUMMARY_BUCKETS = {
+    'day': 'day',
+    'week': "date(day, '-6 days', 'weekday 1')",  # Monday on or before the day
+    'month': "strftime('%Y-%m-01', day)",
+}
+
+
+def _as_day(value) -> datetime:
+    """Midnight of a datetime, date or ISO string"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return datetime(value.year, value.month, value.day)
+
+
+def _bucket_start(day: datetime, granularity: str) -> datetime:
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def _next_bucket(start: datetime, granularity: str) -> datetime:
+    if granularity == 'week':
+        return start + timedelta(days=7)
+    if granularity == 'month':
+        return (start + timedelta(days=32)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def _days_so_far(start: datetime, end: datetime) -> int:
+    """Days of [start, end) up to and including today"""
+    today = _as_day(datetime.now())
+    return max(0, (min(end, today + timedelta(days=1)) - start).days)
+
+
+def _summary_totals(meal_count: int, calories: float, protein: float,
+                    days_with_meals: int, days: int) -> Dict:
+    """Totals plus averages per day with meals (not per meal)"""
+    return {
+        'days': days,
+        'days_with_meals': days_with_meals,
+        'meal_count': meal_count,
+        'total_calories': round(calories, 1),
+        'total_protein': round(protein, 1),
+        'avg_daily_calories': round(calories / days_with_meals, 1) if days_with_meals else 0,
+        'avg_daily_protein': round(protein / days_with_meals, 1) if days_with_meals else 0,
+    }
+
+
+def _newest_first_key(row: tuple) -> tuple:
+    """
+    Merge key for (timestamp_epoch, id, ...) rows in newest-first order.
+
+    Legacy meals whose timestamp couldn't be parsed have a NULL epoch; SQLite
+    sorts those last in DESC order, so they rank below every dated meal here too.
+    """
+    return (row[0] if row[0] is not None else float('-inf'), row[1])
+
+
+def _encode_history_cursor(epoch: Optional[int], meal_id: int) -> str:
+    """Opaque page cursor: the (timestamp_epoch, id) of the last meal returned"""
+    epoch = '' if epoch is None else epoch
+    return base64.urlsafe_b64encode(f"{epoch}:{meal_id}".encode()).decode().rstrip('=')
+
+
+def _decode_history_cursor(cursor: str) -> Tuple[Optional[int], int]:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        epoch, meal_id = base64.urlsafe_b64decode(padded.encode()).decode().split(':')
+        return (int(epoch) if epoch else None), int(meal_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError(f"Invalid history cursor: {cursor!r}")
+
+
+class _KnownUserCache:
+    """Bounded, thread-safe LRU set of phone numbers already present in the users table"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, phone_number: str) -> bool:
+        with self._lock:
+            if phone_number in self._users:
+                self._users.move_to_end(phone_number)
+                return True
+            return False
+
+    def add(self, *phone_numbers: str):
+        with self._lock:
+            for phone_number in phone_numbers:
+                self._users[phone_number] = True
+                self._users.move_to_end(phone_number)
+            while len(self._users) > self.max_size:
+                self._users.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+
+@instrument(exclude=('connection', 'read_connection', 'close', 'get_query_stats',
+                     'get_slow_queries', 'reset_query_stats'))
 class MealDatabase:
-    def __init__(self, db_path: str = "data/user_meals.db"):
+    def __init__(self, db_path: str = "data/user_meals.db", max_connections: int = 8,
+                 storage_profile: str = DEFAULT_STORAGE_PROFILE, known_users_cache_size: int = 10000,
+                 slow_query_ms: Optional[float] = 100.0):
+        """
+        Args:
+            db_path: Path to the SQLite database file
+            max_connections: Size of the write pool and of the read-only pool
+                (one connection per active thread in each)
+            storage_profile: Name of a profile in storage_profiles.STORAGE_PROFILES
+            known_users_cache_size: How many existing users to remember so repeat
+                senders skip the users upsert
+            slow_query_ms: Method calls slower than this go into the slow-query
+                log with their SQL and query plans (None turns the log off)
+        """
         self.db_path = db_path
+        # Every public method is timed into these histograms (see query_stats.py)
+        self.query_stats = QueryStats(slow_query_ms=slow_query_ms)
+        self._known_users = _KnownUserCache(known_users_cache_size)
+        self.storage_profile = storage_profile
+        self._profile = get_storage_profile(storage_profile)
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.pool = ConnectionPool(
+            db_path,
+            max_connections=max_connections,
+            on_connect=lambda conn: apply_connection_pragmas(conn, self._profile),
+            factory=TimedConnection
+        )
         self.init_database()
-    
-    def init_database(self):
-        """Initialize the database with required tables"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        # Create users table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                phone_number TEXT PRIMARY KEY,
-                name TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
 
-        # Create meals table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS meals (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                phone_number TEXT,
-                meal_description TEXT,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                total_calories REAL,
-                total_protein REAL,
-                parsed_items TEXT,
-                items_extracted TEXT,
-                source TEXT DEFAULT 'whatsapp',
-                meal_tag TEXT,
-                FOREIGN KEY (phone_number) REFERENCES users(phone_number)
-            )
-        ''')
+        # Read methods use their own read-only connections, so a summary never
+        # waits for a pool slot held by a writer and can never take the write lock
+        self.read_pool = ConnectionPool(
+            db_path,
+            max_connections=max_connections,
+            on_connect=lambda conn: apply_connection_pragmas(conn, self._profile),
+            read_only=True,
+            factory=TimedConnection
+        )
+
+    def connection(self):
+        """
+        Check out a pooled connection for the calling thread.
 
-        # Add meal_tag column if it doesn't exist (for existing databases)
-        try:
-            cursor.execute('ALTER TABLE meals ADD COLUMN meal_tag TEXT')
-            conn.commit()
-        except sqlite3.OperationalError:
-            # Column already exists
-            pass
-
-        # Create custom_foods table for user-added foods
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS custom_foods (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT UNIQUE NOT NULL,
-                aliases TEXT,
-                calories REAL NOT NULL,
-                protein REAL NOT NULL,
-                serving_size TEXT NOT NULL,
-                category TEXT DEFAULT 'custom',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+        Commits when the outermost block exits cleanly, rolls back on error.
+        Nested calls on the same thread share one connection and transaction.
+        """
+        return self.pool.connection()
+
+    def read_connection(self):
+        """
+        Check out a read-only pooled connection (mode=ro, query_only).
+
+        In WAL mode it reads the last committed snapshot and never blocks
+        behind a writer. It does not see the calling thread's uncommitted
+        writes, so read inside connection() when that matters.
+        """
+        return self.read_pool.connection()
+
+    def close(self):
+        """Close all pooled connections"""
+        self.read_pool.close()
+        self.pool.close()
+
+    def get_query_stats(self) -> Dict[str, Dict]:
+        """
+        Latency histogram of every method called so far, slowest total time first.
+
+        Returns:
+            Dictionary of method name -> count, total/mean/max, p50/p95/p99
+            (bucket upper bounds) in milliseconds, and bucket counts
+        """
+        return self.query_stats.snapshot()
+
+    def get_slow_queries(self, limit: Optional[int] = None) -> List[Dict]:
+        """
+        Calls slower than slow_query_ms, newest first.
+
+        Each entry has the method, its elapsed time and its slowest
+        statements with SQL, parameters and EXPLAIN QUERY PLAN lines.
+        """
+        return self.query_stats.slow_queries(limit)
+
+    def reset_query_stats(self):
+        """Clear the histograms and the slow-query log"""
+        self.query_stats.reset()
+
+    def init_database(self):
+        """Initialize the database, applying any pending schema migrations"""
+        with self.connection() as conn:
+            if conn.execute('PRAGMA page_count').fetchone()[0] == 0:
+                # Only possible before the first table exists: lets the
+                # maintenance job hand freed pages back with incremental_vacuum
+                conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            apply_journal_mode(conn, self._profile)
+            migrate(conn)
+
+    def get_schema_version(self) -> int:
+        """Return the schema version (PRAGMA user_version) of the database"""
+        with self.read_connection() as conn:
+            return get_schema_version(conn)
+
+    def get_storage_settings(self) -> Dict:
+        """Report the storage profile and the SQLite settings actually in effect"""
+        with self.read_connection() as conn:
+            settings = read_storage_settings(conn)
+        settings['profile'] = self.storage_profile
+        return settings
+
+    def _bump_daily_totals(self, conn: sqlite3.Connection, phone_number: str, day: str,
+                           meal_count: int, calories: float, protein: float):
+        """Add (or with negative values, subtract) meals to a user's daily rollup row"""
+        conn.execute(_DAILY_TOTALS_UPSERT_SQL,
+                     (phone_number, day, meal_count, calories or 0, protein or 0))
+
+        if meal_count < 0:
+            conn.execute('''
+                DELETE FROM daily_totals
+                WHERE phone_number = ? AND day = ? AND meal_count <= 0
+            ''', (phone_number, day))
+
+        self._refresh_period_totals(conn, [(phone_number, day)])
+
+    def _refresh_period_totals(self, conn: sqlite3.Connection, keys: Iterable[Tuple[str, str]]):
+        """
+        Re-derive the monthly and yearly rollup rows covering some (phone_number, day) keys
+
+        Each month is recomputed from at most 31 daily_totals rows and each
+        year from at most 12 monthly_totals rows, so the cost per write is
+        constant and the coarser rollups can't drift from the daily ones.
+        """
+        months = {(phone_number, day[:7]) for phone_number, day in keys}
+        for phone_number, month in months:
+            year, month_number = int(month[:4]), int(month[5:7])
+            next_month = f"{year + month_number // 12:04d}-{month_number % 12 + 1:02d}"
+            conn.execute('DELETE FROM monthly_totals WHERE phone_number = ? AND month = ?',
+                         (phone_number, month))
+            conn.execute('''
+                INSERT INTO monthly_totals
+                    (phone_number, month, meal_count, days_with_meals, calories, protein)
+                SELECT phone_number, ?, SUM(meal_count), COUNT(*), SUM(calories), SUM(protein)
+                FROM daily_totals
+                WHERE phone_number = ? AND day >= ? AND day < ?
+                GROUP BY phone_number
+            ''', (month, phone_number, f"{month}-01", f"{next_month}-01"))
+
+        for phone_number, year in {(phone_number, month[:4]) for phone_number, month in months}:
+            conn.execute('DELETE FROM yearly_totals WHERE phone_number = ? AND year = ?',
+                         (phone_number, year))
+            conn.execute('''
+                INSERT INTO yearly_totals
+                    (phone_number, year, meal_count, days_with_meals, calories, protein)
+                SELECT phone_number, ?, SUM(meal_count), SUM(days_with_meals),
+                       SUM(calories), SUM(protein)
+                FROM monthly_totals
+                WHERE phone_number = ? AND month >= ? AND month < ?
+                GROUP BY phone_number
+            ''', (year, phone_number, f"{year}-01", f"{int(year) + 1:04d}-01"))
 
-        conn.commit()
-        conn.close()
-    
     def add_user(self, phone_number: str, name: Optional[str] = None):
         """Add a new user to the database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT OR IGNORE INTO users (phone_number, name)
-            VALUES (?, ?)
-        ''', (phone_number, name))
-        
-        conn.commit()
-        conn.close()
+        if phone_number in self._known_users:
+            return
+
+        with self.connection() as conn:
+            conn.execute('''
+                INSERT OR IGNORE INTO users (phone_number, name)
+                VALUES (?, ?)
+            ''', (phone_number, name))
+
+        self._known_users.add(phone_number)
     
     def log_meal(self, phone_number: str, meal_description: str,
                  total_calories: float, total_protein: float,
                  parsed_items: str, items_extracted: str = "",
-                 source: str = "whatsapp", timestamp: datetime = None):
-        """Log a meal for a user"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+                 source: str = "whatsapp", timestamp: datetime = None,
+                 items: Optional[List[Dict]] = None):
+        """
+        Log a meal for a user
 
-        # Ensure user exists
-        self.add_user(phone_number)
+        `items` are the matched food items (name, quantity, calories, protein)
+        stored in meal_items; without them items come from parsed_items.
+        """
+        row, item_rows = _meal_row(phone_number, meal_description, total_calories, total_protein,
+                                   parsed_items, items_extracted, source, timestamp, items)
+        day = _epoch_day(row[9])
+        new_user = phone_number not in self._known_users
+
+        # User upsert, meal and item inserts and rollup update commit together
+        with self.connection() as conn:
+            if new_user:
+                conn.execute('INSERT OR IGNORE INTO users (phone_number) VALUES (?)', (phone_number,))
+
+            meal_id = conn.execute(_MEAL_INSERT_SQL, row).lastrowid
+            conn.executemany(_MEAL_ITEM_INSERT_SQL,
+                             [(meal_id, phone_number, row[9]) + item for item in item_rows])
+            self._bump_daily_totals(conn, phone_number, day, 1,
+                                    total_calories, total_protein)
+
+        if new_user:
+            self._known_users.add(phone_number)
+
+    def log_meals(self, meals: Iterable[Dict], chunk_size: int = 1000) -> int:
+        """
+        Log many meals at once (history backfills, replaying webhook traffic)
 
-        # Determine meal tag based on timestamp
-        if timestamp is None:
-            timestamp = datetime.now()
-        meal_tag = get_meal_tag(timestamp)
+        Each record is a dict of log_meal's keyword arguments; meal_tag is
+        computed from each timestamp. Records are consumed lazily and written
+        in chunks of `chunk_size`, each chunk as one transaction, and every
+        distinct user is upserted only once. Meals without items go in with
+        one executemany; meals with items are inserted one by one for their ids.
 
-        # Convert timestamp to ISO format string
-        timestamp_str = timestamp.isoformat() if isinstance(timestamp, datetime) else timestamp
+        Returns:
+            Number of meals inserted
+        """
+        known_users: Set[str] = set()
+        inserted = 0
+        chunk = []
+
+        for record in meals:
+            chunk.append(_meal_row(**record))
+            if len(chunk) >= chunk_size:
+                inserted += self._insert_meal_chunk(chunk, known_users)
+                chunk = []
+
+        if chunk:
+            inserted += self._insert_meal_chunk(chunk, known_users)
+
+        return inserted
+
+    def _insert_meal_chunk(self, meals: List[Tuple[tuple, List[tuple]]], known_users: Set[str]) -> int:
+        """Insert prepared meal rows, their items, users and rollups in one transaction"""
+        new_users = {row[0] for row, _ in meals if row[0] not in self._known_users} - known_users
+
+        # Fold the chunk into one rollup delta per (user, day)
+        rollups = {}
+        for row, _ in meals:
+            key = (row[0], _epoch_day(row[9]))
+            count, calories, protein = rollups.get(key, (0, 0, 0))
+            rollups[key] = (count + 1, calories + (row[3] or 0), protein + (row[4] or 0))
+
+        with self.connection() as conn:
+            conn.executemany('INSERT OR IGNORE INTO users (phone_number) VALUES (?)',
+                             [(phone,) for phone in new_users])
+            # Meals with items need their ids; the rest go in one executemany
+            conn.executemany(_MEAL_INSERT_SQL, [row for row, item_rows in meals if not item_rows])
+            item_params = []
+            for row, item_rows in meals:
+                if item_rows:
+                    meal_id = conn.execute(_MEAL_INSERT_SQL, row).lastrowid
+                    item_params.extend((meal_id, row[0], row[9]) + item for item in item_rows)
+            conn.executemany(_MEAL_ITEM_INSERT_SQL, item_params)
+            conn.executemany(_DAILY_TOTALS_UPSERT_SQL,
+                             [key + values for key, values in rollups.items()])
+            self._refresh_period_totals(conn, rollups)
+
+        known_users.update(new_users)
+        self._known_users.add(*new_users)
+        return len(meals)
+
+    def get_range_summary(self, phone_number: str, start, end, granularity: str = 'day') -> Dict:
+        """
+        Bucketed totals for the days in [start, end)
 
-        cursor.execute('''
-            INSERT INTO meals (phone_number, meal_description, timestamp, total_calories,
-                             total_protein, parsed_items, items_extracted, source, meal_tag)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (phone_number, meal_description, timestamp_str, total_calories,
-              total_protein, parsed_items, items_extracted, source, meal_tag))
+        One grouped read of the daily_totals rollup: a primary key range
+        search touching at most one row per day with meals, however many
+        meals those days hold. Buckets without meals are filled in with zeros.
+
+        Args:
+            phone_number: User's phone number
+            start: First day (datetime, date or ISO string; time of day is ignored)
+            end: Day after the last day
+            granularity: 'day', 'week' (Monday-based) or 'month'; the first and
+                last buckets are clipped to the range
+
+        Returns:
+            Dictionary with per-bucket and overall totals. avg_daily_* are
+            averages per day with meals, matching "Active Days" in replies.
+        """
+        if granularity not in _SUMMARY_BUCKETS:
+            raise ValueError(f"granularity must be one of {', '.join(_SUMMARY_BUCKETS)}")
+        first_day = _as_day(start)
+        end_day = _as_day(end)
+        if end_day <= first_day:
+            raise ValueError("end must be after start")
+
+        with self.read_connection() as conn:
+            rows = conn.execute(f'''
+                SELECT {_SUMMARY_BUCKETS[granularity]} AS bucket, SUM(meal_count),
+                       SUM(calories), SUM(protein), COUNT(*)
+                FROM daily_totals
+                WHERE phone_number = ?
+                AND day >= ? AND day < ?
+                GROUP BY bucket
+            ''', (phone_number, first_day.strftime('%Y-%m-%d'),
+                  end_day.strftime('%Y-%m-%d'))).fetchall()
+
+        totals_by_bucket = {row[0]: row[1:] for row in rows}
+
+        buckets = []
+        bucket = _bucket_start(first_day, granularity)
+        while bucket < end_day:
+            next_bucket = _next_bucket(bucket, granularity)
+            bucket_start, bucket_end = max(bucket, first_day), min(next_bucket, end_day)
+            meal_count, calories, protein, days_with_meals = totals_by_bucket.get(
+                bucket.strftime('%Y-%m-%d'), (0, 0, 0, 0))
+            buckets.append(dict(
+                start=bucket_start.strftime('%Y-%m-%d'),
+                end=bucket_end.strftime('%Y-%m-%d'),
+                **_summary_totals(meal_count, calories or 0, protein or 0, days_with_meals,
+                                  (bucket_end - bucket_start).days)
+            ))
+            bucket = next_bucket
+
+        return dict(
+            start=first_day.strftime('%Y-%m-%d'),
+            end=end_day.strftime('%Y-%m-%d'),
+            granularity=granularity,
+            buckets=buckets,
+            **_summary_totals(sum(row[1] for row in rows),
+                              sum(row[2] or 0 for row in rows),
+                              sum(row[3] or 0 for row in rows),
+                              sum(row[4] for row in rows),
+                              (end_day - first_day).days)
+        )
 
-        conn.commit()
-        conn.close()
-    
     def get_daily_summary(self, phone_number: str, date: Optional[datetime] = None) -> Dict:
         """Get daily summary of calories and protein for a user"""
-        if date is None:
-            date = datetime.now()
-        
-        date_str = date.strftime('%Y-%m-%d')
-        
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT 
-                COUNT(*) as meal_count,
-                SUM(total_calories) as total_calories,
-                SUM(total_protein) as total_protein
-            FROM meals
-            WHERE phone_number = ?
-            AND DATE(timestamp) = ?
-        ''', (phone_number, date_str))
-        
-        result = cursor.fetchone()
-        conn.close()
-        
+        day = _as_day(date or datetime.now())
+        summary = self.get_range_summary(phone_number, day, day + timedelta(days=1))
+
         return {
-            'date': date_str,
-            'meal_count': result[0] or 0,
-            'total_calories': round(result[1] or 0, 1),
-            'total_protein': round(result[2] or 0, 1)
+            'date': summary['start'],
+            'meal_count': summary['meal_count'],
+            'total_calories': summary['total_calories'],
+            'total_protein': summary['total_protein']
         }
     
     def get_recent_meals(self, phone_number: str, limit: int = 5) -> List[Dict]:
         """Get recent meals for a user"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        cursor.execute('''
-            SELECT meal_description, timestamp, total_calories, total_protein, meal_tag
-            FROM meals
-            WHERE phone_number = ?
-            ORDER BY timestamp DESC
-            LIMIT ?
-        ''', (phone_number, limit))
+        with self.read_connection() as conn:
+            with closing(self._iter_meal_rows(
+                    conn, 'meal_description, timestamp, total_calories, total_protein, meal_tag',
+                    ['phone_number = ?'], [phone_number], limit=limit)) as rows:
+                rows = list(rows)
 
         meals = []
-        for row in cursor.fetchall():
+        for row in rows:
             meals.append({
-                'description': row[0],
-                'timestamp': row[1],
-                'calories': round(row[2], 1),
-                'protein': round(row[3], 1),
-                'meal_tag': row[4]
+                'description': row[2],
+                'timestamp': row[3],
+                'calories': round(row[4], 1),
+                'protein': round(row[5], 1),
+                'meal_tag': row[6]
             })
 
-        conn.close()
         return meals
 
+    def get_meal_history(self, phone_number: str, page_size: int = 20,
+                         cursor: Optional[str] = None) -> Dict:
+        """
+        Page through a user's meals, newest first.
+
+        Keyset pagination on (timestamp_epoch, id): each page seeks straight
+        to the cursor position in idx_meals_phone_epoch, so page 100 costs the
+        same as page 1 (no OFFSET scan). Meals logged after the first page was
+        fetched don't shift later pages.
+
+        Args:
+            phone_number: User's phone number
+            page_size: Meals per page
+            cursor: next_cursor from the previous page (None for the first page)
+
+        Returns:
+            Dict with 'meals' (same shape as get_recent_meals) and 'next_cursor'
+            (None when there are no more meals)
+        """
+        if page_size < 1:
+            raise ValueError("page_size must be at least 1")
+
+        columns = 'meal_description, timestamp, total_calories, total_protein, meal_tag'
+        conditions = ['phone_number = ?']
+        params = [phone_number]
+        epoch = None
+        if cursor is not None:
+            epoch, meal_id = _decode_history_cursor(cursor)
+            if epoch is None:
+                conditions.append('timestamp_epoch IS NULL AND id < ?')
+                params.append(meal_id)
+            else:
+                conditions.append('(timestamp_epoch, id) < (?, ?)')
+                params.extend([epoch, meal_id])
+
+        # Fetch one extra row to learn whether another page exists
+        with self.read_connection() as conn:
+            with closing(self._iter_meal_rows(conn, columns, conditions, params,
+                                              limit=page_size + 1)) as rows:
+                rows = list(rows)
+
+            # The row-value seek skips undated (NULL epoch) meals, which come
+            # after every dated one; top the page up with them
+            if epoch is not None and len(rows) <= page_size:
+                with closing(self._iter_meal_rows(
+                        conn, columns, ['phone_number = ?', 'timestamp_epoch IS NULL'],
+                        [phone_number], limit=page_size + 1 - len(rows))) as undated:
+                    rows.extend(undated)
+
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+
+        meals = []
+        for row in rows:
+            meals.append({
+                'description': row[2],
+                'timestamp': row[3],
+                'calories': round(row[4], 1),
+                'protein': round(row[5], 1),
+                'meal_tag': row[6]
+            })
+
+        next_cursor = None
+        if has_more:
+            next_cursor = _encode_history_cursor(rows[-1][0], rows[-1][1])
+
+        return {
+            'meals': meals,
+            'next_cursor': next_cursor
+        }
+
     def delete_last_meal(self, phone_number: str) -> Dict:
         """
         Delete the most recent meal for a user
@@ -211,49 +726,43 @@ class MealDatabase:
         Returns:
             Dictionary with success status and deleted meal info
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
         try:
-            # Get the most recent meal
-            cursor.execute('''
-                SELECT id, meal_description, total_calories, total_protein, timestamp, meal_tag
-                FROM meals
-                WHERE phone_number = ?
-                ORDER BY timestamp DESC
-                LIMIT 1
-            ''', (phone_number,))
-
-            result = cursor.fetchone()
-
-            if not result:
-                conn.close()
-                return {
-                    'success': False,
-                    'message': '❌ No meals found to delete.\n\n'
-                              'You haven\'t logged any meals yet!'
-                }
-
-            meal_id, description, calories, protein, timestamp, meal_tag = result
-
-            # Delete the meal
-            cursor.execute('DELETE FROM meals WHERE id = ?', (meal_id,))
-            conn.commit()
+            with self.connection() as conn:
+                # One statement finds the newest meal through idx_meals_phone_epoch
+                # and deletes it under the write lock, so two concurrent undos
+                # remove two different meals
+                rows = conn.execute('''
+                    DELETE FROM meals
+                    WHERE id = (
+                        SELECT id FROM meals
+                        WHERE phone_number = ?
+                        ORDER BY timestamp_epoch DESC, id DESC
+                        LIMIT 1
+                    )
+                    RETURNING id, meal_description, total_calories, total_protein, timestamp,
+                              meal_tag, timestamp_epoch
+                ''', (phone_number,)).fetchall()
+
+                if not rows:
+                    return {
+                        'success': False,
+                        'message': '❌ No meals found to delete.\n\n'
+                                  'You haven\'t logged any meals yet!'
+                    }
+
+                meal_id, description, calories, protein, timestamp, meal_tag, epoch = rows[0]
+
+                # Remove its items and take it out of the daily rollup in the same
+                # transaction (undated legacy meals were never in it)
+                conn.execute('DELETE FROM meal_items WHERE meal_id = ?', (meal_id,))
+                if epoch is not None:
+                    self._bump_daily_totals(conn, phone_number, _epoch_day(epoch), -1,
+                                            -(calories or 0), -(protein or 0))
 
             # Format meal tag for display
             meal_tag_display = meal_tag.replace('_', ' ').title() if meal_tag else "N/A"
 
-            # Parse timestamp
-            try:
-                if isinstance(timestamp, str):
-                    ts = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-                    time_str = ts.strftime('%I:%M %p')
-                else:
-                    time_str = "Unknown time"
-            except:
-                time_str = str(timestamp)
-
-            conn.close()
+            time_str = from_epoch(epoch).strftime('%I:%M %p') if epoch is not None else "N/A"
 
             return {
                 'success': True,
@@ -274,42 +783,25 @@ class MealDatabase:
             }
 
         except Exception as e:
-            conn.close()
             return {
                 'success': False,
                 'message': f'❌ Error deleting meal: {str(e)}'
             }
     
     def get_weekly_summary(self, phone_number: str) -> Dict:
-        """Get weekly summary"""
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=7)
-
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        cursor.execute('''
-            SELECT
-                COUNT(*) as meal_count,
-                AVG(total_calories) as avg_calories,
-                AVG(total_protein) as avg_protein,
-                SUM(total_calories) as total_calories,
-                SUM(total_protein) as total_protein
-            FROM meals
-            WHERE phone_number = ?
-            AND timestamp BETWEEN ? AND ?
-        ''', (phone_number, start_date, end_date))
-
-        result = cursor.fetchone()
-        conn.close()
+        """Get weekly summary (today and the 6 days before it)"""
+        today = _as_day(datetime.now())
+        summary = self.get_range_summary(phone_number, today - timedelta(days=6),
+                                         today + timedelta(days=1))
 
         return {
-            'period': f'Last 7 days',
-            'meal_count': result[0] or 0,
-            'avg_daily_calories': round(result[1] or 0, 1),
-            'avg_daily_protein': round(result[2] or 0, 1),
-            'total_calories': round(result[3] or 0, 1),
-            'total_protein': round(result[4] or 0, 1)
+            'period': 'Last 7 days',
+            'meal_count': summary['meal_count'],
+            'days_with_meals': summary['days_with_meals'],
+            'avg_daily_calories': summary['avg_daily_calories'],
+            'avg_daily_protein': summary['avg_daily_protein'],
+            'total_calories': summary['total_calories'],
+            'total_protein': summary['total_protein']
         }
 
     def get_weekly_breakdown(self, phone_number: str) -> Dict:
@@ -319,124 +811,230 @@ class MealDatabase:
         Returns:
             Dictionary with daily breakdown and totals
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        return self.get_daily_breakdown(phone_number, days=7)
 
-        # Get data for last 7 days
-        daily_data = []
-        total_calories = 0
-        total_protein = 0
-        total_meals = 0
-
-        for i in range(6, -1, -1):  # 6 days ago to today
-            date = datetime.now() - timedelta(days=i)
-            date_str = date.strftime('%Y-%m-%d')
-
-            cursor.execute('''
-                SELECT
-                    COUNT(*) as meal_count,
-                    SUM(total_calories) as total_calories,
-                    SUM(total_protein) as total_protein
-                FROM meals
-                WHERE phone_number = ?
-                AND DATE(timestamp) = ?
-            ''', (phone_number, date_str))
+    def get_monthly_summary(self, phone_number: str, date: Optional[datetime] = None) -> Dict:
+        """
+        Totals for the calendar month containing `date` (default: this month)
+
+        One monthly_totals row, however long the user has been tracking.
+        `days` counts the month's days so far (all of them for a past month).
+        """
+        first_day = _as_day(date or datetime.now()).replace(day=1)
+        month = first_day.strftime('%Y-%m')
+
+        with self.read_connection() as conn:
+            row = conn.execute('''
+                SELECT meal_count, days_with_meals, calories, protein
+                FROM monthly_totals
+                WHERE phone_number = ? AND month = ?
+            ''', (phone_number, month)).fetchone()
+
+        meal_count, days_with_meals, calories, protein = row or (0, 0, 0, 0)
+        return dict(
+            month=month,
+            label=first_day.strftime('%B %Y'),
+            **_summary_totals(meal_count, calories, protein, days_with_meals,
+                              _days_so_far(first_day, _next_bucket(first_day, 'month')))
+        )
+
+    def get_yearly_summary(self, phone_number: str, year: Optional[int] = None) -> Dict:
+        """
+        Totals for a calendar year (default: this year) with a per-month trend
+
+        Reads one yearly_totals row and at most 12 monthly_totals rows.
+        Months after the current one are left out of the trend.
+        """
+        today = _as_day(datetime.now())
+        year = year or today.year
+        first_day = datetime(year, 1, 1)
+
+        with self.read_connection() as conn:
+            total = conn.execute('''
+                SELECT meal_count, days_with_meals, calories, protein
+                FROM yearly_totals
+                WHERE phone_number = ? AND year = ?
+            ''', (phone_number, f"{year:04d}")).fetchone()
+            rows = conn.execute('''
+                SELECT month, meal_count, days_with_meals, calories, protein
+                FROM monthly_totals
+                WHERE phone_number = ? AND month >= ? AND month < ?
+            ''', (phone_number, f"{year:04d}-01", f"{year + 1:04d}-01")).fetchall()
+
+        totals_by_month = {row[0]: row[1:] for row in rows}
+        months = []
+        month_start = first_day
+        while month_start.year == year and month_start <= today:
+            month_end = _next_bucket(month_start, 'month')
+            meal_count, days_with_meals, calories, protein = totals_by_month.get(
+                month_start.strftime('%Y-%m'), (0, 0, 0, 0))
+            months.append(dict(
+                month=month_start.strftime('%Y-%m'),
+                label=month_start.strftime('%b'),
+                **_summary_totals(meal_count, calories, protein, days_with_meals,
+                                  _days_so_far(month_start, month_end))
+            ))
+            month_start = month_end
+
+        meal_count, days_with_meals, calories, protein = total or (0, 0, 0, 0)
+        return dict(
+            year=year,
+            months=months,
+            **_summary_totals(meal_count, calories, protein, days_with_meals,
+                              _days_so_far(first_day, datetime(year + 1, 1, 1)))
+        )
+
+    def get_daily_breakdown(self, phone_number: str, days: int = 7,
+                            end_date: Optional[datetime] = None) -> Dict:
+        """
+        Get a per-day breakdown for the `days` calendar days ending on `end_date`
 
-            result = cursor.fetchone()
-            meal_count = result[0] or 0
-            calories = result[1] or 0
-            protein = result[2] or 0
+        All days come from one get_range_summary read over a single window
+        computed from one anchor date, so a request spanning midnight can't
+        mix two windows. Days without meals are filled in with zeros.
+
+        Args:
+            phone_number: User's phone number
+            days: Number of days in the window (7, 30, 90, ...)
+            end_date: Last day of the window (default: today)
+
+        Returns:
+            Dictionary with daily breakdown and totals
+        """
+        now = datetime.now()
+        first_day = _as_day(end_date or now) - timedelta(days=days - 1)
+        summary = self.get_range_summary(phone_number, first_day, first_day + timedelta(days=days))
+
+        daily_data = []
+        for bucket in summary['buckets']:  # oldest day first
+            date = datetime.strptime(bucket['start'], '%Y-%m-%d')
 
             # Format day name
-            if i == 0:
+            days_ago = (now.date() - date.date()).days
+            if days_ago == 0:
                 day_label = "Today"
-            elif i == 1:
+            elif days_ago == 1:
                 day_label = "Yesterday"
             else:
                 day_label = date.strftime('%A')  # Full day name (Monday, Tuesday, etc.)
 
             daily_data.append({
-                'date': date_str,
+                'date': bucket['start'],
                 'day_label': day_label,
                 'day_name': date.strftime('%a'),  # Short day name (Mon, Tue, etc.)
                 'full_date': date.strftime('%b %d'),  # Month Day (Jan 15)
-                'meal_count': meal_count,
-                'calories': round(calories, 1),
-                'protein': round(protein, 1)
+                'meal_count': bucket['meal_count'],
+                'calories': bucket['total_calories'],
+                'protein': bucket['total_protein']
             })
 
-            total_calories += calories
-            total_protein += protein
-            total_meals += meal_count
-
-        conn.close()
-
-        # Calculate averages (only for days with meals)
-        days_with_meals = sum(1 for day in daily_data if day['meal_count'] > 0)
-        avg_calories = (total_calories / days_with_meals) if days_with_meals > 0 else 0
-        avg_protein = (total_protein / days_with_meals) if days_with_meals > 0 else 0
-
         return {
             'daily_breakdown': daily_data,
-            'total_calories': round(total_calories, 1),
-            'total_protein': round(total_protein, 1),
-            'total_meals': total_meals,
-            'avg_daily_calories': round(avg_calories, 1),
-            'avg_daily_protein': round(avg_protein, 1),
-            'days_with_meals': days_with_meals
+            'days': days,
+            'total_calories': summary['total_calories'],
+            'total_protein': summary['total_protein'],
+            'total_meals': summary['meal_count'],
+            'avg_daily_calories': summary['avg_daily_calories'],
+            'avg_daily_protein': summary['avg_daily_protein'],
+            'days_with_meals': summary['days_with_meals']
         }
-    
+
+    def get_food_totals(self, phone_number: Optional[str] = None, food_name: Optional[str] = None,
+                        start=None, end=None) -> List[Dict]:
+        """
+        Per-food totals from meal_items ("how much dal did I eat this month")
+
+        Hot and archived meals both count. With a phone number the query is a
+        range scan of idx_meal_items_phone_food, without one of idx_meal_items_food.
+
+        Args:
+            phone_number: Only this user's meals (default: all users)
+            food_name: Only this food, case-insensitive (default: every food)
+            start: Earliest timestamp to include (datetime or ISO string)
+            end: Exclude meals at or after this timestamp (datetime or ISO string)
+
+        Returns:
+            List of per-food dicts, most eaten first. calories and protein only
+            sum items that have them (items backfilled from old multi-item
+            meals don't); known_nutrition_meals says how many meals that was.
+        """
+        conditions = []
+        params: List = []
+        if phone_number:
+            conditions.append('phone_number = ?')
+            params.append(phone_number)
+        if food_name:
+            conditions.append('food_name = ?')
+            params.append(food_name.strip().lower())
+        if start is not None:
+            conditions.append('timestamp_epoch >= ?')
+            params.append(to_epoch(start))
+        if end is not None:
+            conditions.append('timestamp_epoch < ?')
+            params.append(to_epoch(end))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+        with self.read_connection() as conn:
+            rows = conn.execute(f'''
+                SELECT food_name, COUNT(DISTINCT meal_id), SUM(quantity),
+                       SUM(calories), SUM(protein), COUNT(DISTINCT CASE WHEN calories IS NOT NULL THEN meal_id END)
+                FROM meal_items
+                {where}
+                GROUP BY food_name
+                ORDER BY SUM(quantity) DESC, food_name
+            ''', params).fetchall()
+
+        return [{
+            'food_name': row[0],
+            'meal_count': row[1],
+            'quantity': round(row[2] or 0, 2),
+            'calories': round(row[3] or 0, 1),
+            'protein': round(row[4] or 0, 1),
+            'known_nutrition_meals': row[5]
+        } for row in rows]
+
     def export_to_excel(self, output_file: str = "meal_logs.xlsx", phone_number: Optional[str] = None):
         """Export meal logs to Excel file"""
         try:
             from openpyxl import Workbook
+            from openpyxl.cell import WriteOnlyCell
             from openpyxl.styles import Font, PatternFill, Alignment
 
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            # Query all meals or for specific user
-            if phone_number:
-                cursor.execute('''
-                    SELECT phone_number, meal_description, timestamp,
-                           items_extracted, total_calories, total_protein, source, meal_tag
-                    FROM meals
-                    WHERE phone_number = ?
-                    ORDER BY timestamp DESC
-                ''', (phone_number,))
-            else:
-                cursor.execute('''
-                    SELECT phone_number, meal_description, timestamp,
-                           items_extracted, total_calories, total_protein, source, meal_tag
-                    FROM meals
-                    ORDER BY timestamp DESC
-                ''')
+            # Write-only mode streams rows to disk instead of keeping every cell
+            wb = Workbook(write_only=True)
+            ws = wb.create_sheet("Meal Logs")
 
-            rows = cursor.fetchall()
-            conn.close()
-
-            # Create workbook
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "Meal Logs"
+            # Column widths must be set before the first row is written
+            ws.column_dimensions['A'].width = 20
+            ws.column_dimensions['B'].width = 40
+            ws.column_dimensions['C'].width = 20
+            ws.column_dimensions['D'].width = 15
+            ws.column_dimensions['E'].width = 40
+            ws.column_dimensions['F'].width = 15
+            ws.column_dimensions['G'].width = 15
+            ws.column_dimensions['H'].width = 12
 
             # Headers
             headers = ["Phone Number", "Original Message", "Timestamp", "Meal Tag",
                       "Items Extracted", "Total Calories", "Total Protein", "Source"]
-            ws.append(headers)
 
             # Style headers
             header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
             header_font = Font(bold=True, color="FFFFFF")
 
-            for cell in ws[1]:
+            header_cells = []
+            for header in headers:
+                cell = WriteOnlyCell(ws, value=header)
                 cell.fill = header_fill
                 cell.font = header_font
                 cell.alignment = Alignment(horizontal="center", vertical="center")
+                header_cells.append(cell)
+            ws.append(header_cells)
 
             # Add data rows
-            for row in rows:
-                phone, description, timestamp, items_extracted, calories, protein, source, meal_tag = row
+            exported = 0
+            for meal in self.iter_meals(phone_number=phone_number):
+                items_extracted = meal['items_extracted']
 
                 # Parse items_extracted if it's JSON
                 if items_extracted:
@@ -453,90 +1051,174 @@ class MealDatabase:
                     items_str = "N/A"
 
                 # Format meal tag for display
+                meal_tag = meal['meal_tag']
                 meal_tag_display = meal_tag.replace('_', ' ').title() if meal_tag else "N/A"
 
                 ws.append([
-                    phone,
-                    description,
-                    timestamp,
+                    meal['phone_number'],
+                    meal['description'],
+                    meal['timestamp'],
                     meal_tag_display,
                     items_str,
-                    round(calories, 1) if calories else 0,
-                    round(protein, 1) if protein else 0,
-                    source or "unknown"
+                    meal['calories'] or 0,
+                    meal['protein'] or 0,
+                    meal['source'] or "unknown"
                 ])
-
-            # Adjust column widths
-            ws.column_dimensions['A'].width = 20
-            ws.column_dimensions['B'].width = 40
-            ws.column_dimensions['C'].width = 20
-            ws.column_dimensions['D'].width = 15
-            ws.column_dimensions['E'].width = 40
-            ws.column_dimensions['F'].width = 15
-            ws.column_dimensions['G'].width = 15
-            ws.column_dimensions['H'].width = 12
+                exported += 1
 
             # Save file
             wb.save(output_file)
-            return True, f"Exported {len(rows)} meals to {output_file}"
+            return True, f"Exported {exported} meals to {output_file}"
 
         except Exception as e:
             return False, f"Error exporting to Excel: {e}"
-    
-    def get_all_meals(self, phone_number: Optional[str] = None, limit: Optional[int] = None) -> List[Dict]:
-        """Get all meals for export or analysis"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
 
-        if phone_number:
-            if limit:
-                cursor.execute('''
-                    SELECT meal_description, timestamp, items_extracted,
-                           total_calories, total_protein, source, meal_tag
-                    FROM meals
-                    WHERE phone_number = ?
-                    ORDER BY timestamp DESC
-                    LIMIT ?
-                ''', (phone_number, limit))
-            else:
-                cursor.execute('''
-                    SELECT meal_description, timestamp, items_extracted,
-                           total_calories, total_protein, source, meal_tag
-                    FROM meals
-                    WHERE phone_number = ?
-                    ORDER BY timestamp DESC
-                ''', (phone_number,))
-        else:
+    def import_meals(self, path: str, phone_number: Optional[str] = None, source: Optional[str] = None,
+                     sheet: Optional[str] = None, chunk_size: int = 1000) -> Dict:
+        """
+        Import meal history from an .xlsx or .csv file (see meal_import)
+
+        Rows are streamed from the file into log_meals, one transaction per
+        chunk_size meals; meal tags are recomputed from the timestamps.
+
+        Args:
+            path: Spreadsheet with a header row (export_to_excel's layout works)
+            phone_number: Phone number for every row, if the file has no phone column
+            source: Source for every row (default: the file's source column, else "import")
+            sheet: Worksheet name for .xlsx files (default: the first sheet)
+            chunk_size: Meals per transaction
+
+        Returns:
+            Dictionary with rows read, meals imported, rows skipped and elapsed seconds
+        """
+        from meal_import import import_meals
+        return import_meals(self, path, phone_number=phone_number, source=source,
+                            sheet=sheet, chunk_size=chunk_size)
+
+    def _archive_boundary(self, conn: sqlite3.Connection) -> Optional[int]:
+        """Epoch below which meals may live in meals_archive (None if nothing was archived)"""
+        row = conn.execute('SELECT value FROM db_meta WHERE key = ?',
+                           (_ARCHIVE_BOUNDARY_KEY,)).fetchone()
+        return int(row[0]) if row else None
+
+    def _iter_meal_rows(self, conn: sqlite3.Connection, columns: str, conditions: List[str],
+                        params: List, limit: Optional[int] = None, start_epoch: Optional[int] = None,
+                        chunk_size: int = 500) -> Iterator[tuple]:
+        """
+        Yield (timestamp_epoch, id, *columns) rows newest first across both tiers.
+
+        Every archived meal is older than the archive boundary, so rows are
+        read from meals alone until the scan passes the boundary; only then
+        is meals_archive opened and merged in. Queries that stay in recent
+        history never touch the archive.
+        """
+        def scan(table: str) -> Iterator[tuple]:
+            query = f'SELECT timestamp_epoch, id, {columns} FROM {table}'
+            if conditions:
+                query += ' WHERE ' + ' AND '.join(conditions)
+            query += ' ORDER BY timestamp_epoch DESC, id DESC'
+            query_params = list(params)
             if limit:
-                cursor.execute('''
-                    SELECT meal_description, timestamp, items_extracted,
-                           total_calories, total_protein, source, meal_tag
-                    FROM meals
-                    ORDER BY timestamp DESC
-                    LIMIT ?
-                ''', (limit,))
-            else:
-                cursor.execute('''
-                    SELECT meal_description, timestamp, items_extracted,
-                           total_calories, total_protein, source, meal_tag
-                    FROM meals
-                    ORDER BY timestamp DESC
-                ''')
+                query += ' LIMIT ?'
+                query_params.append(limit)
 
-        meals = []
-        for row in cursor.fetchall():
-            meals.append({
-                'description': row[0],
-                'timestamp': row[1],
-                'items_extracted': row[2],
-                'calories': round(row[3], 1),
-                'protein': round(row[4], 1),
-                'source': row[5],
-                'meal_tag': row[6]
-            })
+            cursor = conn.execute(query, query_params)
+            try:
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        return
+                    yield from rows
+            finally:
+                cursor.close()
+
+        boundary = self._archive_boundary(conn)
+        with closing(scan('meals')) as hot:
+            if boundary is None or (start_epoch is not None and start_epoch >= boundary):
+                yield from hot
+                return
+
+            emitted = 0
+            remaining = hot
+            for row in hot:
+                if row[0] is None or row[0] < boundary:
+                    remaining = chain([row], hot)
+                    break
+                yield row
+                emitted += 1
+
+            if limit and emitted >= limit:
+                return
+
+            with closing(scan('meals_archive')) as cold:
+                merged = heapq.merge(remaining, cold, key=_newest_first_key, reverse=True)
+                yield from islice(merged, limit - emitted) if limit else merged
+
+    def iter_meals(self, phone_number: Optional[str] = None, limit: Optional[int] = None,
+                   start=None, end=None, chunk_size: int = 500) -> Iterator[Dict]:
+        """
+        Stream meals newest first without loading the whole result set.
 
-        conn.close()
-        return meals
+        Rows are pulled with fetchmany(chunk_size), so memory stays flat no
+        matter how many meals match. The generator holds its own pooled
+        connection until it is exhausted or closed.
+
+        Args:
+            phone_number: Only this user's meals (default: all users)
+            limit: Stop after this many meals
+            start: Earliest timestamp to include (datetime or ISO string)
+            end: Exclude meals at or after this timestamp (datetime or ISO string)
+            chunk_size: Rows fetched from SQLite per round trip
+
+        Yields:
+            Dict per meal, in the same shape as get_all_meals
+        """
+        with closing(self._iter_meal_entries(phone_number, limit, start, end, chunk_size)) as entries:
+            for _, _, meal in entries:
+                yield meal
+
+    def _iter_meal_entries(self, phone_number: Optional[str], limit: Optional[int],
+                           start, end, chunk_size: int) -> Iterator[Tuple[Optional[int], int, Dict]]:
+        """iter_meals rows as (timestamp_epoch, id, meal dict), for merging streams in order"""
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
+
+        conditions = []
+        params: List = []
+        start_epoch = None
+        if phone_number:
+            conditions.append('phone_number = ?')
+            params.append(phone_number)
+        if start is not None:
+            start_epoch = to_epoch(start)
+            conditions.append('timestamp_epoch >= ?')
+            params.append(start_epoch)
+        if end is not None:
+            conditions.append('timestamp_epoch < ?')
+            params.append(to_epoch(end))
+
+        columns = ('phone_number, meal_description, timestamp, items_extracted, '
+                   'total_calories, total_protein, source, meal_tag')
+
+        # Unshared checkout: the generator may be resumed from another thread
+        with self.read_pool.connection(shared=False) as conn:
+            with closing(self._iter_meal_rows(conn, columns, conditions, params, limit=limit,
+                                              start_epoch=start_epoch, chunk_size=chunk_size)) as rows:
+                for row in rows:
+                    yield row[0], row[1], {
+                        'phone_number': row[2],
+                        'description': row[3],
+                        'timestamp': row[4],
+                        'items_extracted': row[5],
+                        'calories': round(row[6], 1) if row[6] is not None else None,
+                        'protein': round(row[7], 1) if row[7] is not None else None,
+                        'source': row[8],
+                        'meal_tag': row[9]
+                    }
+
+    def get_all_meals(self, phone_number: Optional[str] = None, limit: Optional[int] = None) -> List[Dict]:
+        """Get all meals for export or analysis (use iter_meals for large exports)"""
+        return list(self.iter_meals(phone_number=phone_number, limit=limit))
 
     def add_custom_food(self, name: str, calories: float, protein: float, serving_size: str, category: str = "custom") -> Dict:
         """
@@ -553,32 +1235,30 @@ class MealDatabase:
             Dictionary with status and message
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            # Check if food already exists
-            cursor.execute('SELECT name, calories, protein, serving_size FROM custom_foods WHERE name = ?', (name.lower(),))
-            existing = cursor.fetchone()
-
-            if existing:
-                conn.close()
-                return {
-                    'success': False,
-                    'message': f'❌ Food "{name}" already exists in database.\n\n'
-                              f'Current values:\n'
-                              f'  Calories: {existing[1]} kcal\n'
-                              f'  Protein: {existing[2]}g\n'
-                              f'  Serving: {existing[3]}'
-                }
-
-            # Insert new custom food
-            cursor.execute('''
-                INSERT INTO custom_foods (name, aliases, calories, protein, serving_size, category)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (name.lower(), '[]', float(calories), float(protein), serving_size, category))
-
-            conn.commit()
-            conn.close()
+            with self.connection() as conn:
+                cursor = conn.cursor()
+
+                # Check if food already exists
+                cursor.execute('SELECT name, calories, protein, serving_size FROM custom_foods WHERE name = ?', (name.lower(),))
+                existing = cursor.fetchone()
+
+                if existing:
+                    return {
+                        'success': False,
+                        'message': f'❌ Food "{name}" already exists in database.\n\n'
+                                  f'Current values:\n'
+                                  f'  Calories: {existing[1]} kcal\n'
+                                  f'  Protein: {existing[2]}g\n'
+                                  f'  Serving: {existing[3]}'
+                    }
+
+                # Insert new custom food and bump the catalogue version
+                cursor.execute('''
+                    INSERT INTO custom_foods (name, aliases, calories, protein, serving_size, category)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (name.lower(), '[]', float(calories), float(protein), serving_size, category))
+                cursor.execute("INSERT INTO custom_food_changes (name, action) VALUES (?, 'add')",
+                               (name.lower(),))
 
             return {
                 'success': True,
@@ -603,17 +1283,15 @@ class MealDatabase:
         Returns:
             List of custom food dictionaries
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        cursor.execute('''
-            SELECT name, aliases, calories, protein, serving_size, category
-            FROM custom_foods
-            ORDER BY name
-        ''')
+        with self.read_connection() as conn:
+            rows = conn.execute('''
+                SELECT name, aliases, calories, protein, serving_size, category
+                FROM custom_foods
+                ORDER BY name
+            ''').fetchall()
 
         custom_foods = []
-        for row in cursor.fetchall():
+        for row in rows:
             custom_foods.append({
                 'name': row[0],
                 'aliases': json.loads(row[1]) if row[1] else [],
@@ -623,9 +1301,50 @@ class MealDatabase:
                 'category': row[5] if row[5] else 'custom'
             })
 
-        conn.close()
         return custom_foods
 
+    def get_custom_food_changes(self, since_version: int = 0) -> Dict:
+        """
+        Custom food adds and deletes after `since_version`, oldest first
+
+        Cheap enough to call on every request: with nothing new it is a
+        single seek past the end of custom_food_changes. Replaying the
+        changes in order from version 0 yields the whole catalogue.
+
+        Returns:
+            Dictionary with the catalogue version and the changes; an 'add'
+            carries the food as get_all_custom_foods returns it, or None if
+            the food was deleted again later
+        """
+        with self.read_connection() as conn:
+            rows = conn.execute('''
+                SELECT c.version, c.action, c.name,
+                       f.aliases, f.calories, f.protein, f.serving_size, f.category
+                FROM custom_food_changes c
+                LEFT JOIN custom_foods f ON c.action = 'add' AND f.name = c.name
+                WHERE c.version > ?
+                ORDER BY c.version
+            ''', (since_version,)).fetchall()
+
+        changes = []
+        for row in rows:
+            food = None
+            if row[4] is not None:
+                food = {
+                    'name': row[2],
+                    'aliases': json.loads(row[3]) if row[3] else [],
+                    'calories': row[4],
+                    'protein': row[5],
+                    'serving_size': row[6],
+                    'category': row[7] if row[7] else 'custom'
+                }
+            changes.append({'version': row[0], 'action': row[1], 'name': row[2], 'food': food})
+
+        return {
+            'version': rows[-1][0] if rows else since_version,
+            'changes': changes
+        }
+
     def delete_custom_food(self, name: str) -> Dict:
         """
         Delete a custom food from the database
@@ -637,20 +1356,17 @@ class MealDatabase:
             Dictionary with status and message
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            with self.connection() as conn:
+                cursor = conn.execute('DELETE FROM custom_foods WHERE name = ?', (name.lower(),))
 
-            cursor.execute('DELETE FROM custom_foods WHERE name = ?', (name.lower(),))
-
-            if cursor.rowcount == 0:
-                conn.close()
-                return {
-                    'success': False,
-                    'message': f'❌ Food "{name}" not found in custom foods.'
-                }
+                if cursor.rowcount == 0:
+                    return {
+                        'success': False,
+                        'message': f'❌ Food "{name}" not found in custom foods.'
+                    }
 
-            conn.commit()
-            conn.close()
+                conn.execute("INSERT INTO custom_food_changes (name, action) VALUES (?, 'delete')",
+                             (name.lower(),))
 
             return {
                 'success': True,
@@ -661,4 +1377,199 @@ class MealDatabase:
             return {
                 'success': False,
                 'message': f'❌ Error deleting food: {str(e)}'
-            }
\ No newline at end of file
+            }
+
+    def _rebuild_daily_totals(self, conn: sqlite3.Connection):
+        """Recompute every daily rollup row from hot and archived meals in the caller's transaction"""
+        conn.execute('DELETE FROM daily_totals')
+        conn.execute('''
+            INSERT INTO daily_totals (phone_number, day, meal_count, calories, protein)
+            SELECT phone_number, date(timestamp_epoch, 'unixepoch'), COUNT(*),
+                   COALESCE(SUM(total_calories), 0), COALESCE(SUM(total_protein), 0)
+            FROM ''' + _ALL_MEALS_SQL + '''
+            WHERE timestamp_epoch IS NOT NULL
+            GROUP BY phone_number, timestamp_epoch / 86400
+        ''')
+        self._rebuild_period_totals(conn)
+
+    def _rebuild_period_totals(self, conn: sqlite3.Connection):
+        """Recompute every monthly and yearly rollup row from daily_totals"""
+        conn.execute('DELETE FROM monthly_totals')
+        conn.execute('''
+            INSERT INTO monthly_totals (phone_number, month, meal_count, days_with_meals, calories, protein)
+            SELECT phone_number, substr(day, 1, 7), SUM(meal_count), COUNT(*), SUM(calories), SUM(protein)
+            FROM daily_totals
+            GROUP BY phone_number, substr(day, 1, 7)
+        ''')
+        conn.execute('DELETE FROM yearly_totals')
+        conn.execute('''
+            INSERT INTO yearly_totals (phone_number, year, meal_count, days_with_meals, calories, protein)
+            SELECT phone_number, substr(month, 1, 4), SUM(meal_count), SUM(days_with_meals),
+                   SUM(calories), SUM(protein)
+            FROM monthly_totals
+            GROUP BY phone_number, substr(month, 1, 4)
+        ''')
+
+    def rebuild_daily_totals(self) -> int:
+        """
+        Recompute the daily_totals rollup from hot and archived meals in one transaction
+        (monthly and yearly rollups are re-derived from it)
+
+        Returns:
+            Number of rollup rows written
+        """
+        with self.connection() as conn:
+            self._rebuild_daily_totals(conn)
+            return conn.execute('SELECT COUNT(*) FROM daily_totals').fetchone()[0]
+
+    def verify_daily_totals(self, repair: bool = False, tolerance: float = 0.01) -> Dict:
+        """
+        Compare the daily_totals rollup against hot and archived meals in one streaming pass
+
+        Both sides are read in (phone_number, day) order and merged like a
+        sorted-merge join, so neither table is loaded into memory; memory grows
+        only with the number of drifted rows, which are all kept for the report
+        and the repair.
+
+        Args:
+            repair: Rewrite drifted rollup rows from the recomputed values
+            tolerance: Allowed float difference for calories/protein
+
+        Returns:
+            Dictionary with rows checked, drifted keys and whether they were repaired
+        """
+        with self.connection() as conn:
+            expected = conn.execute('''
+                SELECT phone_number, date(timestamp_epoch, 'unixepoch') as day, COUNT(*),
+                       COALESCE(SUM(total_calories), 0), COALESCE(SUM(total_protein), 0)
+                FROM ''' + _ALL_MEALS_SQL + '''
+                WHERE timestamp_epoch IS NOT NULL
+                GROUP BY phone_number, day
+                ORDER BY phone_number, day
+            ''')
+            actual = conn.cursor().execute('''
+                SELECT phone_number, day, meal_count, calories, protein
+                FROM daily_totals
+                ORDER BY phone_number, day
+            ''')
+
+            checked = 0
+            drifted = []  # (phone_number, day, recomputed row or None)
+            exp_row = next(expected, None)
+            act_row = next(actual, None)
+
+            while exp_row is not None or act_row is not None:
+                checked += 1
+                exp_key = exp_row[:2] if exp_row else None
+                act_key = act_row[:2] if act_row else None
+
+                if act_key is None or (exp_key is not None and exp_key < act_key):
+                    # Rollup row missing
+                    drifted.append((exp_key[0], exp_key[1], exp_row[2:]))
+                    exp_row = next(expected, None)
+                elif exp_key is None or act_key < exp_key:
+                    # Rollup row for a day that has no meals
+                    drifted.append((act_key[0], act_key[1], None))
+                    act_row = next(actual, None)
+                else:
+                    if (exp_row[2] != act_row[2]
+                            or abs(exp_row[3] - act_row[3]) > tolerance
+                            or abs(exp_row[4] - act_row[4]) > tolerance):
+                        drifted.append((exp_key[0], exp_key[1], exp_row[2:]))
+                    exp_row = next(expected, None)
+                    act_row = next(actual, None)
+
+            if repair:
+                for phone_number, day, values in drifted:
+                    if values is None:
+                        conn.execute('DELETE FROM daily_totals WHERE phone_number = ? AND day = ?',
+                                     (phone_number, day))
+                    else:
+                        conn.execute('''
+                            INSERT OR REPLACE INTO daily_totals
+                                (phone_number, day, meal_count, calories, protein)
+                            VALUES (?, ?, ?, ?, ?)
+                        ''', (phone_number, day) + tuple(values))
+                self._refresh_period_totals(conn, [(phone_number, day) for phone_number, day, _ in drifted])
+
+        return {
+            'rows_checked': checked,
+            'drifted': [(phone_number, day) for phone_number, day, _ in drifted],
+            'repaired': repair and bool(drifted)
+        }
+
+    def archive_meals(self, older_than_days: int, batch_size: int = 1000,
+                      now: Optional[datetime] = None) -> Dict:
+        """
+        Move meals older than N days from meals into meals_archive.
+
+        Rollups in daily_totals are left as they are, so summaries over old
+        days keep working. get_all_meals, iter_meals, get_recent_meals and
+        get_meal_history merge the archive back in when they reach past the
+        boundary. delete_last_meal only undoes meals still in the hot table.
+
+        Rows move per user in batches of batch_size, each batch one
+        DELETE ... RETURNING plus insert in a single transaction, so a meal is
+        always in exactly one table and concurrent runs can't copy it twice.
+
+        Args:
+            older_than_days: Keep this many days (counted back from midnight) in meals
+            batch_size: Meals moved per transaction
+            now: Reference time (default: now)
+
+        Returns:
+            Dictionary with the number of meals archived, users touched and the boundary date
+        """
+        if older_than_days < 1:
+            raise ValueError("older_than_days must be at least 1")
+
+        now = now or datetime.now()
+        cutoff = (now - timedelta(days=older_than_days)).replace(hour=0, minute=0, second=0, microsecond=0)
+        cutoff_epoch = to_epoch(cutoff)
+
+        # Publish the boundary before moving anything: readers that reach past
+        # it merge in the archive, so meals stay visible while they move. It
+        # only ever rises, keeping every archived meal below it.
+        with self.connection() as conn:
+            conn.execute('''
+                INSERT INTO db_meta (key, value) VALUES (?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    value = MAX(CAST(value AS INTEGER), CAST(excluded.value AS INTEGER))
+            ''', (_ARCHIVE_BOUNDARY_KEY, cutoff_epoch))
+
+        with self.read_connection() as conn:
+            phones = [row[0] for row in conn.execute(
+                'SELECT DISTINCT phone_number FROM meals WHERE phone_number IS NOT NULL')]
+
+        archived = 0
+        users = 0
+        insert = (f'INSERT INTO meals_archive ({_MEAL_COLUMNS}) '
+                  f'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)')
+        for phone_number in phones:
+            moved_for_user = 0
+            while True:
+                with self.connection() as conn:
+                    rows = conn.execute(f'''
+                        DELETE FROM meals
+                        WHERE id IN (
+                            SELECT id FROM meals
+                            WHERE phone_number = ? AND timestamp_epoch < ?
+                            LIMIT ?
+                        )
+                        RETURNING {_MEAL_COLUMNS}
+                    ''', (phone_number, cutoff_epoch, batch_size)).fetchall()
+                    conn.executemany(insert, rows)
+
+                moved_for_user += len(rows)
+                if len(rows) < batch_size:
+                    break
+
+            if moved_for_user:
+                archived += moved_for_user
+                users += 1
+
+        return {
+            'archived': archived,
+            'users': users,
+            'boundary': cutoff.strftime('%Y-%m-%d')
+        }
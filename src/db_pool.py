@@ -0,0 +1,191 @@
+"""Connection pooling for the SQLite meal database"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Callable, List, Optional
+from urllib.request import pathname2url
+
+
+class PoolExhaustedError(Exception):
+    """Raised when no pooled connection becomes free within the checkout timeout"""
+
+
+class ConnectionPool:
+    """
+    Bounded pool of long-lived SQLite connections.
+
+    A thread checks out one connection at a time. Nested checkouts from the
+    same thread (e.g. log_meal calling add_user) reuse the connection it
+    already holds, so a single webhook request never opens more than one
+    connection and all of its statements share one transaction. The
+    outermost checkout commits on success and rolls back on error.
+    """
+
+    def __init__(self, db_path: str, max_connections: int = 8, checkout_timeout: float = 30.0,
+                 on_connect: Optional[Callable[[sqlite3.Connection], None]] = None,
+                 read_only: bool = False, factory: type = sqlite3.Connection):
+        """
+        Args:
+            db_path: Path to the SQLite database file
+            max_connections: Upper bound on open connections
+            checkout_timeout: Seconds to wait for a free connection before giving up
+            on_connect: Called once with every newly opened connection (e.g. to set PRAGMAs)
+            read_only: Open connections with mode=ro and PRAGMA query_only, so
+                they can never take the write lock (the file must already exist)
+            factory: sqlite3.Connection subclass to open connections with
+        """
+        if max_connections < 1:
+            raise ValueError("max_connections must be at least 1")
+
+        self.db_path = db_path
+        self.max_connections = max_connections
+        self.checkout_timeout = checkout_timeout
+        self.on_connect = on_connect
+        self.read_only = read_only
+        self.factory = factory
+
+        self._cond = threading.Condition(threading.Lock())
+        self._idle: List[sqlite3.Connection] = []
+        self._open_count = 0
+        self._local = threading.local()
+        self._pid = os.getpid()
+        self._closed = False
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a new connection (may be handed to a different thread later)"""
+        if self.read_only:
+            uri = f"file:{pathname2url(os.path.abspath(self.db_path))}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False, factory=self.factory)
+            conn.execute('PRAGMA query_only = 1')
+        else:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, factory=self.factory)
+        if self.on_connect:
+            try:
+                self.on_connect(conn)
+            except Exception:
+                conn.close()
+                raise
+        return conn
+
+    def _reset_after_fork(self):
+        """Drop connections inherited from a parent process (gunicorn forks workers)"""
+        # Never close inherited handles: the parent still owns them
+        self._idle = []
+        self._open_count = 0
+        self._local = threading.local()
+        self._pid = os.getpid()
+
+    def _acquire(self) -> sqlite3.Connection:
+        with self._cond:
+            if self._pid != os.getpid():
+                self._reset_after_fork()
+
+            if self._closed:
+                raise PoolExhaustedError("Connection pool is closed")
+
+            while not self._idle and self._open_count >= self.max_connections:
+                if not self._cond.wait(timeout=self.checkout_timeout):
+                    raise PoolExhaustedError(
+                        f"No database connection free after {self.checkout_timeout}s "
+                        f"({self.max_connections} in use)"
+                    )
+                if self._closed:
+                    raise PoolExhaustedError("Connection pool is closed")
+
+            if self._idle:
+                return self._idle.pop()
+
+            # Reserve the slot before connecting so the bound holds under contention
+            self._open_count += 1
+
+        try:
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._open_count -= 1
+                self._cond.notify()
+            raise
+
+    def _release(self, conn: sqlite3.Connection):
+        with self._cond:
+            if self._closed or self._pid != os.getpid():
+                conn.close()
+                self._open_count = max(0, self._open_count - 1)
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, shared: bool = True):
+        """
+        Check out a connection for the calling thread.
+
+        Args:
+            shared: Join the connection this thread already holds. Pass False
+                for long-lived cursors (e.g. a generator streaming rows) so
+                writes the caller makes while iterating still commit on their
+                own; this takes a second connection from the pool.
+
+        Usage:
+            with pool.connection() as conn:
+                conn.execute(...)
+        """
+        if not shared:
+            conn = self._acquire()
+            try:
+                yield conn
+                if conn.in_transaction:
+                    conn.commit()
+            except BaseException:
+                if conn.in_transaction:
+                    conn.rollback()
+                raise
+            finally:
+                self._release(conn)
+            return
+
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            # Nested checkout: share the outer transaction
+            self._local.depth += 1
+            try:
+                yield held
+            finally:
+                self._local.depth -= 1
+            return
+
+        conn = self._acquire()
+        self._local.conn = conn
+        self._local.depth = 1
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self._local.conn = None
+            self._local.depth = 0
+            self._release(conn)
+
+    def stats(self) -> dict:
+        """Return current pool usage"""
+        with self._cond:
+            return {
+                'max_connections': self.max_connections,
+                'open_connections': self._open_count,
+                'idle_connections': len(self._idle),
+            }
+
+    def close(self):
+        """Close idle connections; connections still checked out close on release"""
+        with self._cond:
+            self._closed = True
+            for conn in self._idle:
+                conn.close()
+                self._open_count -= 1
+            self._idle = []
+            self._cond.notify_all()
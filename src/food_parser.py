@@ -27,20 +27,17 @@ class FoodParser:
         with open(food_database_path, 'r') as f:
             base_foods = json.load(f)
 
-        # Load custom foods from database if available
-        custom_foods = []
-        if meal_db:
-            try:
-                custom_foods = meal_db.get_all_custom_foods()
-            except Exception as e:
-                print(f"Warning: Could not load custom foods: {e}")
-
-        # Merge base foods and custom foods
-        self.food_db = base_foods + custom_foods
+        self.food_db = base_foods
 
         # Create a searchable index
         self.food_index = self._create_food_index()
 
+        # Custom foods come from the database catalogue; catalogue_version is
+        # the last change applied, so sync_custom_foods only fetches newer ones
+        self.catalogue_version = 0
+        self._custom_foods: Dict[str, Dict] = {}
+        self.sync_custom_foods()
+
         # Initialize LLM client only if requested
         if self.use_llm and self.llm_provider:
             try:
@@ -97,6 +94,46 @@ class FoodParser:
                 index[alias.lower()] = food
         return index
     
+    def sync_custom_foods(self) -> int:
+        """
+        Apply custom foods added or deleted since the last sync (by any worker)
+
+        Call once per request: with nothing new it costs one indexed query.
+        Only the changed foods are touched; the index is never rebuilt.
+
+        Returns:
+            Number of changes applied
+        """
+        if not self.meal_db:
+            return 0
+
+        try:
+            delta = self.meal_db.get_custom_food_changes(self.catalogue_version)
+        except Exception as e:
+            print(f"Warning: Could not load custom foods: {e}")
+            return 0
+
+        for change in delta['changes']:
+            name = change['name']
+            # Drop the current entry first: a delete, or an add replacing an older definition
+            old = self._custom_foods.pop(name, None)
+            if old is not None:
+                self.food_db.remove(old)
+                for key in [old['name']] + old.get('aliases', []):
+                    if self.food_index.get(key.lower()) is old:
+                        del self.food_index[key.lower()]
+
+            food = change['food']
+            if change['action'] == 'add' and food is not None:
+                self._custom_foods[name] = food
+                self.food_db.append(food)
+                self.food_index[food['name'].lower()] = food
+                for alias in food.get('aliases', []):
+                    self.food_index[alias.lower()] = food
+
+        self.catalogue_version = delta['version']
+        return len(delta['changes'])
+
     def parse_meal_with_llm(self, user_message: str) -> List[Dict]:
         """Use LLM to extract food items and quantities from user message"""
         
@@ -442,17 +479,8 @@ If no food items are found, return an empty array: []
             result = self.meal_db.add_custom_food(name, calories, protein, serving_size, category)
 
             if result['success']:
-                # Add to in-memory database for immediate use
-                new_food = {
-                    "name": name,
-                    "aliases": [],
-                    "calories": float(calories),
-                    "protein": float(protein),
-                    "serving_size": serving_size,
-                    "category": category
-                }
-                self.food_db.append(new_food)
-                self.food_index[name] = new_food
+                # Pick up the new food (and anything other workers added) for immediate use
+                self.sync_custom_foods()
 
                 # Return success message with formatting
                 return {
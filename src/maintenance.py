@@ -0,0 +1,370 @@
+"""
+Routine SQLite maintenance: refresh planner statistics, hand free pages back
+with incremental vacuum and checkpoint the WAL, all within a time budget.
+Every run is recorded in the maintenance_runs table of the file it touched.
+
+Run once from the command line:
+    python src/maintenance.py data/user_meals.db --budget 10
+
+In the app it runs every DATABASE_MAINTENANCE_INTERVAL_HOURS (default 24,
+0 disables), counted from the last recorded run so restarts don't push it
+back, and the latest run is shown on /health. Every gunicorn worker runs
+the schedule; a db_meta claim lets only one of them maintain per interval.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from database import MealDatabase
+from sharding import ShardedMealDatabase, open_meal_database
+from storage_profiles import DEFAULT_STORAGE_PROFILE
+from write_behind import WriteBehindMealDatabase
+
+CHECKPOINT_MODES = ('PASSIVE', 'FULL', 'RESTART', 'TRUNCATE')
+
+# Rows kept in maintenance_runs per file
+HISTORY_LIMIT = 200
+
+# db_meta key: wall-clock time (seconds) of the last claimed scheduled run
+_CLAIM_KEY = 'maintenance_claimed_at'
+
+
+def _database_files(db) -> List[MealDatabase]:
+    """Every MealDatabase behind db (one per file)"""
+    if isinstance(db, WriteBehindMealDatabase):
+        db = db.db
+    if isinstance(db, ShardedMealDatabase):
+        return [db.catalogue] + db.shards
+    return [db]
+
+
+def _file_stats(conn: sqlite3.Connection, db_path: str) -> Dict:
+    wal_path = db_path + '-wal'
+    return {
+        'page_size': conn.execute('PRAGMA page_size').fetchone()[0],
+        'page_count': conn.execute('PRAGMA page_count').fetchone()[0],
+        'freelist': conn.execute('PRAGMA freelist_count').fetchone()[0],
+        'wal_bytes': os.path.getsize(wal_path) if os.path.exists(wal_path) else 0,
+    }
+
+
+def maintain_file(db: MealDatabase, deadline: float, vacuum_step_pages: int = 256,
+                  full_vacuum: bool = False, checkpoint_mode: str = 'PASSIVE') -> Dict:
+    """
+    Run the maintenance steps on one database file until `deadline` (perf_counter).
+
+    Steps run in order and each is skipped once the deadline has passed:
+      1. ANALYZE on a never-analyzed file, otherwise PRAGMA optimize, both
+         capped by analysis_limit so statistics cost stays bounded
+      2. PRAGMA incremental_vacuum in steps of vacuum_step_pages
+      3. PRAGMA wal_checkpoint(checkpoint_mode)
+
+    Files created before auto_vacuum was enabled can't vacuum incrementally;
+    full_vacuum=True converts them with one full VACUUM, which ignores the budget.
+    """
+    if checkpoint_mode.upper() not in CHECKPOINT_MODES:
+        raise ValueError(f"checkpoint_mode must be one of {', '.join(CHECKPOINT_MODES)}")
+
+    started_at = datetime.now().isoformat()
+    started = time.perf_counter()
+    steps: Dict[str, str] = {}
+    error = None
+
+    def out_of_time() -> bool:
+        return time.perf_counter() >= deadline
+
+    with db.connection() as conn:
+        before = _file_stats(conn, db.db_path)
+        try:
+            # 1. Planner statistics
+            if out_of_time():
+                steps['optimize'] = 'skipped: out of time'
+            else:
+                conn.execute('PRAGMA analysis_limit = 1000')
+                analyzed = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone()
+                if analyzed:
+                    conn.execute('PRAGMA optimize')
+                    steps['optimize'] = 'done'
+                else:
+                    conn.execute('ANALYZE')
+                    steps['optimize'] = 'full ANALYZE (first run)'
+
+            # 2. Free pages back to the filesystem
+            auto_vacuum = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+            if auto_vacuum == 2:
+                freed = 0
+                while not out_of_time():
+                    free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+                    if not free:
+                        break
+                    # executescript steps the pragma to completion; execute stops after one page
+                    conn.executescript(f'PRAGMA incremental_vacuum({min(free, vacuum_step_pages)})')
+                    freed += free - conn.execute('PRAGMA freelist_count').fetchone()[0]
+                remaining = conn.execute('PRAGMA freelist_count').fetchone()[0]
+                steps['incremental_vacuum'] = f'{freed} pages freed' + (
+                    f', {remaining} left (out of time)' if remaining else '')
+            elif full_vacuum:
+                conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                conn.executescript('VACUUM')
+                steps['incremental_vacuum'] = 'full VACUUM, converted to incremental auto_vacuum'
+            else:
+                steps['incremental_vacuum'] = 'skipped: auto_vacuum is off (run once with --full-vacuum)'
+
+            # 3. Fold the WAL back into the database file
+            if conn.execute('PRAGMA journal_mode').fetchone()[0] != 'wal':
+                steps['wal_checkpoint'] = 'skipped: not in WAL mode'
+            elif out_of_time():
+                steps['wal_checkpoint'] = 'skipped: out of time'
+            else:
+                busy, log_frames, checkpointed = conn.execute(
+                    f'PRAGMA wal_checkpoint({checkpoint_mode.upper()})').fetchone()
+                steps['wal_checkpoint'] = (f'{checkpoint_mode.upper()}: {checkpointed}/{log_frames} frames'
+                                           + (' (readers busy)' if busy else ''))
+        except sqlite3.Error as e:
+            error = str(e)
+
+        after = _file_stats(conn, db.db_path)
+        elapsed = round(time.perf_counter() - started, 3)
+
+        conn.execute('''
+            INSERT INTO maintenance_runs
+                (started_at, elapsed_seconds, page_size, page_count_before, page_count_after,
+                 freelist_before, freelist_after, wal_bytes_before, wal_bytes_after, steps, error)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (started_at, elapsed, after['page_size'], before['page_count'], after['page_count'],
+              before['freelist'], after['freelist'], before['wal_bytes'], after['wal_bytes'],
+              json.dumps(steps), error))
+        conn.execute('DELETE FROM maintenance_runs WHERE id <= (SELECT MAX(id) FROM maintenance_runs) - ?',
+                     (HISTORY_LIMIT,))
+
+    return {
+        'db_path': db.db_path,
+        'started_at': started_at,
+        'elapsed_seconds': elapsed,
+        'page_size': after['page_size'],
+        'page_count_before': before['page_count'],
+        'page_count_after': after['page_count'],
+        'freelist_before': before['freelist'],
+        'freelist_after': after['freelist'],
+        'wal_bytes_before': before['wal_bytes'],
+        'wal_bytes_after': after['wal_bytes'],
+        'steps': steps,
+        'error': error
+    }
+
+
+def run_maintenance(db, time_budget: float = 5.0, vacuum_step_pages: int = 256,
+                    full_vacuum: bool = False, checkpoint_mode: str = 'PASSIVE') -> Dict:
+    """
+    Maintain every file behind db (catalogue and shards when sharded).
+
+    Args:
+        db: MealDatabase, ShardedMealDatabase or WriteBehindMealDatabase
+        time_budget: Seconds shared by all files; steps past it are skipped
+        vacuum_step_pages: Pages freed per incremental_vacuum call
+        full_vacuum: Convert files without auto_vacuum with one full VACUUM
+        checkpoint_mode: PASSIVE (never waits), FULL, RESTART or TRUNCATE
+
+    Returns:
+        Dictionary with total elapsed time and one result per file
+    """
+    started = time.perf_counter()
+    deadline = started + time_budget
+    files = [maintain_file(file_db, deadline, vacuum_step_pages, full_vacuum, checkpoint_mode)
+             for file_db in _database_files(db)]
+    return {
+        'elapsed_seconds': round(time.perf_counter() - started, 3),
+        'time_budget': time_budget,
+        'files': files
+    }
+
+
+def maintenance_history(db, limit: int = 1) -> List[Dict]:
+    """Most recent recorded runs, newest first, for every file behind db"""
+    runs = []
+    for file_db in _database_files(db):
+        with file_db.read_connection() as conn:
+            rows = conn.execute('''
+                SELECT started_at, elapsed_seconds, page_size, page_count_before, page_count_after,
+                       freelist_before, freelist_after, wal_bytes_before, wal_bytes_after, steps, error
+                FROM maintenance_runs
+                ORDER BY id DESC
+                LIMIT ?
+            ''', (limit,)).fetchall()
+
+        for row in rows:
+            runs.append({
+                'db_path': file_db.db_path,
+                'started_at': row[0],
+                'elapsed_seconds': row[1],
+                'page_size': row[2],
+                'page_count_before': row[3],
+                'page_count_after': row[4],
+                'freelist_before': row[5],
+                'freelist_after': row[6],
+                'wal_bytes_before': row[7],
+                'wal_bytes_after': row[8],
+                'steps': json.loads(row[9]) if row[9] else {},
+                'error': row[10]
+            })
+    return runs
+
+
+def claim_scheduled_run(db, key: str, min_interval_seconds: float) -> bool:
+    """
+    Claim the next scheduled run of a background job for this process.
+
+    The claim is the db_meta row `key` in the first file behind db, read and
+    written under BEGIN IMMEDIATE, so of several processes asking at once
+    exactly one gets True. Later callers get False until
+    min_interval_seconds have passed since the winning claim.
+    """
+    file_db = _database_files(db)[0]
+    now = time.time()
+    with file_db.connection() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        row = conn.execute('SELECT value FROM db_meta WHERE key = ?', (key,)).fetchone()
+        if row and now - float(row[0]) < min_interval_seconds:
+            return False
+        conn.execute('''
+            INSERT INTO db_meta (key, value) VALUES (?, ?)
+            ON CONFLICT (key) DO UPDATE SET value = excluded.value
+        ''', (key, now))
+    return True
+
+
+def last_claimed_at(db, key: str) -> Optional[float]:
+    """Wall-clock time (seconds) of the last claim_scheduled_run claim for key, if any"""
+    with _database_files(db)[0].read_connection() as conn:
+        row = conn.execute('SELECT value FROM db_meta WHERE key = ?', (key,)).fetchone()
+    return float(row[0]) if row else None
+
+
+def claim_maintenance(db, min_interval_seconds: float) -> bool:
+    """Claim the next scheduled maintenance run of db (see claim_scheduled_run)"""
+    return claim_scheduled_run(db, _CLAIM_KEY, min_interval_seconds)
+
+
+def next_maintenance_due(db, interval_seconds: float) -> float:
+    """
+    Wall-clock time (seconds) the next scheduled maintenance run is due.
+
+    One interval after the later of the newest recorded run (manual ones
+    included) and the last claim; now if neither exists.
+    """
+    last = [datetime.fromisoformat(run['started_at']).timestamp()
+            for run in maintenance_history(db, limit=1)]
+    claimed = last_claimed_at(db, _CLAIM_KEY)
+    if claimed is not None:
+        last.append(claimed)
+    return max(last) + interval_seconds if last else time.time()
+
+
+class MaintenanceWorker:
+    """
+    Background thread that runs run_maintenance on an interval.
+
+    The schedule lives in the database (next_maintenance_due), so a restart
+    doesn't postpone the next run. Safe to run in every gunicorn worker at
+    once: each run first takes the claim_maintenance claim, so only one
+    worker per interval maintains the files.
+    """
+
+    def __init__(self, db, interval_seconds: float = 24 * 3600, time_budget: float = 5.0):
+        self.db = db
+        self.interval_seconds = interval_seconds
+        self.time_budget = time_budget
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def seconds_until_due(self) -> float:
+        """Seconds until the next scheduled run (0 if it is overdue)"""
+        return max(0.0, next_maintenance_due(self.db, self.interval_seconds) - time.time())
+
+    def run_once(self) -> Optional[Dict]:
+        """Maintain now unless another worker claimed this interval; returns the run_maintenance result"""
+        if not claim_maintenance(self.db, self.interval_seconds / 2):
+            return None
+        return run_maintenance(self.db, time_budget=self.time_budget)
+
+    def _run(self):
+        while True:
+            try:
+                wait = self.seconds_until_due()
+            except Exception as e:
+                print(f"❌ Database maintenance schedule unavailable: {e}")
+                wait = self.interval_seconds
+            if self._stop.wait(wait):
+                return
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"❌ Database maintenance failed: {e}")
+
+    def start(self) -> 'MaintenanceWorker':
+        """Start the background thread"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="db-maintenance", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None):
+        """Ask the thread to stop after the current run"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run SQLite maintenance on the meal database")
+    parser.add_argument('db_path', help="Database file (catalogue path when sharded)")
+    parser.add_argument('--shards', type=int, default=1, help="Number of shard files (default: 1)")
+    parser.add_argument('--budget', type=float, default=30.0, help="Time budget in seconds (default: 30)")
+    parser.add_argument('--full-vacuum', action='store_true',
+                        help="Convert files without auto_vacuum with one full VACUUM (ignores the budget)")
+    parser.add_argument('--checkpoint', default='PASSIVE', choices=CHECKPOINT_MODES,
+                        help="WAL checkpoint mode (default: PASSIVE)")
+    parser.add_argument('--profile', default=DEFAULT_STORAGE_PROFILE, help="Storage profile")
+    parser.add_argument('--history', type=int, metavar='N',
+                        help="Print the last N recorded runs instead of running")
+    args = parser.parse_args(argv)
+
+    db = open_meal_database(args.db_path, shards=args.shards, storage_profile=args.profile)
+    try:
+        if args.history:
+            for run in maintenance_history(db, limit=args.history):
+                print(json.dumps(run))
+            return 0
+
+        result = run_maintenance(db, time_budget=args.budget, full_vacuum=args.full_vacuum,
+                                 checkpoint_mode=args.checkpoint)
+    finally:
+        db.close()
+
+    failed = False
+    for run in result['files']:
+        size_before = run['page_count_before'] * run['page_size'] / 1024
+        size_after = run['page_count_after'] * run['page_size'] / 1024
+        status = "❌" if run['error'] else "✅"
+        failed = failed or bool(run['error'])
+        print(f"{status} {run['db_path']}: {size_before:,.0f} KiB -> {size_after:,.0f} KiB, "
+              f"freelist {run['freelist_before']} -> {run['freelist_after']} pages, "
+              f"{run['elapsed_seconds']:.2f}s")
+        for step, outcome in run['steps'].items():
+            print(f"   {step}: {outcome}")
+        if run['error']:
+            print(f"   error: {run['error']}")
+    print(f"Total {result['elapsed_seconds']:.2f}s of {result['time_budget']:.0f}s budget")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+"""
+Bulk import of meal history from .xlsx or .csv files.
+
+Rows are streamed (openpyxl read-only mode or the csv module) and written
+with log_meals in chunked transactions, so memory stays flat however long
+the file is. Columns are matched by header name; the layout written by
+export_to_excel imports as is. Meal tags are recomputed from the timestamps.
+
+Run from the command line:
+    python src/meal_import.py data/all_meals.xlsx --db data/user_meals.db
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+from storage_profiles import DEFAULT_STORAGE_PROFILE
+
+# Meal field -> accepted header names (compared lowercased and stripped)
+COLUMN_ALIASES = {
+    'phone_number': ('phone number', 'phone', 'phone_number', 'sender'),
+    'meal_description': ('original message', 'description', 'meal_description', 'message', 'meal'),
+    'timestamp': ('timestamp', 'logged at', 'date', 'time'),
+    'items_extracted': ('items extracted', 'items_extracted', 'items'),
+    'total_calories': ('total calories', 'total calories (kcal)', 'total_calories', 'calories'),
+    'total_protein': ('total protein', 'total protein (g)', 'total_protein', 'protein'),
+    'source': ('source',),
+}
+
+# "2x roti, 1x dal (unmatched: xyz)" as written by the webhook
+_ITEM_PATTERN = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*x\s+(.+?)\s*$')
+
+
+def _column_map(header: tuple) -> Dict[str, int]:
+    """Meal field -> column index, from a header row"""
+    names = [str(value).strip().lower() if value is not None else '' for value in header]
+    columns = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in names:
+                columns[field] = names.index(alias)
+                break
+    return columns
+
+
+def _parse_timestamp(value) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value
+    if value is None or str(value).strip() == '':
+        return None
+    try:
+        return datetime.fromisoformat(str(value).strip().replace('Z', '+00:00')).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+
+def _parse_number(value) -> float:
+    if value is None or (isinstance(value, str) and value.strip() == ''):
+        return 0.0
+    return float(value)
+
+
+def _items_from_text(items_extracted: str) -> str:
+    """parsed_items JSON from an "Items Extracted" cell, so meal_items gets per-food rows"""
+    items = []
+    for part in items_extracted.split(' (unmatched:')[0].split(','):
+        match = _ITEM_PATTERN.match(part)
+        if match:
+            items.append({'food': match.group(2), 'quantity': float(match.group(1))})
+    return json.dumps(items)
+
+
+def _iter_rows(path: str, sheet: Optional[str] = None) -> Iterator[tuple]:
+    """Yield raw rows (header first) from an .xlsx or .csv file"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.xlsx', '.xlsm'):
+        from openpyxl import load_workbook
+
+        # Read-only mode parses the sheet XML lazily, row by row
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            worksheet = workbook[sheet] if sheet else workbook.worksheets[0]
+            yield from worksheet.iter_rows(values_only=True)
+        finally:
+            workbook.close()
+    elif extension == '.csv':
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            yield from csv.reader(f)
+    else:
+        raise ValueError(f"Unsupported file type {extension!r} (expected .xlsx or .csv)")
+
+
+def iter_meal_records(path: str, phone_number: Optional[str] = None, source: Optional[str] = None,
+                      sheet: Optional[str] = None, stats: Optional[Dict] = None) -> Iterator[Dict]:
+    """
+    Stream log_meals records from a spreadsheet.
+
+    Args:
+        path: .xlsx or .csv file with a header row
+        phone_number: Phone number for every row (required if there's no phone column)
+        source: Source for every row (default: the source column, else "import")
+        sheet: Worksheet name for .xlsx (default: the first sheet)
+        stats: Optional dict that receives 'rows' and 'skipped' counts as rows are read
+
+    Raises:
+        ValueError: Unsupported file type, or required columns missing
+    """
+    stats = stats if stats is not None else {}
+    stats.setdefault('rows', 0)
+    stats.setdefault('skipped', 0)
+
+    rows = _iter_rows(path, sheet)
+    header = next(rows, None)
+    if header is None:
+        return
+
+    columns = _column_map(header)
+    missing = [field for field in ('timestamp', 'total_calories') if field not in columns]
+    if 'phone_number' not in columns and not phone_number:
+        missing.append('phone_number')
+    if missing:
+        raise ValueError(f"{path}: missing column(s) {', '.join(missing)}; "
+                         f"found {', '.join(str(value) for value in header)}")
+
+    def cell(row: tuple, field: str):
+        index = columns.get(field)
+        return row[index] if index is not None and index < len(row) else None
+
+    for row in rows:
+        if not any(value not in (None, '') for value in row):
+            continue  # blank line
+        stats['rows'] += 1
+
+        phone = phone_number or cell(row, 'phone_number')
+        timestamp = _parse_timestamp(cell(row, 'timestamp'))
+        try:
+            calories = _parse_number(cell(row, 'total_calories'))
+            protein = _parse_number(cell(row, 'total_protein'))
+        except (TypeError, ValueError):
+            calories = None
+        if not phone or timestamp is None or calories is None:
+            stats['skipped'] += 1
+            continue
+
+        items_extracted = str(cell(row, 'items_extracted') or '')
+        yield {
+            'phone_number': str(phone).strip(),
+            'meal_description': str(cell(row, 'meal_description') or ''),
+            'total_calories': calories,
+            'total_protein': protein,
+            'parsed_items': _items_from_text(items_extracted),
+            'items_extracted': items_extracted,
+            'source': source or cell(row, 'source') or 'import',
+            'timestamp': timestamp,
+        }
+
+
+def import_meals(db, path: str, phone_number: Optional[str] = None, source: Optional[str] = None,
+                 sheet: Optional[str] = None, chunk_size: int = 1000) -> Dict:
+    """
+    Import a spreadsheet of meals into db with log_meals.
+
+    Importing the same file twice logs its meals twice.
+
+    Returns:
+        Dictionary with rows read, meals imported, rows skipped and elapsed time
+    """
+    stats: Dict = {}
+    started = time.perf_counter()
+    imported = db.log_meals(iter_meal_records(path, phone_number, source, sheet, stats),
+                            chunk_size=chunk_size)
+    return {
+        'file': path,
+        'rows': stats.get('rows', 0),
+        'imported': imported,
+        'skipped': stats.get('skipped', 0),
+        'elapsed_seconds': round(time.perf_counter() - started, 3)
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Import meal history from .xlsx or .csv files")
+    parser.add_argument('files', nargs='+', help=".xlsx or .csv files with a header row")
+    parser.add_argument('--db', default='data/user_meals.db', help="Database file (catalogue path when sharded)")
+    parser.add_argument('--shards', type=int, default=1, help="Number of shard files (default: 1)")
+    parser.add_argument('--phone', help="Phone number for every row (when the file has no phone column)")
+    parser.add_argument('--source', help="Source recorded for every row (default: the file's source column)")
+    parser.add_argument('--sheet', help="Worksheet name (default: the first sheet)")
+    parser.add_argument('--chunk-size', type=int, default=5000, help="Meals per transaction (default: 5000)")
+    parser.add_argument('--profile', default=DEFAULT_STORAGE_PROFILE, help="Storage profile")
+    args = parser.parse_args(argv)
+
+    from sharding import open_meal_database
+
+    db = open_meal_database(args.db, shards=args.shards, storage_profile=args.profile)
+    failed = False
+    try:
+        for path in args.files:
+            try:
+                result = import_meals(db, path, phone_number=args.phone, source=args.source,
+                                      sheet=args.sheet, chunk_size=args.chunk_size)
+            except (OSError, ValueError) as e:
+                print(f"❌ {path}: {e}")
+                failed = True
+                continue
+            rate = result['rows'] / result['elapsed_seconds'] if result['elapsed_seconds'] else 0
+            print(f"✅ {path}: imported {result['imported']:,} meals, skipped {result['skipped']:,} "
+                  f"in {result['elapsed_seconds']:.1f}s ({rate:,.0f} rows/s)")
+    finally:
+        db.close()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
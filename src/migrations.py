@@ -0,0 +1,377 @@
+"""Versioned schema migrations for the meal database, tracked with PRAGMA user_version"""
+import sqlite3
+from typing import Callable, List, NamedTuple, Optional
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[[sqlite3.Connection], None]
+
+
+# Ordered registry; append new steps with the next version number and never
+# edit a step that has shipped. Steps must be self-contained SQL so they keep
+# working when the application code around them changes.
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, description: str):
+    """Register a function as the schema step that brings the database to `version`"""
+    def register(apply: Callable[[sqlite3.Connection], None]):
+        if MIGRATIONS and version != MIGRATIONS[-1].version + 1:
+            raise ValueError(f"Migration {version} registered out of order")
+        MIGRATIONS.append(Migration(version, description, apply))
+        return apply
+    return register
+
+
+def _column_names(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+
+
+@migration(1, "Base tables: users, meals, custom_foods")
+def _base_tables(conn: sqlite3.Connection):
+    # IF NOT EXISTS: databases created before versioning sit at user_version 0
+    # but already have these tables
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            phone_number TEXT PRIMARY KEY,
+            name TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS meals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            phone_number TEXT,
+            meal_description TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            total_calories REAL,
+            total_protein REAL,
+            parsed_items TEXT,
+            items_extracted TEXT,
+            source TEXT DEFAULT 'whatsapp',
+            FOREIGN KEY (phone_number) REFERENCES users(phone_number)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS custom_foods (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL,
+            aliases TEXT,
+            calories REAL NOT NULL,
+            protein REAL NOT NULL,
+            serving_size TEXT NOT NULL,
+            category TEXT DEFAULT 'custom',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+@migration(2, "meals.meal_tag column")
+def _meal_tag_column(conn: sqlite3.Connection):
+    if 'meal_tag' not in _column_names(conn, 'meals'):
+        conn.execute('ALTER TABLE meals ADD COLUMN meal_tag TEXT')
+
+
+@migration(3, "Index meals by (phone_number, timestamp)")
+def _meals_phone_timestamp_index(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_meals_phone_timestamp
+        ON meals (phone_number, timestamp)
+    ''')
+
+
+@migration(4, "daily_totals rollup table, backfilled from meals")
+def _daily_totals(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS daily_totals (
+            phone_number TEXT NOT NULL,
+            day TEXT NOT NULL,
+            meal_count INTEGER NOT NULL DEFAULT 0,
+            calories REAL NOT NULL DEFAULT 0,
+            protein REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (phone_number, day)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('DELETE FROM daily_totals')
+    conn.execute('''
+        INSERT INTO daily_totals (phone_number, day, meal_count, calories, protein)
+        SELECT phone_number, substr(timestamp, 1, 10), COUNT(*),
+               COALESCE(SUM(total_calories), 0), COALESCE(SUM(total_protein), 0)
+        FROM meals
+        GROUP BY phone_number, substr(timestamp, 1, 10)
+    ''')
+
+
+@migration(5, "meals.timestamp_epoch integer column, backfilled and indexed")
+def _timestamp_epoch(conn: sqlite3.Connection):
+    if 'timestamp_epoch' not in _column_names(conn, 'meals'):
+        conn.execute('ALTER TABLE meals ADD COLUMN timestamp_epoch INTEGER')
+
+    # The first 19 characters are the wall clock; strftime('%s') counts them as
+    # UTC and ignores any offset, matching to_epoch(). Legacy strings SQLite
+    # can't parse stay NULL: they have no day, so rollups skip them and
+    # newest-first reads list them last.
+    conn.execute('''
+        UPDATE meals
+        SET timestamp_epoch = CAST(strftime('%s', substr(timestamp, 1, 19)) AS INTEGER)
+        WHERE timestamp_epoch IS NULL
+    ''')
+    conn.execute('DROP INDEX IF EXISTS idx_meals_phone_timestamp')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_meals_phone_epoch
+        ON meals (phone_number, timestamp_epoch)
+    ''')
+
+    # Re-bucket the rollups by the epoch day so both always agree
+    conn.execute('DELETE FROM daily_totals')
+    conn.execute('''
+        INSERT INTO daily_totals (phone_number, day, meal_count, calories, protein)
+        SELECT phone_number, date(timestamp_epoch, 'unixepoch'), COUNT(*),
+               COALESCE(SUM(total_calories), 0), COALESCE(SUM(total_protein), 0)
+        FROM meals
+        WHERE timestamp_epoch IS NOT NULL
+        GROUP BY phone_number, timestamp_epoch / 86400
+    ''')
+
+
+@migration(6, "meals_archive cold tier and db_meta key/value table")
+def _meals_archive(conn: sqlite3.Connection):
+    # Same columns as meals; ids are carried over, so no AUTOINCREMENT here
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS meals_archive (
+            id INTEGER PRIMARY KEY,
+            phone_number TEXT,
+            meal_description TEXT,
+            timestamp TIMESTAMP,
+            total_calories REAL,
+            total_protein REAL,
+            parsed_items TEXT,
+            items_extracted TEXT,
+            source TEXT,
+            meal_tag TEXT,
+            timestamp_epoch INTEGER
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_meals_archive_phone_epoch
+        ON meals_archive (phone_number, timestamp_epoch)
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS db_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        ) WITHOUT ROWID
+    ''')
+
+
+@migration(7, "maintenance_runs history table")
+def _maintenance_runs(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS maintenance_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            started_at TEXT NOT NULL,
+            elapsed_seconds REAL NOT NULL,
+            page_size INTEGER,
+            page_count_before INTEGER,
+            page_count_after INTEGER,
+            freelist_before INTEGER,
+            freelist_after INTEGER,
+            wal_bytes_before INTEGER,
+            wal_bytes_after INTEGER,
+            steps TEXT,
+            error TEXT
+        )
+    ''')
+
+
+@migration(8, "meal_items child table, backfilled from parsed_items")
+def _meal_items(conn: sqlite3.Connection):
+    # phone_number and timestamp_epoch are copied from the meal so per-user and
+    # per-food totals over a date range are index range scans with no join.
+    # No foreign key: meal_id may point into meals or meals_archive.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS meal_items (
+            id INTEGER PRIMARY KEY,
+            meal_id INTEGER NOT NULL,
+            phone_number TEXT,
+            timestamp_epoch INTEGER,
+            food_name TEXT NOT NULL,
+            quantity REAL,
+            calories REAL,
+            protein REAL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_meal_items_meal ON meal_items (meal_id)')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_meal_items_phone_food
+        ON meal_items (phone_number, food_name, timestamp_epoch)
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_meal_items_food
+        ON meal_items (food_name, timestamp_epoch)
+    ''')
+
+    # Backfill in one INSERT ... SELECT: SQLite walks the meals with json_each
+    # row by row, so nothing is loaded into Python. parsed_items rarely has
+    # per-item nutrition; a single-item meal gets the meal totals.
+    conn.execute('''
+        WITH parsed AS (
+            SELECT m.id AS meal_id, m.phone_number, m.timestamp_epoch,
+                   m.total_calories, m.total_protein,
+                   lower(trim(COALESCE(NULLIF(json_extract(j.value, '$.name'), ''),
+                                       json_extract(j.value, '$.food')))) AS food_name,
+                   COALESCE(json_extract(j.value, '$.quantity'), 1) AS quantity,
+                   json_extract(j.value, '$.calories') AS calories,
+                   json_extract(j.value, '$.protein') AS protein
+            FROM (SELECT id, phone_number, timestamp_epoch, total_calories, total_protein,
+                         parsed_items FROM meals
+                  UNION ALL
+                  SELECT id, phone_number, timestamp_epoch, total_calories, total_protein,
+                         parsed_items FROM meals_archive) AS m,
+                 json_each(CASE WHEN json_valid(m.parsed_items)
+                                 AND json_type(m.parsed_items) = 'array'
+                                THEN m.parsed_items ELSE '[]' END) AS j
+            WHERE j.type = 'object'
+        )
+        INSERT INTO meal_items (meal_id, phone_number, timestamp_epoch, food_name,
+                                quantity, calories, protein)
+        SELECT meal_id, phone_number, timestamp_epoch, food_name, quantity,
+               COALESCE(calories, CASE WHEN COUNT(*) OVER w = 1 THEN total_calories END),
+               COALESCE(protein, CASE WHEN COUNT(*) OVER w = 1 THEN total_protein END)
+        FROM parsed
+        WHERE food_name IS NOT NULL AND food_name != ''
+        WINDOW w AS (PARTITION BY meal_id)
+    ''')
+
+
+@migration(9, "monthly_totals and yearly_totals rollups, derived from daily_totals")
+def _period_totals(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS monthly_totals (
+            phone_number TEXT NOT NULL,
+            month TEXT NOT NULL,
+            meal_count INTEGER NOT NULL DEFAULT 0,
+            days_with_meals INTEGER NOT NULL DEFAULT 0,
+            calories REAL NOT NULL DEFAULT 0,
+            protein REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (phone_number, month)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS yearly_totals (
+            phone_number TEXT NOT NULL,
+            year TEXT NOT NULL,
+            meal_count INTEGER NOT NULL DEFAULT 0,
+            days_with_meals INTEGER NOT NULL DEFAULT 0,
+            calories REAL NOT NULL DEFAULT 0,
+            protein REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (phone_number, year)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('DELETE FROM monthly_totals')
+    conn.execute('''
+        INSERT INTO monthly_totals (phone_number, month, meal_count, days_with_meals, calories, protein)
+        SELECT phone_number, substr(day, 1, 7), SUM(meal_count), COUNT(*), SUM(calories), SUM(protein)
+        FROM daily_totals
+        GROUP BY phone_number, substr(day, 1, 7)
+    ''')
+    conn.execute('DELETE FROM yearly_totals')
+    conn.execute('''
+        INSERT INTO yearly_totals (phone_number, year, meal_count, days_with_meals, calories, protein)
+        SELECT phone_number, substr(month, 1, 4), SUM(meal_count), SUM(days_with_meals),
+               SUM(calories), SUM(protein)
+        FROM monthly_totals
+        GROUP BY phone_number, substr(month, 1, 4)
+    ''')
+
+
+@migration(10, "custom_food_changes log: the custom food catalogue version")
+def _custom_food_changes(conn: sqlite3.Connection):
+    # Every add/delete appends a row; the highest version is the catalogue version
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS custom_food_changes (
+            version INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            action TEXT NOT NULL CHECK (action IN ('add', 'delete')),
+            changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # Existing foods count as added, so replaying from version 0 rebuilds the catalogue
+    conn.execute('''
+        INSERT INTO custom_food_changes (name, action)
+        SELECT name, 'add' FROM custom_foods ORDER BY id
+    ''')
+
+
+@migration(11, "backup_runs history table")
+def _backup_runs(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS backup_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            started_at TEXT NOT NULL,
+            elapsed_seconds REAL NOT NULL,
+            backup_path TEXT,
+            bytes INTEGER,
+            pages INTEGER,
+            steps INTEGER,
+            restarts INTEGER,
+            removed INTEGER,
+            integrity TEXT,
+            error TEXT
+        )
+    ''')
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """Return the schema version recorded in the database header"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def latest_version() -> int:
+    """Return the version the newest registered migration brings a database to"""
+    return MIGRATIONS[-1].version if MIGRATIONS else 0
+
+
+def migrate(conn: sqlite3.Connection, target: Optional[int] = None) -> List[int]:
+    """
+    Apply pending migrations in order, each in its own transaction.
+
+    An up-to-date database costs a single PRAGMA read. Each step takes the
+    write lock with BEGIN IMMEDIATE and re-checks the version, so several
+    gunicorn workers starting at once apply every step exactly once.
+
+    Args:
+        conn: Connection with no transaction open
+        target: Stop at this version (default: latest)
+
+    Returns:
+        Versions applied by this call
+    """
+    target = latest_version() if target is None else target
+    if get_schema_version(conn) >= target:
+        return []
+
+    applied = []
+    for step in MIGRATIONS:
+        if step.version > target:
+            break
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Another process may have applied it while we waited for the lock
+            if get_schema_version(conn) >= step.version:
+                conn.rollback()
+                continue
+
+            step.apply(conn)
+            conn.execute(f'PRAGMA user_version = {step.version}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        applied.append(step.version)
+
+    return applied
@@ -0,0 +1,308 @@
+"""
+Query timing for MealDatabase: per-method latency histograms and a slow-query log.
+
+Every public MealDatabase method is timed into a histogram keyed by method
+name. While a method runs, the statements it executes are timed too (on
+TimedConnection cursors). When a call takes longer than slow_query_ms, its
+slowest statements go into a bounded in-memory log, each with its SQL,
+parameters and EXPLAIN QUERY PLAN output.
+
+Read it in-process with db.get_query_stats() and db.get_slow_queries(). The
+app serves both on /metrics when METRICS_TOKEN is set, without parameters.
+"""
+import functools
+import heapq
+import inspect
+import itertools
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+# Histogram bucket upper bounds in milliseconds; the last bucket is unbounded
+BUCKET_BOUNDS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Statements kept per slow call (the slowest ones)
+SLOW_STATEMENTS_PER_CALL = 3
+
+# Longest string parameter kept in the slow-query log
+MAX_PARAM_LENGTH = 100
+
+# Statement trace of the method call running on this thread (None outside a call)
+_local = threading.local()
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram (milliseconds)"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+
+    def record(self, elapsed_ms: float):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        for i, bound in enumerate(BUCKET_BOUNDS_MS):
+            if elapsed_ms <= bound:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+    def merge(self, other: 'LatencyHistogram'):
+        self.count += other.count
+        self.total_ms += other.total_ms
+        self.max_ms = max(self.max_ms, other.max_ms)
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+
+    def percentile(self, fraction: float) -> float:
+        """Upper bound of the bucket holding the given fraction of calls (capped at the max)"""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKET_BOUNDS_MS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def to_dict(self) -> Dict:
+        labels = [str(bound) for bound in BUCKET_BOUNDS_MS] + ['+Inf']
+        return {
+            'count': self.count,
+            'total_ms': round(self.total_ms, 3),
+            'mean_ms': round(self.total_ms / self.count, 3) if self.count else 0.0,
+            'max_ms': round(self.max_ms, 3),
+            'p50_ms': round(self.percentile(0.50), 3),
+            'p95_ms': round(self.percentile(0.95), 3),
+            'p99_ms': round(self.percentile(0.99), 3),
+            'buckets': dict(zip(labels, self.buckets))
+        }
+
+
+class _CallTrace:
+    """Statements executed during one method call; keeps only the slowest few"""
+
+    def __init__(self):
+        self.statement_count = 0
+        self._slowest: List[tuple] = []
+
+    def add(self, sql: str, parameters, elapsed_ms: float, executemany: bool = False):
+        self.statement_count += 1
+        entry = (elapsed_ms, self.statement_count, sql, parameters, executemany)
+        if len(self._slowest) < SLOW_STATEMENTS_PER_CALL:
+            heapq.heappush(self._slowest, entry)
+        elif elapsed_ms > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, entry)
+
+    def slowest(self) -> List[tuple]:
+        return sorted(self._slowest, reverse=True)
+
+
+def _printable(value):
+    if isinstance(value, str) and len(value) > MAX_PARAM_LENGTH:
+        return value[:MAX_PARAM_LENGTH] + '...'
+    if isinstance(value, (bytes, memoryview)):
+        return f'<{len(value)} bytes>'
+    if value is None or isinstance(value, (int, float, str)):
+        return value
+    return str(value)
+
+
+def _printable_params(parameters):
+    if isinstance(parameters, dict):
+        return {key: _printable(value) for key, value in parameters.items()}
+    return [_printable(value) for value in parameters or ()]
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that reports each statement's execute time to the running method call"""
+
+    def execute(self, sql, parameters=()):
+        trace = getattr(_local, 'trace', None)
+        if trace is None:
+            return super().execute(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            trace.add(sql, parameters, (time.perf_counter() - started) * 1000)
+
+    def executemany(self, sql, seq_of_parameters):
+        trace = getattr(_local, 'trace', None)
+        if trace is None:
+            return super().executemany(sql, seq_of_parameters)
+        # Keep the first row for EXPLAIN without consuming a generator
+        rows = iter(seq_of_parameters)
+        first = next(rows, None)
+        if first is not None:
+            rows = itertools.chain([first], rows)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, rows)
+        finally:
+            trace.add(sql, first, (time.perf_counter() - started) * 1000, executemany=True)
+
+
+class TimedConnection(sqlite3.Connection):
+    """sqlite3 connection whose statements run on TimedCursor (pass as factory=)"""
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or TimedCursor)
+
+    # Connection.execute doesn't go through cursor(), so route it explicitly
+    # while a method call is being traced
+    def execute(self, sql, parameters=()):
+        if getattr(_local, 'trace', None) is None:
+            return super().execute(sql, parameters)
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if getattr(_local, 'trace', None) is None:
+            return super().executemany(sql, seq_of_parameters)
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class QueryStats:
+    """Thread-safe per-method histograms and a bounded slow-query log"""
+
+    def __init__(self, slow_query_ms: Optional[float] = 100.0, slow_log_size: int = 100):
+        """
+        Args:
+            slow_query_ms: Calls slower than this are logged (None disables the log)
+            slow_log_size: Most recent slow calls kept
+        """
+        self.slow_query_ms = slow_query_ms
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self._slow = deque(maxlen=slow_log_size)
+
+    def record(self, method: str, elapsed_ms: float):
+        with self._lock:
+            histogram = self._histograms.get(method)
+            if histogram is None:
+                histogram = self._histograms[method] = LatencyHistogram()
+            histogram.record(elapsed_ms)
+
+    def log_slow(self, entry: Dict):
+        with self._lock:
+            self._slow.append(entry)
+
+    def histograms(self) -> Dict[str, LatencyHistogram]:
+        """Copies of the histograms, safe to merge or read without the lock"""
+        with self._lock:
+            copies = {}
+            for method, histogram in self._histograms.items():
+                copies[method] = LatencyHistogram()
+                copies[method].merge(histogram)
+            return copies
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Histogram summary per method, slowest total time first"""
+        return summarize(self.histograms())
+
+    def slow_queries(self, limit: Optional[int] = None) -> List[Dict]:
+        """Logged slow calls, newest first"""
+        with self._lock:
+            entries = list(reversed(self._slow))
+        return entries[:limit] if limit else entries
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._slow.clear()
+
+
+def summarize(histograms: Dict[str, LatencyHistogram]) -> Dict[str, Dict]:
+    """Histogram dicts per method, slowest total time first"""
+    ordered = sorted(histograms.items(), key=lambda item: item[1].total_ms, reverse=True)
+    return {method: histogram.to_dict() for method, histogram in ordered}
+
+
+def combine(stats: List[QueryStats]) -> Dict[str, Dict]:
+    """Merge the histograms of several QueryStats (e.g. every shard) into one summary"""
+    merged: Dict[str, LatencyHistogram] = {}
+    for item in stats:
+        for method, histogram in item.histograms().items():
+            merged.setdefault(method, LatencyHistogram()).merge(histogram)
+    return summarize(merged)
+
+
+def _explain(db, sql: str, parameters) -> List[str]:
+    """EXPLAIN QUERY PLAN detail lines for a statement, or the error it raised"""
+    if not sql.lstrip().upper().startswith(('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')):
+        return []
+    try:
+        with db.read_pool.connection(shared=False) as conn:
+            rows = conn.execute('EXPLAIN QUERY PLAN ' + sql, parameters or ()).fetchall()
+        return [row[3] for row in rows]
+    except Exception as e:
+        return [f'EXPLAIN failed: {e}']
+
+
+def _slow_entry(db, method: str, elapsed_ms: float, trace: _CallTrace) -> Dict:
+    statements = []
+    for statement_ms, _, sql, parameters, executemany in trace.slowest():
+        statements.append({
+            'sql': ' '.join(sql.split()),
+            'parameters': _printable_params(parameters),
+            'executemany': executemany,
+            'elapsed_ms': round(statement_ms, 3),
+            'plan': _explain(db, sql, parameters)
+        })
+    return {
+        'method': method,
+        'db_path': db.db_path,
+        'at': datetime.now().isoformat(),
+        'elapsed_ms': round(elapsed_ms, 3),
+        'statement_count': trace.statement_count,
+        'statements': statements
+    }
+
+
+def _timed(name: str, func: Callable) -> Callable:
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        stats: Optional[QueryStats] = getattr(self, 'query_stats', None)
+        if stats is None:
+            return func(self, *args, **kwargs)
+
+        # Nested calls (get_daily_summary -> get_range_summary) get their own
+        # histogram entry; statements and the slow log belong to the outer call.
+        # With the log off, statements aren't traced at all.
+        traced = stats.slow_query_ms is not None and getattr(_local, 'trace', None) is None
+        if traced:
+            _local.trace = _CallTrace()
+        started = time.perf_counter()
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            stats.record(name, elapsed_ms)
+            if traced:
+                trace, _local.trace = _local.trace, None
+                if elapsed_ms > stats.slow_query_ms:
+                    stats.log_slow(_slow_entry(self, name, elapsed_ms, trace))
+    return wrapper
+
+
+def instrument(exclude=()):
+    """
+    Class decorator: time every public method defined on the class.
+
+    Generator methods are left alone (a call only builds the generator);
+    they're timed through whichever method consumes them.
+    """
+    def decorate(cls):
+        for name, member in list(vars(cls).items()):
+            if (name.startswith('_') or name in exclude or not inspect.isfunction(member)
+                    or inspect.isgeneratorfunction(member)):
+                continue
+            setattr(cls, name, _timed(name, member))
+        return cls
+    return decorate
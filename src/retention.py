@@ -0,0 +1,107 @@
+"""
+Hot/cold retention: periodically move old meals into the meals_archive table.
+
+Run once from the command line:
+    python src/retention.py data/user_meals.db --days 365
+
+Or in the app by setting MEAL_RETENTION_DAYS (checked every
+MEAL_RETENTION_INTERVAL_HOURS, default 6).
+"""
+import argparse
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from storage_profiles import DEFAULT_STORAGE_PROFILE
+
+
+class RetentionWorker:
+    """
+    Background thread that calls db.archive_meals on an interval.
+
+    Safe to run in every gunicorn worker at once: each archive batch is a
+    single transaction that moves rows out of meals, so overlapping runs
+    just find less to do.
+    """
+
+    def __init__(self, db, older_than_days: int, interval_seconds: float = 6 * 3600,
+                 batch_size: int = 1000):
+        """
+        Args:
+            db: MealDatabase or ShardedMealDatabase
+            older_than_days: Meals older than this many days are archived
+            interval_seconds: Pause between runs
+            batch_size: Meals moved per transaction
+        """
+        if older_than_days < 1:
+            raise ValueError("older_than_days must be at least 1")
+
+        self.db = db
+        self.older_than_days = older_than_days
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self.last_run: Optional[Dict] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self) -> Dict:
+        """Archive now and remember the outcome"""
+        started = time.perf_counter()
+        try:
+            result = self.db.archive_meals(self.older_than_days, batch_size=self.batch_size)
+        except Exception as e:
+            result = {'error': str(e)}
+            print(f"❌ Meal retention run failed: {e}")
+        result['elapsed_seconds'] = round(time.perf_counter() - started, 3)
+        result['finished_at'] = datetime.now().isoformat()
+        self.last_run = result
+        return result
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.run_once()
+            self._stop.wait(self.interval_seconds)
+
+    def start(self) -> 'RetentionWorker':
+        """Start the background thread (first run happens immediately)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="meal-retention", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None):
+        """Ask the thread to stop after the current run"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Move old meals into the archive table")
+    parser.add_argument('db_path', help="Database file (catalogue path when sharded)")
+    parser.add_argument('--days', type=int, required=True, help="Keep this many days in the hot table")
+    parser.add_argument('--shards', type=int, default=1, help="Number of shard files (default: 1)")
+    parser.add_argument('--batch-size', type=int, default=1000, help="Meals moved per transaction")
+    parser.add_argument('--profile', default=DEFAULT_STORAGE_PROFILE, help="Storage profile")
+    args = parser.parse_args(argv)
+
+    from sharding import open_meal_database
+
+    db = open_meal_database(args.db_path, shards=args.shards, storage_profile=args.profile)
+    try:
+        result = RetentionWorker(db, args.days, batch_size=args.batch_size).run_once()
+    finally:
+        db.close()
+
+    if 'error' in result:
+        return 1
+    print(f"✅ Archived {result['archived']} meals from {result['users']} users "
+          f"older than {result['boundary']} in {result['elapsed_seconds']:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,385 @@
+"""
+Per-user sharding of the meal database across several SQLite files.
+
+Each user's users, meals, meal_items and rollup rows live in one shard file
+chosen by a stable hash of the phone number, so writes for different users can
+commit in parallel. custom_foods lives in a shared catalogue database at the base path.
+
+Split an existing single-file database into shards:
+    python src/sharding.py split data/user_meals.db data/sharded/user_meals.db --shards 4
+"""
+import argparse
+import heapq
+import os
+import sqlite3
+import sys
+import zlib
+from datetime import datetime
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from database import MealDatabase, _newest_first_key
+from query_stats import combine
+from storage_profiles import DEFAULT_STORAGE_PROFILE
+
+
+def shard_index(phone_number: str, shard_count: int) -> int:
+    """Stable shard number for a user (crc32, so it never changes between processes)"""
+    return zlib.crc32(phone_number.encode('utf-8')) % shard_count
+
+
+def shard_path(db_path: str, index: int, shard_count: int) -> str:
+    """
+    File holding shard `index` of `shard_count`
+
+    The count is part of the name so opening with a different DATABASE_SHARDS
+    starts empty shards instead of silently routing users to the wrong file.
+    """
+    root, ext = os.path.splitext(db_path)
+    return f"{root}.shard{index}of{shard_count}{ext or '.db'}"
+
+
+class ShardedMealDatabase:
+    """
+    MealDatabase API over N shard files plus a shared catalogue.
+
+    Per-user calls go to the user's shard only. Cross-user reads fan out to
+    every shard and merge newest first. Custom foods go to the catalogue.
+    """
+
+    def __init__(self, db_path: str = "data/user_meals.db", shard_count: int = 4,
+                 max_connections: int = 8, storage_profile: str = DEFAULT_STORAGE_PROFILE,
+                 known_users_cache_size: int = 10000, slow_query_ms: Optional[float] = 100.0):
+        """
+        Args:
+            db_path: Catalogue database path; shard files are created next to it
+            shard_count: Number of shard files
+            max_connections: Pool size of each shard and of the catalogue
+            storage_profile: Storage profile applied to every file
+            known_users_cache_size: Known-user cache size of each shard
+            slow_query_ms: Slow-query log threshold of every file
+        """
+        if shard_count < 1:
+            raise ValueError("shard_count must be at least 1")
+
+        self.db_path = db_path
+        self.shard_count = shard_count
+        self.storage_profile = storage_profile
+        self.catalogue = MealDatabase(db_path=db_path, max_connections=max_connections,
+                                      storage_profile=storage_profile,
+                                      known_users_cache_size=0,
+                                      slow_query_ms=slow_query_ms)
+        self.shards = [
+            MealDatabase(db_path=shard_path(db_path, i, shard_count),
+                         max_connections=max_connections,
+                         storage_profile=storage_profile,
+                         known_users_cache_size=known_users_cache_size,
+                         slow_query_ms=slow_query_ms)
+            for i in range(shard_count)
+        ]
+
+    def shard_for(self, phone_number: str) -> MealDatabase:
+        """Return the shard that owns a user's rows"""
+        return self.shards[shard_index(phone_number, self.shard_count)]
+
+    def close(self):
+        """Close every shard and the catalogue"""
+        for shard in self.shards:
+            shard.close()
+        self.catalogue.close()
+
+    def init_database(self):
+        """Apply pending schema migrations to the catalogue and every shard"""
+        self.catalogue.init_database()
+        for shard in self.shards:
+            shard.init_database()
+
+    def get_schema_version(self) -> int:
+        """Lowest schema version across the catalogue and shards"""
+        return min(db.get_schema_version() for db in [self.catalogue] + self.shards)
+
+    def get_storage_settings(self) -> Dict:
+        """Storage settings of the catalogue, plus the shard count"""
+        settings = self.catalogue.get_storage_settings()
+        settings['shards'] = self.shard_count
+        return settings
+
+    def get_query_stats(self) -> Dict[str, Dict]:
+        """Method latency histograms merged across the catalogue and shards"""
+        return combine([db.query_stats for db in [self.catalogue] + self.shards])
+
+    def get_slow_queries(self, limit: Optional[int] = None) -> List[Dict]:
+        """Slow calls from every file, newest first"""
+        entries = [entry for db in [self.catalogue] + self.shards for entry in db.get_slow_queries()]
+        entries.sort(key=lambda entry: entry['at'], reverse=True)
+        return entries[:limit] if limit else entries
+
+    def reset_query_stats(self):
+        """Clear the histograms and slow-query log of every file"""
+        for db in [self.catalogue] + self.shards:
+            db.reset_query_stats()
+
+    # ------------------------------------------------------------------
+    # Per-user operations: routed to one shard
+    # ------------------------------------------------------------------
+
+    def add_user(self, phone_number: str, name: Optional[str] = None):
+        return self.shard_for(phone_number).add_user(phone_number, name)
+
+    def log_meal(self, phone_number: str, *args, **kwargs):
+        return self.shard_for(phone_number).log_meal(phone_number, *args, **kwargs)
+
+    def get_range_summary(self, phone_number: str, *args, **kwargs) -> Dict:
+        return self.shard_for(phone_number).get_range_summary(phone_number, *args, **kwargs)
+
+    def get_daily_summary(self, phone_number: str, *args, **kwargs) -> Dict:
+        return self.shard_for(phone_number).get_daily_summary(phone_number, *args, **kwargs)
+
+    def get_recent_meals(self, phone_number: str, *args, **kwargs) -> List[Dict]:
+        return self.shard_for(phone_number).get_recent_meals(phone_number, *args, **kwargs)
+
+    def get_meal_history(self, phone_number: str, *args, **kwargs) -> Dict:
+        return self.shard_for(phone_number).get_meal_history(phone_number, *args, **kwargs)
+
+    def delete_last_meal(self, phone_number: str) -> Dict:
+        return self.shard_for(phone_number).delete_last_meal(phone_number)
+
+    def get_weekly_summary(self, phone_number: str) -> Dict:
+        return self.shard_for(phone_number).get_weekly_summary(phone_number)
+
+    def get_weekly_breakdown(self, phone_number: str) -> Dict:
+        return self.shard_for(phone_number).get_weekly_breakdown(phone_number)
+
+    def get_daily_breakdown(self, phone_number: str, *args, **kwargs) -> Dict:
+        return self.shard_for(phone_number).get_daily_breakdown(phone_number, *args, **kwargs)
+
+    def get_monthly_summary(self, phone_number: str, *args, **kwargs) -> Dict:
+        return self.shard_for(phone_number).get_monthly_summary(phone_number, *args, **kwargs)
+
+    def get_yearly_summary(self, phone_number: str, *args, **kwargs) -> Dict:
+        return self.shard_for(phone_number).get_yearly_summary(phone_number, *args, **kwargs)
+
+    def log_meals(self, meals: Iterable[Dict], chunk_size: int = 1000) -> int:
+        """Bulk-log meals, buffering records per shard and writing full chunks"""
+        buffers: List[List[Dict]] = [[] for _ in self.shards]
+        inserted = 0
+
+        for record in meals:
+            index = shard_index(record['phone_number'], self.shard_count)
+            buffers[index].append(record)
+            if len(buffers[index]) >= chunk_size:
+                inserted += self.shards[index].log_meals(buffers[index], chunk_size)
+                buffers[index] = []
+
+        for shard, buffer in zip(self.shards, buffers):
+            if buffer:
+                inserted += shard.log_meals(buffer, chunk_size)
+
+        return inserted
+
+    # ------------------------------------------------------------------
+    # Cross-user operations: fan out and merge
+    # ------------------------------------------------------------------
+
+    def iter_meals(self, phone_number: Optional[str] = None, limit: Optional[int] = None,
+                   start=None, end=None, chunk_size: int = 500) -> Iterator[Dict]:
+        """
+        Stream meals newest first; without a phone number, merge every shard.
+
+        Each shard already returns its meals in (timestamp_epoch, id) order, so
+        a k-way merge on the same key keeps memory at one chunk per shard.
+        """
+        if phone_number:
+            yield from self.shard_for(phone_number).iter_meals(
+                phone_number=phone_number, limit=limit, start=start, end=end,
+                chunk_size=chunk_size)
+            return
+
+        streams = [
+            shard._iter_meal_entries(None, limit, start, end, chunk_size)
+            for shard in self.shards
+        ]
+        merged = heapq.merge(*streams, key=_newest_first_key, reverse=True)
+        try:
+            for _, _, meal in islice(merged, limit) if limit else merged:
+                yield meal
+        finally:
+            for stream in streams:
+                stream.close()
+
+    def get_all_meals(self, phone_number: Optional[str] = None, limit: Optional[int] = None) -> List[Dict]:
+        """Get all meals for export or analysis (use iter_meals for large exports)"""
+        return list(self.iter_meals(phone_number=phone_number, limit=limit))
+
+    # Only reads rows through self.iter_meals, so the single-file exporter works as is
+    export_to_excel = MealDatabase.export_to_excel
+
+    # Only writes through self.log_meals, which routes each meal to its shard
+    import_meals = MealDatabase.import_meals
+
+    def get_food_totals(self, phone_number: Optional[str] = None, food_name: Optional[str] = None,
+                        start=None, end=None) -> List[Dict]:
+        """Per-food totals: one shard for a user, otherwise every shard summed per food"""
+        if phone_number:
+            return self.shard_for(phone_number).get_food_totals(phone_number, food_name, start, end)
+
+        # Users live in exactly one shard, so meal counts add up across shards
+        summed = ('meal_count', 'quantity', 'calories', 'protein', 'known_nutrition_meals')
+        merged: Dict[str, Dict] = {}
+        for shard in self.shards:
+            for row in shard.get_food_totals(None, food_name, start, end):
+                total = merged.setdefault(row['food_name'],
+                                          dict(food_name=row['food_name'], **{key: 0 for key in summed}))
+                for key in summed:
+                    total[key] = round(total[key] + row[key], 2)
+        return sorted(merged.values(), key=lambda row: (-row['quantity'], row['food_name']))
+
+    def rebuild_daily_totals(self) -> int:
+        """Rebuild the rollups of every shard; returns total rollup rows written"""
+        return sum(shard.rebuild_daily_totals() for shard in self.shards)
+
+    def verify_daily_totals(self, repair: bool = False, tolerance: float = 0.01) -> Dict:
+        """Verify (and optionally repair) the rollups of every shard"""
+        reports = [shard.verify_daily_totals(repair=repair, tolerance=tolerance)
+                   for shard in self.shards]
+        return {
+            'rows_checked': sum(report['rows_checked'] for report in reports),
+            'drifted': [key for report in reports for key in report['drifted']],
+            'repaired': any(report['repaired'] for report in reports)
+        }
+
+    def archive_meals(self, older_than_days: int, batch_size: int = 1000,
+                      now: Optional[datetime] = None) -> Dict:
+        """Move old meals into each shard's archive table"""
+        results = [shard.archive_meals(older_than_days, batch_size=batch_size, now=now)
+                   for shard in self.shards]
+        return {
+            'archived': sum(result['archived'] for result in results),
+            'users': sum(result['users'] for result in results),
+            'boundary': results[0]['boundary']
+        }
+
+    # ------------------------------------------------------------------
+    # Shared catalogue
+    # ------------------------------------------------------------------
+
+    def add_custom_food(self, *args, **kwargs) -> Dict:
+        return self.catalogue.add_custom_food(*args, **kwargs)
+
+    def get_all_custom_foods(self) -> List[Dict]:
+        return self.catalogue.get_all_custom_foods()
+
+    def get_custom_food_changes(self, since_version: int = 0) -> Dict:
+        return self.catalogue.get_custom_food_changes(since_version)
+
+    def delete_custom_food(self, name: str) -> Dict:
+        return self.catalogue.delete_custom_food(name)
+
+
+def open_meal_database(db_path: str = "data/user_meals.db", shards: int = 1, **kwargs):
+    """Open a single-file MealDatabase, or a ShardedMealDatabase when shards > 1"""
+    if shards > 1:
+        return ShardedMealDatabase(db_path=db_path, shard_count=shards, **kwargs)
+    return MealDatabase(db_path=db_path, **kwargs)
+
+
+def split_database(source_path: str, target_path: str, shard_count: int,
+                   batch_size: int = 5000) -> Dict:
+    """
+    Copy a single-file database into a sharded layout at target_path.
+
+    Rows (hot and archived meals) keep their ids, timestamps and created_at values. The source is
+    upgraded to the current schema first and is otherwise left untouched.
+
+    Returns:
+        Dictionary with the number of users, meals and custom foods copied
+    """
+    if not os.path.exists(source_path):
+        raise FileNotFoundError(source_path)
+
+    existing = [path for path in [target_path] + [shard_path(target_path, i, shard_count)
+                                                  for i in range(shard_count)]
+                if os.path.exists(path)]
+    if existing:
+        raise FileExistsError(f"Target files already exist: {', '.join(existing)}")
+
+    MealDatabase(db_path=source_path).close()
+    target = ShardedMealDatabase(db_path=target_path, shard_count=shard_count)
+    source = sqlite3.connect(source_path)
+
+    def copy_table(table: str, route: bool) -> int:
+        columns = [row[1] for row in source.execute(f'PRAGMA table_info({table})')]
+        column_list = ', '.join(columns)
+        insert = (f'INSERT INTO {table} ({column_list}) '
+                  f'VALUES ({", ".join("?" for _ in columns)})')
+        phone_column = columns.index('phone_number') if route else None
+
+        copied = 0
+        cursor = source.execute(f'SELECT {column_list} FROM {table} ORDER BY rowid')
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            if route:
+                by_shard: Dict[int, List[tuple]] = {}
+                for row in rows:
+                    by_shard.setdefault(shard_index(row[phone_column], shard_count), []).append(row)
+                for index, shard_rows in by_shard.items():
+                    with target.shards[index].connection() as conn:
+                        conn.executemany(insert, shard_rows)
+            else:
+                with target.catalogue.connection() as conn:
+                    conn.executemany(insert, rows)
+            copied += len(rows)
+        return copied
+
+    try:
+        result = {
+            'users': copy_table('users', route=True),
+            'meals': copy_table('meals', route=True),
+            'archived_meals': copy_table('meals_archive', route=True),
+            'meal_items': copy_table('meal_items', route=True),
+            'custom_foods': copy_table('custom_foods', route=False),
+            'custom_food_changes': copy_table('custom_food_changes', route=False),
+        }
+
+        # The archive boundary holds for every shard's slice of meals_archive
+        meta = source.execute('SELECT key, value FROM db_meta').fetchall()
+        for shard in target.shards:
+            with shard.connection() as conn:
+                conn.executemany('INSERT OR REPLACE INTO db_meta (key, value) VALUES (?, ?)', meta)
+
+        # Rollups are derived data; recompute them per shard
+        result['daily_totals'] = target.rebuild_daily_totals()
+        return result
+    finally:
+        source.close()
+        target.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Meal database sharding tools")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    split = commands.add_parser('split', help="Split a single-file database into shards")
+    split.add_argument('source', help="Existing single-file database")
+    split.add_argument('target', help="Catalogue path of the new sharded layout")
+    split.add_argument('--shards', type=int, required=True, help="Number of shard files")
+
+    args = parser.parse_args(argv)
+
+    started = datetime.now()
+    result = split_database(args.source, args.target, args.shards)
+    elapsed = (datetime.now() - started).total_seconds()
+
+    print(f"✅ Split {args.source} into {args.shards} shards in {elapsed:.1f}s")
+    print(f"   users: {result['users']}, meals: {result['meals']}, "
+          f"custom foods: {result['custom_foods']}, rollup rows: {result['daily_totals']}")
+    for i in range(args.shards):
+        print(f"   {shard_path(args.target, i, args.shards)}")
+    print(f"   Run the app with DATABASE_PATH={args.target} DATABASE_SHARDS={args.shards}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""Named SQLite storage profiles for the meal database"""
+import sqlite3
+from typing import Dict
+
+
+# Each profile sets:
+#   journal_mode  - persistent, applied once when the database is opened
+#   synchronous   - how often SQLite waits for fsync (FULL is safest, NORMAL is safe in WAL)
+#   busy_timeout  - milliseconds to wait on a locked database before failing
+#   mmap_size     - bytes of the file to memory-map for reads (0 disables)
+#   cache_size    - page cache per connection; negative values are KiB
+STORAGE_PROFILES: Dict[str, Dict] = {
+    # SQLite defaults as the app used them before profiles existed
+    'legacy': {
+        'journal_mode': 'delete',
+        'synchronous': 'full',
+        'busy_timeout': 5000,
+        'mmap_size': 0,
+        'cache_size': -2000,
+    },
+    # Readers don't block writers; suits several gunicorn workers on one file
+    'concurrent': {
+        'journal_mode': 'wal',
+        'synchronous': 'normal',
+        'busy_timeout': 5000,
+        'mmap_size': 64 * 1024 * 1024,
+        'cache_size': -16384,
+    },
+    # WAL concurrency, but fsync on every commit
+    'durable': {
+        'journal_mode': 'wal',
+        'synchronous': 'full',
+        'busy_timeout': 10000,
+        'mmap_size': 64 * 1024 * 1024,
+        'cache_size': -16384,
+    },
+}
+
+DEFAULT_STORAGE_PROFILE = 'concurrent'
+
+_SYNCHRONOUS_NAMES = {0: 'off', 1: 'normal', 2: 'full', 3: 'extra'}
+
+
+def get_storage_profile(name: str) -> Dict:
+    """Look up a storage profile by name"""
+    try:
+        return STORAGE_PROFILES[name.lower()]
+    except KeyError:
+        raise ValueError(
+            f"Unknown storage profile '{name}'. "
+            f"Choose from: {', '.join(sorted(STORAGE_PROFILES))}"
+        )
+
+
+def apply_journal_mode(conn: sqlite3.Connection, profile: Dict) -> str:
+    """Switch the database journal mode; returns the mode SQLite actually chose"""
+    return conn.execute(f"PRAGMA journal_mode = {profile['journal_mode']}").fetchone()[0]
+
+
+def apply_connection_pragmas(conn: sqlite3.Connection, profile: Dict):
+    """Apply the per-connection settings of a profile to a freshly opened connection"""
+    conn.execute(f"PRAGMA synchronous = {profile['synchronous']}")
+    conn.execute(f"PRAGMA busy_timeout = {int(profile['busy_timeout'])}")
+    conn.execute(f"PRAGMA mmap_size = {int(profile['mmap_size'])}")
+    conn.execute(f"PRAGMA cache_size = {int(profile['cache_size'])}")
+
+
+def read_storage_settings(conn: sqlite3.Connection) -> Dict:
+    """Read back the settings actually in effect on a connection"""
+    synchronous = conn.execute("PRAGMA synchronous").fetchone()[0]
+    return {
+        'journal_mode': conn.execute("PRAGMA journal_mode").fetchone()[0],
+        'synchronous': _SYNCHRONOUS_NAMES.get(synchronous, str(synchronous)),
+        'busy_timeout': conn.execute("PRAGMA busy_timeout").fetchone()[0],
+        'mmap_size': conn.execute("PRAGMA mmap_size").fetchone()[0],
+        'cache_size': conn.execute("PRAGMA cache_size").fetchone()[0],
+    }
@@ -0,0 +1,288 @@
+"""Write-behind meal logging: queue meals in memory and group-commit them off the request path"""
+import atexit
+import functools
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from database import MealDatabase
+from sharding import ShardedMealDatabase
+
+
+# Reads that only touch one user's rows: flush that user's pending meals first
+_PER_USER_READS = (
+    'get_range_summary',
+    'get_daily_summary',
+    'get_recent_meals',
+    'get_meal_history',
+    'delete_last_meal',
+    'get_weekly_summary',
+    'get_weekly_breakdown',
+    'get_daily_breakdown',
+    'get_monthly_summary',
+    'get_yearly_summary',
+    'get_food_totals',
+)
+
+# Calls that read or rewrite many users' rows: flush everything first
+_CROSS_USER_CALLS = (
+    'log_meals',
+    'iter_meals',
+    'get_all_meals',
+    'export_to_excel',
+    'import_meals',
+    'rebuild_daily_totals',
+    'verify_daily_totals',
+)
+
+
+class WriteBehindMealDatabase:
+    """
+    Wraps a MealDatabase (or ShardedMealDatabase) so log_meal returns at once.
+
+    Meals go onto an in-process queue. A background flusher writes them with
+    log_meals, one transaction per batch, when flush_interval has passed since
+    the oldest pending meal or max_batch meals are waiting, whichever comes
+    first. One fsync then covers many webhook requests.
+
+    Read-your-writes: any read of a user's data first waits until that
+    user's queued meals are committed, so "total" right after logging a meal
+    includes it. Pending meals are flushed by close() and at interpreter
+    exit; meals still queued when the process is killed outright are lost,
+    which is the trade-off this mode makes.
+    """
+
+    def __init__(self, db, flush_interval: float = 0.005, max_batch: int = 500):
+        """
+        Args:
+            db: MealDatabase or ShardedMealDatabase that receives the meals
+            flush_interval: Seconds a queued meal may wait before its batch is written
+            max_batch: Write as soon as this many meals are queued
+        """
+        if max_batch < 1:
+            raise ValueError("max_batch must be at least 1")
+
+        self.db = db
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+
+        self._cond = threading.Condition()
+        self._pending: List[tuple] = []       # (seq, record)
+        self._pending_by_user: Dict[str, int] = {}  # phone -> newest queued seq
+        self._enqueued_seq = 0
+        self._committed_seq = 0
+        self._flush_requested = False
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._stats = {'batches': 0, 'meals_written': 0, 'meals_failed': 0}
+
+        atexit.register(self.close)
+
+    def _ensure_flusher(self):
+        # Called with self._cond held. Threads don't survive fork, so a worker
+        # forked from a preloaded app starts its own flusher on first use.
+        if self._thread is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="meal-write-behind", daemon=True)
+            self._thread.start()
+
+    def log_meal(self, phone_number: str, meal_description: str,
+                 total_calories: float, total_protein: float,
+                 parsed_items: str, items_extracted: str = "",
+                 source: str = "whatsapp", timestamp: datetime = None,
+                 items: Optional[List[Dict]] = None):
+        """Queue a meal; it is committed by the flusher within flush_interval"""
+        record = {
+            'phone_number': phone_number,
+            'meal_description': meal_description,
+            'total_calories': total_calories,
+            'total_protein': total_protein,
+            'parsed_items': parsed_items,
+            'items_extracted': items_extracted,
+            'source': source,
+            # Stamp now, not when the batch is written
+            'timestamp': timestamp if timestamp is not None else datetime.now(),
+            'items': items,
+        }
+
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("WriteBehindMealDatabase is closed")
+            self._ensure_flusher()
+            self._enqueued_seq += 1
+            self._pending.append((self._enqueued_seq, record))
+            self._pending_by_user[phone_number] = self._enqueued_seq
+            self._cond.notify_all()
+
+    def flush(self, phone_number: Optional[str] = None, timeout: Optional[float] = None) -> bool:
+        """
+        Block until queued meals are committed.
+
+        Args:
+            phone_number: Only wait for this user's meals (default: all queued meals)
+            timeout: Give up after this many seconds
+
+        Returns:
+            True if the meals were committed (or nothing was pending)
+        """
+        with self._cond:
+            if phone_number is None:
+                target = self._enqueued_seq
+            else:
+                target = self._pending_by_user.get(phone_number, 0)
+
+            if self._committed_seq >= target:
+                return True
+
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                # No flusher in this process (e.g. after close): write inline
+                self._write_pending_locked()
+                return True
+
+            self._flush_requested = True
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: self._committed_seq >= target, timeout=timeout)
+
+    def _take_batch_locked(self) -> List[tuple]:
+        batch = self._pending[:self.max_batch]
+        del self._pending[:self.max_batch]
+        return batch
+
+    def _file_groups(self, records: List[Dict]) -> List[tuple]:
+        """Split records into (MealDatabase, records) per database file, in queue order"""
+        if not isinstance(self.db, ShardedMealDatabase):
+            return [(self.db, records)]
+        groups: Dict[int, tuple] = {}
+        for record in records:
+            shard = self.db.shard_for(record['phone_number'])
+            groups.setdefault(id(shard), (shard, []))[1].append(record)
+        return list(groups.values())
+
+    def _write_batch(self, batch: List[tuple]):
+        """
+        Write one batch outside the lock; fall back to per-meal writes on error.
+
+        Each file's share of the batch commits in a single transaction, so a
+        failure on one shard only retries that shard's meals; meals already
+        committed on other shards are never written twice.
+        """
+        written = failed = 0
+        for target, records in self._file_groups([record for _, record in batch]):
+            try:
+                written += target.log_meals(records, chunk_size=len(records))
+            except Exception as e:
+                print(f"⚠️ Write-behind batch of {len(records)} failed ({e}); retrying one by one")
+                for record in records:
+                    try:
+                        target.log_meal(**record)
+                        written += 1
+                    except Exception as meal_error:
+                        failed += 1
+                        print(f"❌ Dropped queued meal for {record['phone_number']}: {meal_error}")
+        return written, failed
+
+    def _finish_batch_locked(self, batch: List[tuple], written: int, failed: int):
+        last_seq = batch[-1][0]
+        self._committed_seq = max(self._committed_seq, last_seq)
+        for phone, seq in list(self._pending_by_user.items()):
+            if seq <= self._committed_seq:
+                del self._pending_by_user[phone]
+        self._stats['batches'] += 1
+        self._stats['meals_written'] += written
+        self._stats['meals_failed'] += failed
+        self._cond.notify_all()
+
+    def _write_pending_locked(self):
+        while self._pending:
+            batch = self._take_batch_locked()
+            written, failed = self._write_batch(batch)
+            self._finish_batch_locked(batch, written, failed)
+
+    def _run(self):
+        """Flusher loop: wait for a full batch, the interval, a flush request or close"""
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending and self._closed:
+                    return
+
+                deadline = time.monotonic() + self.flush_interval
+                while (len(self._pending) < self.max_batch and not self._flush_requested
+                       and not self._closed):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+                batch = self._take_batch_locked()
+                if not self._pending:
+                    self._flush_requested = False
+
+            written, failed = self._write_batch(batch)
+
+            with self._cond:
+                self._finish_batch_locked(batch, written, failed)
+
+    def stats(self) -> Dict:
+        """Queue depth and counters since start"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._pending)
+            stats['flush_interval'] = self.flush_interval
+            stats['max_batch'] = self.max_batch
+            return stats
+
+    def get_storage_settings(self) -> Dict:
+        """Storage settings of the wrapped database, plus the write-behind queue stats"""
+        settings = self.db.get_storage_settings()
+        settings['write_behind'] = self.stats()
+        return settings
+
+    def close(self):
+        """Flush every queued meal, stop the flusher and close the wrapped database"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread if self._pid == os.getpid() else None
+
+        if thread is not None:
+            thread.join()
+        with self._cond:
+            # Anything the flusher never saw (no flusher in this process)
+            self._write_pending_locked()
+
+        atexit.unregister(self.close)
+        self.db.close()
+
+    def __getattr__(self, name):
+        # Everything else (custom foods, storage settings, ...) passes straight through
+        return getattr(self.db, name)
+
+
+def _flush_user_first(name: str):
+    @functools.wraps(getattr(MealDatabase, name))
+    def call(self, phone_number=None, *args, **kwargs):
+        # No phone number (e.g. get_food_totals across users): flush everyone
+        self.flush(phone_number)
+        return getattr(self.db, name)(phone_number, *args, **kwargs)
+    return call
+
+
+def _flush_all_first(name: str):
+    @functools.wraps(getattr(MealDatabase, name))
+    def call(self, *args, **kwargs):
+        self.flush()
+        return getattr(self.db, name)(*args, **kwargs)
+    return call
+
+
+for _name in _PER_USER_READS:
+    setattr(WriteBehindMealDatabase, _name, _flush_user_first(_name))
+for _name in _CROSS_USER_CALLS:
+    setattr(WriteBehindMealDatabase, _name, _flush_all_first(_name))
@@ -0,0 +1,2306 @@
+"""
+Database Layer Test Suite - WhatsApp Calorie Tracker
+Tests connection handling, query plans and storage internals of MealDatabase
+"""
+import sys
+import os
+import csv
+import sqlite3
+import threading
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from database import MealDatabase, to_epoch
+from migrations import migrate, latest_version
+from async_database import AsyncMealDatabase
+from sharding import ShardedMealDatabase, shard_index, shard_path, split_database
+from write_behind import WriteBehindMealDatabase
+from maintenance import run_maintenance, maintenance_history, MaintenanceWorker
+from backup import run_backup, backup_history, list_backups, BackupWorker
+from food_parser import FoodParser
+
+
+# =============================================================================
+# HELPERS
+# =============================================================================
+
+def remove_db_files(db_path: str):
+    """Remove a test database and its SQLite side files"""
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+
+def fresh_db(db_path: str, **kwargs) -> MealDatabase:
+    """Create an empty test database"""
+    remove_db_files(db_path)
+    return MealDatabase(db_path=db_path, **kwargs)
+
+
+def log_test_meal(db: MealDatabase, phone: str, calories: float = 100, protein: float = 5,
+                  timestamp: datetime = None, description: str = "Test meal"):
+    """Log a meal with fixed test values"""
+    db.log_meal(
+        phone_number=phone,
+        meal_description=description,
+        total_calories=calories,
+        total_protein=protein,
+        parsed_items='[]',
+        items_extracted=description,
+        source="testing",
+        timestamp=timestamp
+    )
+
+
+# =============================================================================
+# TEST 1: CONNECTION POOL
+# =============================================================================
+
+def test_connection_pool():
+    """Test that MealDatabase reuses a bounded set of connections across threads"""
+    print("=" * 70)
+    print("🧪 TEST 1: Connection Pool")
+    print("=" * 70)
+    print()
+
+    db_path = "data/test_pool.db"
+
+    try:
+        db = fresh_db(db_path, max_connections=4)
+        test_phone = "whatsapp:+1234567890"
+
+        # Test 1: Nested checkouts on one thread share a connection
+        print("Test 1: Nested checkout reuses the thread's connection...\n")
+        with db.connection() as outer:
+            with db.connection() as inner:
+                if outer is not inner:
+                    print("❌ Nested checkout opened a second connection\n")
+                    return False
+        print("✅ Nested checkout shares one connection\n")
+
+        # Test 2: Sequential calls don't open new connections
+        print("Test 2: Repeated calls reuse pooled connections...\n")
+        for _ in range(20):
+            log_test_meal(db, test_phone)
+            db.get_daily_summary(test_phone)
+
+        if db.pool.stats()['open_connections'] != 1:
+            print(f"❌ Expected 1 open connection, got {db.pool.stats()}\n")
+            return False
+        print("✅ 40 calls served by a single connection\n")
+
+        # Test 3: Many threads stay within the pool bound
+        print("Test 3: 16 threads logging concurrently with a pool of 4...\n")
+        errors = []
+
+        def worker():
+            try:
+                for _ in range(10):
+                    log_test_meal(db, test_phone)
+                    db.get_daily_summary(test_phone)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(16)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        stats = db.pool.stats()
+        summary = db.get_daily_summary(test_phone)
+
+        if errors:
+            print(f"❌ Worker errors: {errors[0]}\n")
+            return False
+        if stats['open_connections'] > 4:
+            print(f"❌ Pool exceeded its bound: {stats}\n")
+            return False
+        if summary['meal_count'] != 180:
+            print(f"❌ Expected 180 meals, got {summary['meal_count']}\n")
+            return False
+        print(f"✅ 180 meals logged, {stats['open_connections']} connections used\n")
+
+        # Test 4: Errors roll back the whole checkout
+        print("Test 4: Failed block rolls back...\n")
+        try:
+            with db.connection() as conn:
+                conn.execute("INSERT INTO users (phone_number) VALUES ('whatsapp:+rollback')")
+                raise RuntimeError("boom")
+        except RuntimeError:
+            pass
+
+        with db.connection() as conn:
+            count = conn.execute(
+                "SELECT COUNT(*) FROM users WHERE phone_number = 'whatsapp:+rollback'"
+            ).fetchone()[0]
+
+        if count != 0:
+            print("❌ Insert survived a failed block\n")
+            return False
+        print("✅ Failed block rolled back\n")
+
+        db.close()
+        remove_db_files(db_path)
+
+        print("✅ Connection pool test: PASSED\n")
+        return True
+
+    except Exception as e:
+        print(f"❌ Test failed: {e}\n")
+        import traceback
+        traceback.print_exc()
+        remove_db_files(db_path)
+        return False
+
+
+# =============================================================================
+# TEST 2: STORAGE PROFILES
+# =============================================================================
+
+def test_storage_profiles():
+    """Test that storage profiles are applied to every pooled connection"""
+    print("=" * 70)
+    print("🧪 TEST 2: Storage Profiles")
+    print("=" * 70)
+    print()
+
+    db_path = "data/test_profiles.db"
+
+    try:
+        # Test 1: Default profile switches to WAL
+        print("Test 1: Default 'concurrent' profile...\n")
+        db = fresh_db(db_path)
+        settings = db.get_storage_settings()
+
+        expected = {'profile': 'concurrent', 'journal_mode': 'wal',
+                    'synchronous': 'normal', 'busy_timeout': 5000, 'cache_size': -16384}
+        for key, value in expected.items():
+            if settings[key] != value:
+                print(f"❌ {key}: expected {value}, got {settings[key]}\n")
+                return False
+        print(f"✅ Active settings: {settings}\n")
+
+        # Test 2: Connections opened later by other threads get the same PRAGMAs
+        print("Test 2: Settings apply to connections opened on other threads...\n")
+        seen = []
+
+        def read_settings():
+            with db.connection() as conn:
+                conn.execute("SELECT 1")
+                seen.append(conn.execute("PRAGMA busy_timeout").fetchone()[0])
+
+        with db.connection():
+            worker = threading.Thread(target=read_settings)
+            worker.start()
+            worker.join()
+
+        if seen != [5000]:
+            print(f"❌ Second connection has busy_timeout {seen}\n")
+            return False
+        print("✅ Second pooled connection configured\n")
+        db.close()
+
+        # Test 3: Legacy profile keeps the rollback journal
+        print("Test 3: 'legacy' profile...\n")
+        db = fresh_db(db_path, storage_profile='legacy')
+        if db.get_storage_settings()['journal_mode'] != 'delete':
+            print("❌ Legacy profile should use the rollback journal\n")
+            return False
+        print("✅ Legacy profile uses rollback journal\n")
+        db.close()
+
+        # Test 4: Unknown profiles are rejected
+        print("Test 4: Unknown profile name...\n")
+        try:
+            fresh_db(db_path, storage_profile='turbo')
+            print("❌ Unknown profile was accepted\n")
+            return False
+        except ValueError as e:
+            print(f"✅ Rejected: {e}\n")
+
+        remove_db_files(db_path)
+
+        print("✅ Storage profile test: PASSED\n")
+        return True
+
+    except Exception as e:
+        print(f"❌ Test failed: {e}\n")
+        import traceback
+        traceback.print_exc()
+        remove_db_files(db_path)
+        return False
+
+
+# =============================================================================
+# TEST 3: SUMMARY QUERY PLANS
+# =============================================================================
+
+def capture_summary_queries(db: MealDatabase, calls) -> list:
+    """Run calls on this thread and return every SELECT they sent to meals or daily_totals"""
+    statements = []
+    with db.read_connection() as conn:
+        conn.set_trace_callback(statements.append)
+        try:
+            for call in calls:
+                call()
+        finally:
+            conn.set_trace_callback(None)
+    return [sql for sql in statements
+            if ('FROM meals' in sql or 'FROM daily_totals' in sql)
+            and sql.lstrip().upper().startswith('SELECT')]
+
+
+def test_summary_query_plans():
+    """Test that per-user summary queries search the index instead of scanning meals"""
+    print("=" * 70)
+    print("🧪 TEST 3: Summary Query Plans")
+    print("=" * 70)
+    print()
+
+    db_path = "data/test_query_plans.db"
+
+    try:
+        db = fresh_db(db_path)
+        test_phone = "whatsapp:+1234567890"
+
+        for days_ago in range(10):
+            for phone in (test_phone, "whatsapp:+1987654321"):
+                log_test_meal(db, phone, timestamp=datetime.now() - timedelta(days=days_ago))
+
+        second_page = db.get_meal_history(test_phone, page_size=3)['next_cursor']
+        queries = capture_summary_queries(db, [
+            lambda: db.get_daily_summary(test_phone),
+            lambda: db.get_weekly_summary(test_phone),
+            lambda: db.get_weekly_breakdown(test_phone),
+            lambda: db.get_range_summary(test_phone, datetime.now() - timedelta(days=90),
+                                         datetime.now(), 'month'),
+            lambda: db.get_recent_meals(test_phone),
+            lambda: db.get_meal_history(test_phone, page_size=3),
+            lambda: db.get_meal_history(test_phone, page_size=3, cursor=second_page),
+        ])
+
+        if not queries:
+            print("❌ No summary queries captured\n")
+            return False
+
+        print(f"Checking {len(queries)} captured queries...\n")
+        all_passed = True
+        with db.connection() as conn:
+            for sql in queries:
+                plan = " | ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql))
+                where_clause = sql.split('WHERE', 1)[-1].split('ORDER BY')[0]
+                time_column = 'timestamp_epoch' if 'FROM meals' in sql else 'day'
+                filters_time = time_column in where_clause
+                uses_time_index = any(f"{time_column}{op}" in plan for op in ('>', '<', '='))
+
+                if "SCAN " in plan:
+                    print(f"❌ Full table scan: {plan}")
+                    print(f"   {' '.join(sql.split())[:100]}")
+                    all_passed = False
+                elif filters_time and not uses_time_index:
+                    print(f"❌ Date filter not served by the index: {plan}")
+                    print(f"   {' '.join(sql.split())[:100]}")
+                    all_passed = False
+                else:
+                    print(f"✅ {plan}")
+
+        db.close()
+        remove_db_files(db_path)
+
+        if all_passed:
+            print("\n✅ Summary query plan test: PASSED\n")
+        else:
+            print("\n❌ Summary query plan test: FAILED\n")
+        return all_passed
+
+    except Exception as e:
+        print(f"❌ Test failed: {e}\n")
+        import traceback
+        traceback.print_exc()
+        remove_db_files(db_path)
+        return False
+
+
+# =============================================================================
+# TEST 4: N-DAY BREAKDOWN
+# =============================================================================
+
+def test_daily_breakdown_window():
+    """Test that an N-day breakdown is served by one query"""
+    print("=" * 70)
+    print("🧪 TEST 4: N-Day Breakdown")
+    print("=" * 70)
+    print()
+
+    db_path = "data/test_breakdown.db"
+
+    try:
+        db = fresh_db(db_path)
+        test_phone = "whatsapp:+1234567890"
+        anchor = datetime(2026, 3, 31, 12, 0)
+
+        # Two meals on the anchor day, one 29 days before, one just outside the window
+        log_test_meal(db, test_phone, 400, 20, timestamp=anchor)
+        log_test_meal(db, test_phone, 100, 5, timestamp=anchor.replace(hour=0, minute=5))
+        log_test_meal(db, test_phone, 300, 15, timestamp=anchor - timedelta(days=29))
+        log_test_meal(db, test_phone, 999, 99, timestamp=anchor - timedelta(days=30))
+
+        result = {}
+        queries = capture_summary_queries(db, [
+            lambda: result.update(db.get_daily_breakdown(test_phone, days=30, end_date=anchor))
+        ])
+
+        print("Test 1: One round trip for 30 days...\n")
+        if len(queries) != 1:
+            print(f"❌ Expected 1 query, got {len(queries)}\n")
+            return False
+        print("✅ Single query\n")
+
+        print("Test 2: Window contents...\n")
+        days = result['daily_breakdown']
+        checks = [
+            (len(days), 30, "days in window"),
+            (days[0]['date'], '2026-03-02', "first day"),
+            (days[-1]['date'], '2026-03-31', "last day"),
+            (days[-1]['meal_count'], 2, "meals on anchor day"),
+            (days[0]['calories'], 300, "calories on first day"),
+            (result['total_meals'], 3, "total meals"),
+            (result['total_calories'], 800, "total calories"),
+            (result['days_with_meals'], 2, "active days"),
+        ]
+        for actual, expected, label in checks:
+            if actual != expected:
+                print(f"❌ {label}: expected {expected}, got {actual}\n")
+                return False
+            print(f"✅ {label}: {actual}")
+
+        db.close()
+        remove_db_files(db_path)
+
+        print("\n✅ N-day breakdown test: PASSED\n")
+        return True
+
+    except Exception as e:
+        print(f"❌ Test failed: {e}\n")
+        import traceback
+        traceback.print_exc()
+        remove_db_files(db_path)
+        return False
+
+
+# =============================================================================
+# TEST 5: DAILY ROLLUPS
+# =============================================================================
+
+def test_daily_totals_rollup():
+    """Test that daily_totals tracks log/delete and that drift is detected and repaired"""
+    print("=" * 70)
+    print("🧪 TEST 5: Daily Totals Rollup")
+    print("=" * 70)
+    print()
+
+    db_path = "data/test_rollup.db"
+
+    try:
+        db = fresh_db(db_path)
+        test_phone = "whatsapp:+1234567890"
+        today = datetime.now().replace(hour=12, minute=0)
+
+        log_test_meal(db, test_phone, 300, 15, timestamp=today - timedelta(days=1))
+        log_test_meal(db, test_phone, 200, 10, timestamp=today - timedelta(hours=1))
+        log_test_meal(db, test_phone, 150, 8, timestamp=today)
+
+        # Test 1: Log and delete keep the rollup in step
+        print("Test 1: Rollup follows log_meal and delete_last_meal...\n")
+        db.delete_last_meal(test_phone)
+        summary = db.get_daily_summary(test_phone, today)
+        if (summary['meal_count'], summary['total_calories']) != (1, 200):
+            print(f"❌ Unexpected summary after delete: {summary}\n")
+            return False
+
+        report = db.verify_daily_totals()
+        if report['drifted']:
+            print(f"❌ Rollup drifted: {report}\n")
+            return False
+        print(f"✅ {report['rows_checked']} rollup rows match meals\n")
+
+        # Test 2: Drift is detected and repaired
+        print("Test 2: Detect and repair drift...\n")
+        with db.connection() as conn:
+            conn.execute("UPDATE daily_totals SET calories = calories + 50 WHERE day = ?",
+                         (today.strftime('%Y-%m-%d'),))
+            conn.execute("INSERT INTO daily_totals VALUES (?, '2001-01-01', 3, 1, 1)", (test_phone,))
+            conn.execute("DELETE FROM daily_totals WHERE day = ?",
+                         ((today - timedelta(days=1)).strftime('%Y-%m-%d'),))
+
+        report = db.verify_daily_totals(repair=True)
+        if len(report['drifted']) != 3:
+            print(f"❌ Expected 3 drifted rows, got {report['drifted']}\n")
+            return False
+
+        report = db.verify_daily_totals()
+        if report['drifted']:
+            print(f"❌ Repair left drift behind: {report}\n")
+            return False
+        print("✅ 3 drifted rows found and repaired\n")
+
+        # Test 3: Full rebuild
+        print("Test 3: Full rebuild...\n")
+        rows = db.rebuild_daily_totals()
+        if rows != 2:
+            print(f"❌ Expected 2 rollup rows, got {rows}\n")
+            return False
+        print("✅ Rebuilt 2 rollup rows\n")
+
+        db.close()
+        remove_db_files(db_path)
+
+        print("✅ Daily totals rollup test: PASSED\n")
+        return True
+
+    except Exception as e:
+        print(f"❌ Test failed: {e}\n")
+        import traceback
+        traceback.print_exc()
+        remove_db_files(db_path)
+        return False
+
+
+# =============================================================================
+# TEST 6: BULK MEAL INGESTION
+# =============================================================================
+
+def test_bulk_log_meals():
+    """Test log_meals writes meals, users, tags and rollups in chunks"""
+    print("=" * 70)
+    print("🧪 TEST 6: Bulk Meal Ingestion")
+    print("=" * 70)
+    print()
+
+    db_path = "data/test_bulk.db"
+
+    try:
+        db = fresh_db(db_path)
+        base = datetime(2026, 1, 14, 8, 0)
+        phones = ["whatsapp:+1111111111", "whatsapp:+2222222222", "whatsapp:+3333333333"]
+
+        def records():
+            for i in range(250):
+                yield {
+                    'phone_number': phones[i % 3],
+                    'meal_description': f"Meal {i}",
+                    'total_calories': 100,
+                    'total_protein': 5,
+                    'parsed_items': '[]',
+                    'source': 'backfill',
+                    'timestamp': base + timedelta(hours=i),
+                }
+
+        # Test 1: Insert count across several chunks
+        print("Test 1: 250 meals in chunks of 100...\n")
+        inserted = db.log_meals(records(), chunk_size=100)
+        if inserted != 250:
+            print(f"❌ Expected 250 inserted, got {inserted}\n")
+            return False
+        print("✅ 250 meals inserted\n")
+
+        # Test 2: Users, tags and rollups
+        print("Test 2: Users, meal tags and rollups...\n")
+        with db.connection() as conn:
+            users = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+            first_tag = conn.execute(
+                "SELECT meal_tag FROM meals WHERE meal_description = 'Meal 0'"
+            ).fetchone()[0]
+
+        if users != 3:
+            print(f"❌ Expected 3 users, got {users}\n")
+            return False
+        if first_tag != "breakfast":
+            print(f"❌ Expected breakfast tag, got {first_tag}\n")
+            return False
+
+        summary = db.get_daily_summary(phones[0], base)
+        report = db.verify_daily_totals()
+        if summary['meal_count'] != 6 or report['drifted']:
+            print(f"❌ Rollups wrong: {summary}, drift {report['drifted']}\n")
+            return False
+        print("✅ 3 users, tags computed, rollups consistent\n")
+
+        db.close()
+        remove_db_files(db_path)
+
+        print("✅ Bulk ingestion test: PASSED\n")
+        return True
+
+    except Exception as e:
+        print(f"❌ Test failed: {e}\n")
+        import traceback
+        traceback.print_exc()
+        remove_db_files(db_path)
+        return False
+
+
+# =============================================================================
+# TEST 7: SINGLE-TRANSACTION MEAL WRITES
+# =============================================================================
+
+def test_log_meal_write_path():
+    """Test that log_meal commits once and skips the users upsert for known senders"""
+    print("=" * 70)
+    print("🧪 TEST 7: Single-Transaction Meal Writes")
+    print("=" * 70)
+    print()
+
+    db_path = "data/test_write_path.db"
+
+    try:
+        db = fresh_db(db_path)
+        test_phone = "whatsapp:+1234567890"
+
+        def traced_log_meal():
+            statements = []
+            with db.connection() as conn:
+                conn.set_trace_callback(statements.append)
+            try:
+                log_test_meal(db, test_phone)
+            finally:
+                with db.connection() as conn:
+                    conn.set_trace_callback(None)
+            return statements
+
+        # Test 1: First meal from a new sender
+        print("Test 1: First meal from a new sender...\n")
+        statements = traced_log_meal()
+        user_upserts = [sql for sql in statements if 'INTO users' in sql]
+        commits = [sql for sql in statements if sql.strip().upper() == 'COMMIT']
+        if len(user_upserts) != 1 or len(commits) != 1:
+            print(f"❌ Expected 1 users upsert and 1 commit, got {statements}\n")
+            return False
+        print("✅ One users upsert, one commit\n")
+
+        # Test 2: Repeat sender skips the users table
+        print("Test 2: Repeat sender...\n")
+        statements = traced_log_meal()
+        user_upserts = [sql for sql in statements if 'INTO users' in sql]
+        commits = [sql for sql in statements if sql.strip().upper() == 'COMMIT']
+        if user_upserts or len(commits) != 1:
+            print(f"❌ Expected no users upsert and 1 commit, got {statements}\n")
+            return False
+        print("✅ Users upsert skipped, one commit\n")
+
+        # Test 3: Cache stays bounded
+        print("Test 3: Known-user cache is bounded...\n")
+        small_db = MealDatabase(db_path=db_path, known_users_cache_size=5)
+        for i in range(20):
+            log_test_meal(small_db, f"whatsapp:+1000000{i:04d}")
+        if len(small_db._known_users) != 5:
+            print(f"❌ Cache grew to {len(small_db._known_users)}\n")
+            return False
+        print("✅ Cache holds 5 users\n")
+
+        small_db.close()
+        db.close()
+        remove_db_files(db_path)
+
+        print("✅ Single-transaction write test: PASSED\n")
+        return True
+
+    except Exception as e:
+        print(f"❌ Test failed: {e}\n")
+        import traceback
+        traceback.print_exc()
+        remove_db_files(db_path)
+        return False
+
+
+# =============================================================================
+# TEST 8: SCHEMA MIGRATIONS
+# =============================================================================
+
+def test_schema_migrations():
+    """Test that migrations upgrade old databases and apply each step exactly once"""
+    print("=" * 70)
+    print("🧪 TEST 8: Schema Migrations")
+    print("=" * 70)
+    print()
+
+    db_path = "data/test_migrations.db"
+
+    try:
+        # Test 1: Upgrade a database created before versioning (no meal_tag column)
+        print("Test 1: Upgrade an unversioned database...\n")
+        remove_db_files(db_path)
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE users (phone_number TEXT PRIMARY KEY, name TEXT, "
+                     "created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+        conn.execute("CREATE TABLE meals (id INTEGER PRIMARY KEY AUTOINCREMENT, phone_number TEXT, "
+                     "meal_description TEXT, timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP, "
+                     "total_calories REAL, total_protein REAL, parsed_items TEXT, "
+                     "items_extracted TEXT, source TEXT DEFAULT 'whatsapp')")
+        conn.execute("INSERT INTO meals (phone_number, meal_description, timestamp, total_calories, "
+                     "total_protein) VALUES ('whatsapp:+1234567890', 'old meal', "
+                     "'2025-12-01T13:00:00', 500, 20)")
+        # Legacy rows: an offset timestamp and free text SQLite can't parse
+        conn.execute("INSERT INTO meals (phone_number, meal_description, timestamp, total_calories, "
+                     "total_protein) VALUES ('whatsapp:+1234567890', 'offset meal', "
+                     "'2025-06-01T02:30:00+05:30', 300, 10)")
+        conn.execute("INSERT INTO meals (phone_number, meal_description, timestamp, total_calories, "
+                     "total_protein) VALUES ('whatsapp:+1234567890', 'odd meal', "
+                     "'yesterday evening', 200, 5)")
+        conn.commit()
+        conn.close()
+
+        db = MealDatabase(db_path=db_path)
+        if db.get_schema_version() != latest_version():
+            print(f"❌ Schema at version {db.get_schema_version()}, expected {latest_version()}\n")
+            return False
+
+        summary = db.get_daily_summary("whatsapp:+1234567890", datetime(2025, 12, 1))
+        if summary['meal_count'] != 1:
+            print(f"❌ Old meal missing from rollups: {summary}\n")
+            return False
+
+        with db.connection() as conn:
+            epochs = [row[0] for row in conn.execute("SELECT timestamp_epoch FROM meals ORDER BY id")]
+        if epochs[:2] != [to_epoch(datetime(2025, 12, 1, 13, 0)), to_epoch('2025-06-01T02:30:00+05:30')]:
+            print(f"❌ timestamp_epoch backfilled as {epochs}\n")
+            return False
+        if epochs[2] is not None:
+            print(f"❌ Unparseable timestamp backfilled as {epochs[2]}\n")
+            return False
+        offset_day = db.get_daily_summary("whatsapp:+1234567890", datetime(2025, 6, 1))
+        if offset_day['meal_count'] != 1 or db.verify_daily_totals()['drifted']:
+            print(f"❌ Offset meal not on its wall-clock day: {offset_day}\n")
+            return False
+        log_test_meal(db, "whatsapp:+1234567890")
+
+        # The undated meal pages last and is never the one undo removes
+        descriptions = []
+        cursor = None
+        while True:
+            page = db.get_meal_history("whatsapp:+1234567890", page_size=1, cursor=cursor)
+            descriptions.extend(meal['description'] for meal in page['meals'])
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        if descriptions[1:] != ['old meal', 'offset meal', 'odd meal']:
+            print(f"❌ History order with an undated meal: {descriptions}\n")
+            return False
+        deleted = db.delete_last_meal("whatsapp:+1234567890")
+        if deleted['deleted_meal']['description'] == 'odd meal':
+            print("❌ Undo removed the undated legacy meal\n")
+            return False
+        db.close()
+        print(f"✅ Upgraded to version {latest_version()}, old meals backfilled\n")
+
+        # Test 2: Up-to-date database does nothing
+        print("Test 2: Restart on an up-to-date database...\n")
+        conn = sqlite3.connect(db_path)
+        applied = migrate(conn)
+        conn.close()
+        if applied:
+            print(f"❌ Re-applied migrations {applied}\n")
+            return False
+        print("✅ No steps re-applied\n")
+
+        # Test 3: Concurrent cold starts apply every step exactly once
+        print("Test 3: 4 workers migrating a new database at once...\n")
+        remove_db_files(db_path)
+        applied_by_worker = []
+        errors = []
+        barrier = threading.Barrier(4)
+
+        def start_worker():
+            worker_conn = sqlite3.connect(db_path, timeout=30)
+            try:
+                barrier.wait()
+                applied_by_worker.append(migrate(worker_conn))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                worker_conn.close()
+
+        threads = [threading.Thread(target=start_worker) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        all_applied = sorted(v for versions in applied_by_worker for v in versions)
+        if errors or all_applied != list(range(1, latest_version() + 1)):
+            print(f"❌ Applied {all_applied}, errors {errors}\n")
+            return False
+        print(f"✅ Steps applied once each: {applied_by_worker}\n")
+
+        remove_db_files(db_path)
+
+        print("✅ Schema migration test: PASSED\n")
+        return True
+
+    except Exception as e:
+        print(f"❌ Test failed: {e}\n")
+        import traceback
+        traceback.print_exc()
+        remove_db_files(db_path)
+        return False
+
+
+# =============================================================================
+# TEST 9: STREAMING MEAL ITERATION
+# =============================================================================
+
+def test_iter_meals():
+    """Test iter_meals streams the same rows as get_all_meals with filters"""
+    print("=" * 70)
+    print("🧪 TEST 9: Streaming Meal Iteration")
+    print("=" * 70)
+    print()
+
+    db_path = "data/test_iter_meals.db"
+
+    try:
+        db = fresh_db(db_path)
+        base = datetime(2026, 3, 1, 9, 0)
+        phone_a = "whatsapp:+1111111111"
+        phone_b = "whatsapp:+2222222222"
+        for i in range(30):
+            log_test_meal(db, phone_a if i % 2 == 0 else phone_b, calories=100 + i,
+                          timestamp=base + timedelta(hours=i * 12), description=f"Meal {i}")
+
+        # Test 1: Same rows and order as the list version, across chunk boundaries
+        print("Test 1: Chunked iteration matches get_all_meals...\n")
+        streamed = list(db.iter_meals(chunk_size=4))
+        listed = db.get_all_meals()
+        if streamed != listed or len(streamed) != 30:
+            print(f"❌ Streamed {len(streamed)} rows, listed {len(listed)}\n")
+            return False
+        if streamed[0]['description'] != "Meal 29":
+            print(f"❌ Expected newest first, got {streamed[0]['description']}\n")
+            return False
+        print("✅ 30 rows, newest first, identical to get_all_meals\n")
+
+        # Test 2: User, limit and date range filters
+        print("Test 2: User, limit and date range filters...\n")
+        user_meals = list(db.iter_meals(phone_number=phone_a, limit=5, chunk_size=2))
+        window = list(db.iter_meals(start=base + timedelta(days=2), end=base + timedelta(days=4)))
+        if len(user_meals) != 5 or any(m['phone_number'] != phone_a for m in user_meals):
+            print(f"❌ User/limit filter returned {user_meals}\n")
+            return False
+        if [m['description'] for m in window] != [f"Meal {i}" for i in range(7, 3, -1)]:
+            print(f"❌ Date range returned {[m['description'] for m in window]}\n")
+            return False
+        print("✅ Filters applied, range end exclusive\n")
+
+        # Test 3: Writes made mid-iteration commit on their own
+        print("Test 3: Writing while a stream is open...\n")
+        stream = db.iter_meals(chunk_size=1)
+        next(stream)
+        log_test_meal(db, phone_b, timestamp=base + timedelta(days=30), description="Mid-stream")
+        probe = sqlite3.connect(db_path)
+        visible = probe.execute(
+            "SELECT COUNT(*) FROM meals WHERE meal_description = 'Mid-stream'"
+        ).fetchone()[0]
+        probe.close()
+        stream.close()
+        if visible != 1:
+            print("❌ Write made during iteration was not committed\n")
+            return False
+        print("✅ Write committed while the stream was open\n")
+
+        db.close()
+        remove_db_files(db_path)
+
+        print("✅ Streaming iteration test: PASSED\n")
+        return True
+
+    except Exception as e:
+        print(f"❌ Test failed: {e}\n")
+        import traceback
+        traceback.print_exc()
+        remove_db_files(db_path)
+        return False
+
+
+# =============================================================================
+# TEST 10: KEYSET-PAGINATED HISTORY
+# =============================================================================
+
+def test_meal_history_pagination():
+    """Test that get_meal_history pages through every meal exactly once"""
+    print("=" * 70)
+    print("🧪 TEST 10: Keyset-Paginated History")
+    print("=" * 70)
+    print()
+
+    db_path = "data/test_history.db"
+
+    try:
+        db = fresh_db(db_path)
+        test_phone = "whatsapp:+1234567890"
+        base = datetime(2026, 2, 1, 8, 0)
+
+        # Pairs of meals share a timestamp so pages must break ties on id
+        for i in range(25):
+            log_test_meal(db, test_phone, timestamp=base + timedelta(hours=i // 2),
+                          description=f"Meal {i}")
+        log_test_meal(db, "whatsapp:+1987654321", timestamp=base)
+
+        # Test 1: Walk every page
+        print("Test 1: Pages of 7 cover all 25 meals in order...\n")
+        pages = []
+        cursor = None
+        while True:
+            page = db.get_meal_history(test_phone, page_size=7, cursor=cursor)
+            pages.append(page['meals'])
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+            if len(pages) == 2:
+                # A meal logged mid-walk must not shift the pages still to come
+                log_test_meal(db, test_phone, timestamp=base + timedelta(days=1))
+
+        walked = [meal['description'] for page in pages for meal in page]
+        expected = [meal['description'] for meal in db.get_all_meals(test_phone)][1:]
+        if [len(page) for page in pages] != [7, 7, 7, 4] or walked != expected:
+            print(f"❌ Pages {[len(page) for page in pages]}: {walked}\n")
+            return False
+        print("✅ 4 pages, no duplicates or gaps, ties ordered by id\n")
+
+        # Test 2: Malformed cursors are rejected
+        print("Test 2: Malformed cursor...\n")
+        try:
+            db.get_meal_history(test_phone, cursor="not-a-cursor")
+            print("❌ Malformed cursor accepted\n")
+            return False
+        except ValueError:
+            print("✅ ValueError raised\n")
+
+        db.close()
+        remove_db_files(db_path)
+
+        print("✅ Keyset pagination test: PASSED\n")
+        return True
+
+    except Exception as e:
+        print(f"❌ Test failed: {e}\n")
+        import traceback
+        traceback.print_exc()
+        remove_db_files(db_path)
+        return False
+
+
+# =============================================================================
+# TEST 11: ASYNCIO FACADE
+# =============================================================================
+
+def test_async_database():
+    """Test AsyncMealDatabase returns the sync results without blocking the loop"""
+    print("=" * 70)
+    print("🧪 TEST 11: Asyncio Facade")
+    print("=" * 70)
+    print()
+
+    db_path = "data/test_async.db"
+
+    async def scenario():
+        test_phone = "whatsapp:+1234567890"
+        async with AsyncMealDatabase(db_path=db_path, max_workers=3) as db:
+            # Test 1: Concurrent calls return the same dicts as the sync API
+            print("Test 1: 50 concurrent calls...\n")
+            await asyncio.gather(*(
+                db.log_meal(test_phone, f"Meal {i}", 100, 5, '[]', "test")
+                for i in range(10)
+            ))
+            summaries = await asyncio.gather(*(db.get_daily_summary(test_phone) for _ in range(50)))
+            if any(s != db.db.get_daily_summary(test_phone) for s in summaries):
+                print(f"❌ Async summary differs from sync: {summaries[0]}\n")
+                return False
+            if summaries[0]['meal_count'] != 10:
+                print(f"❌ Expected 10 meals, got {summaries[0]['meal_count']}\n")
+                return False
+            streamed = [meal async for meal in db.iter_meals(test_phone, chunk_size=3)]
+            if streamed != db.db.get_all_meals(test_phone):
+                print("❌ Async iter_meals differs from get_all_meals\n")
+                return False
+            print("✅ Results match the sync API\n")
+
+            # Test 2: A call waiting on a locked database leaves the loop running
+            print("Test 2: Loop keeps running while a write waits for a lock...\n")
+            blocker = sqlite3.connect(db_path, isolation_level=None)
+            blocker.execute("BEGIN IMMEDIATE")
+            write = asyncio.ensure_future(db.log_meal(test_phone, "Late meal", 100, 5, '[]', "test"))
+            ticks = 0
+            for _ in range(20):
+                await asyncio.sleep(0.01)
+                ticks += 1
+            still_waiting = not write.done()
+            blocker.execute("COMMIT")
+            blocker.close()
+            await write
+
+            if ticks != 20 or not still_waiting:
+                print(f"❌ Loop ticks {ticks}, write waiting {still_waiting}\n")
+                return False
+            summary = await db.get_daily_summary(test_phone)
+            if summary['meal_count'] != 11:
+                print(f"❌ Late meal missing: {summary}\n")
+                return False
+            print("✅ Loop ticked while the write waited, write landed after release\n")
+        return True
+
+    try:
+        remove_db_files(db_path)
+        passed = asyncio.run(scenario())
+        remove_db_files(db_path)
+
+        if passed:
+            print("✅ Asyncio facade test: PASSED\n")
+        return passed
+
+    except Exception as e:
+        print(f"❌ Test failed: {e}\n")
+        import traceback
+        traceback.print_exc()
+        remove_db_files(db_path)
+        return False
+
+
+# =============================================================================
+# TEST 12: SHARDED STORAGE
+# =============================================================================
+
+def test_sharded_database():
+    """Test shard routing, fan-out reads, the shared catalogue and the split tool"""
+    print("=" * 70)
+    print("🧪 TEST 12: Sharded Storage")
+    print("=" * 70)
+    print()
+
+    source_path = "data/test_shard_source.db"
+    target_path = "data/test_sharded.db"
+    shard_count = 3
+
+    def cleanup():
+        remove_db_files(source_path)
+        remove_db_files(target_path)
+        for i in range(shard_count):
+            remove_db_files(shard_path(target_path, i, shard_count))
+
+    try:
+        cleanup()
+        base = datetime(2026, 4, 1, 8, 0)
+        phones = [f"whatsapp:+1555000{i:04d}" for i in range(12)]
+
+        # Single-file database to split later
+        source = MealDatabase(db_path=source_path)
+        for i in range(60):
+            log_test_meal(source, phones[i % 12], calories=100 + i,
+                          timestamp=base + timedelta(hours=i), description=f"Meal {i}")
+        # Two users in different shards at the same minute (id breaks the tie)
+        # and an undated legacy row
+        for phone in (phones[1], phones[0]):
+            log_test_meal(source, phone, timestamp=base - timedelta(hours=1),
+                          description=f"Tie {phone[-2:]}")
+        with source.connection() as conn:
+            conn.execute("INSERT INTO meals (phone_number, meal_description, timestamp, "
+                         "total_calories, total_protein) VALUES (?, 'odd meal', "
+                         "'yesterday evening', 200, 5)", (phones[2],))
+        source.add_custom_food("test paratha", 250, 6, "1 piece")
+        expected_meals = source.get_all_meals()
+        expected_summaries = {phone: source.get_daily_summary(phone, base) for phone in phones}
+        source.close()
+
+        # Test 1: Split tool copies everything into shards plus catalogue
+        print("Test 1: Split a single-file database into 3 shards...\n")
+        result = split_database(source_path, target_path, shard_count)
+        if (result['users'], result['meals'], result['custom_foods']) != (12, 63, 1):
+            print(f"❌ Unexpected split result: {result}\n")
+            return False
+        print(f"✅ Copied {result}\n")
+
+        db = ShardedMealDatabase(db_path=target_path, shard_count=shard_count)
+
+        # Test 2: Each user's rows live in their own shard only
+        print("Test 2: Users routed to a single shard...\n")
+        per_shard = []
+        for shard in db.shards:
+            with shard.connection() as conn:
+                per_shard.append({row[0] for row in conn.execute(
+                    "SELECT DISTINCT phone_number FROM meals")})
+        misplaced = [phone for phone in phones
+                     if [phone in owners for owners in per_shard].count(True) != 1
+                     or phone not in per_shard[shard_index(phone, shard_count)]]
+        if misplaced or sum(1 for owners in per_shard if owners) < 2:
+            print(f"❌ Misplaced users {misplaced}, shard users {per_shard}\n")
+            return False
+        if any(db.get_daily_summary(phone, base) != expected_summaries[phone] for phone in phones):
+            print("❌ Per-user summaries changed after the split\n")
+            return False
+        print(f"✅ Users per shard: {[len(owners) for owners in per_shard]}\n")
+
+        # Test 3: Cross-user reads merge shards newest first
+        print("Test 3: Fan-out get_all_meals...\n")
+        merged = db.get_all_meals()
+        if [m['description'] for m in merged] != [m['description'] for m in expected_meals]:
+            print("❌ Merged order differs from the single-file order\n")
+            return False
+        if [m['description'] for m in db.get_all_meals(limit=5)] != [f"Meal {i}" for i in range(59, 54, -1)]:
+            print("❌ Limit not applied across shards\n")
+            return False
+        export_path = "data/test_sharded_export.xlsx"
+        exported, message = db.export_to_excel(export_path)
+        if os.path.exists(export_path):
+            os.remove(export_path)
+        if not exported:
+            print(f"❌ Export failed: {message}\n")
+            return False
+        print("✅ 63 meals merged in (timestamp, id) order and exported\n")
+
+        # Test 4: Custom foods live in the catalogue only
+        print("Test 4: Shared catalogue...\n")
+        db.add_custom_food("test chilla", 180, 8, "1 piece")
+        names = {food['name'] for food in db.get_all_custom_foods()}
+        with db.shards[0].connection() as conn:
+            shard_foods = conn.execute("SELECT COUNT(*) FROM custom_foods").fetchone()[0]
+        if names != {"test paratha", "test chilla"} or shard_foods:
+            print(f"❌ Catalogue {names}, shard foods {shard_foods}\n")
+            return False
+        print("✅ Custom foods stored once in the catalogue\n")
+
+        db.close()
+        cleanup()
+
+        print("✅ Sharded storage test: PASSED\n")
+        return True
+
+    except Exception as e:
+        print(f"❌ Test failed: {e}\n")
+        import traceback
+        traceback.print_exc()
+        cleanup()
+        return False
+
+
+# =============================================================================
+# TEST 13: WRITE-BEHIND MEAL LOGGING
+# =============================================================================
+
+def test_write_behind():
+    """Test write-behind batching, read-your-writes and flush on close"""
+    print("=" * 70)
+    print("🧪 TEST 13: Write-Behind Meal Logging")
+    print("=" * 70)
+    print()
+
+    db_path = "data/test_write_behind.db"
+    sharded_path = "data/test_write_behind_sharded.db"
+
+    def cleanup_sharded():
+        remove_db_files(sharded_path)
+        for i in range(2):
+            remove_db_files(shard_path(sharded_path, i, 2))
+
+    def committed_meals():
+        probe = sqlite3.connect(db_path)
+        try:
+            return probe.execute("SELECT COUNT(*) FROM meals").fetchone()[0]
+        finally:
+            probe.close()
+
+    try:
+        test_phone = "whatsapp:+1234567890"
+        db = WriteBehindMealDatabase(fresh_db(db_path), flush_interval=0.05, max_batch=100)
+
+        # Test 1: A read right after logging includes the queued meal
+        print("Test 1: Read-your-writes...\n")
+        db.log_meal(test_phone, "Queued meal", 250, 10, '[]', "test")
+        summary = db.get_daily_summary(test_phone)
+        if summary['meal_count'] != 1 or summary['total_calories'] != 250:
+            print(f"❌ Queued meal missing from summary: {summary}\n")
+            return False
+        print("✅ Summary includes the meal logged just before\n")
+
+        # Test 2: Many meals group-commit in few transactions
+        print("Test 2: 300 meals from 6 threads...\n")
+
+        def log_many(worker_id):
+            for i in range(50):
+                db.log_meal(f"whatsapp:+1555000{worker_id:04d}", f"Meal {i}", 100, 5, '[]', "test")
+
+        threads = [threading.Thread(target=log_many, args=(i,)) for i in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        db.flush()
+
+        stats = db.stats()
+        if committed_meals() != 301 or stats['pending'] or stats['batches'] > 60:
+            print(f"❌ {committed_meals()} meals committed, stats {stats}\n")
+            return False
+        print(f"✅ 301 meals in {stats['batches']} commits\n")
+
+        # Test 3: close() flushes what is still queued
+        print("Test 3: Flush on close...\n")
+        for i in range(5):
+            db.log_meal(test_phone, f"Late meal {i}", 100, 5, '[]', "test")
+        db.close()
+        if committed_meals() != 306:
+            print(f"❌ Expected 306 meals after close, got {committed_meals()}\n")
+            return False
+        report = MealDatabase(db_path=db_path).verify_daily_totals()
+        if report['drifted']:
+            print(f"❌ Rollups drifted: {report['drifted']}\n")
+            return False
+        print("✅ Queued meals written on close, rollups consistent\n")
+
+        # Test 4: A failing shard only retries its own meals
+        print("Test 4: Batch failure on one shard...\n")
+        cleanup_sharded()
+        sharded = ShardedMealDatabase(db_path=sharded_path, shard_count=2)
+        phones = [f"whatsapp:+1555000{i:04d}" for i in range(8)]
+        failing = sharded.shards[1]
+
+        def fail_batch(records, chunk_size=1000):
+            raise sqlite3.OperationalError("disk I/O error")
+
+        failing.log_meals = fail_batch
+        db = WriteBehindMealDatabase(sharded, flush_interval=60, max_batch=100)
+        for phone in phones:
+            db.log_meal(phone, "Meal", 100, 5, '[]', "test")
+        db.flush()
+        counts = {phone: sharded.get_daily_summary(phone)['meal_count'] for phone in phones}
+        db.close()
+        cleanup_sharded()
+        if set(counts.values()) != {1}:
+            print(f"❌ Meals per user after retry: {counts}\n")
+            return False
+        print("✅ Every meal committed once after the retry\n")
+
+        remove_db_files(db_path)
+
+        print("✅ Write-behind test: PASSED\n")
+        return True
+
+    except Exception as e:
+        print(f"❌ Test failed: {e}\n")
+        import traceback
+        traceback.print_exc()
+        remove_db_files(db_path)
+        cleanup_sharded()
+        return False
+
+
+# =============================================================================
+# TEST 14: READ-ONLY CONNECTIONS
+# =============================================================================
+
+def test_read_only_connections():
+    """Test that readers use read-only connections and don't wait behind a writer"""
+    print("=" * 70)
+    print("🧪 TEST 14: Read-Only Connections")
+    print("=" * 70)
+    print()
+
+    db_path = "data/test_read_only.db"
+
+    try:
+        # One write slot, so readers sharing it would queue behind the writer
+        db = fresh_db(db_path, max_connections=1)
+        test_phone = "whatsapp:+1234567890"
+        log_test_meal(db, test_phone, calories=300)
+
+        # Test 1: Read connections refuse writes
+        print("Test 1: Read connections are read-only...\n")
+        try:
+            with db.read_connection() as conn:
+                conn.execute("DELETE FROM meals")
+            print("❌ Write succeeded on a read connection\n")
+            return False
+        except sqlite3.OperationalError as e:
+            print(f"✅ Write rejected: {e}\n")
+
+        # Test 2: One writer holding its transaction open, eight readers
+        print("Test 2: 8 readers while a writer holds the write lock...\n")
+        writer_holding = threading.Event()
+        writer_done = threading.Event()
+        latencies = []
+        stale_reads = []
+        errors = []
+
+        def writer():
+            try:
+                with db.connection():
+                    log_test_meal(db, test_phone, calories=500)
+                    db.delete_last_meal("whatsapp:+1987654321")
+                    writer_holding.set()
+                    time.sleep(0.5)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                writer_holding.set()
+                writer_done.set()
+
+        def reader():
+            writer_holding.wait()
+            try:
+                while not writer_done.is_set():
+                    start = time.perf_counter()
+                    summary = db.get_daily_summary(test_phone)
+                    db.get_recent_meals(test_phone)
+                    db.get_weekly_breakdown(test_phone)
+                    latencies.append(time.perf_counter() - start)
+                    if summary['meal_count'] != 1 and not writer_done.is_set():
+                        stale_reads.append(summary['meal_count'])
+                    # Requests arrive spaced out, not in a tight loop hogging the read slot
+                    time.sleep(0.001)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        if errors:
+            print(f"❌ Errors: {errors}\n")
+            return False
+        if not latencies or max(latencies) > 0.25:
+            print(f"❌ Readers waited {max(latencies or [0]) * 1000:.0f}ms for the writer\n")
+            return False
+        if stale_reads:
+            print(f"❌ Readers saw uncommitted meals: {stale_reads[:5]}\n")
+            return False
+        print(f"✅ {len(latencies)} reads during a 500ms write, "
+              f"slowest {max(latencies) * 1000:.1f}ms, none saw uncommitted data\n")
+
+        if db.get_daily_summary(test_phone)['meal_count'] != 2:
+            print("❌ Writer's meal missing after commit\n")
+            return False
+        print("✅ Writer's meal visible after commit\n")
+
+        db.close()
+        remove_db_files(db_path)
+
+        print("✅ Read-only connection test: PASSED\n")
+        return True
+
+    except Exception as e:
+        print(f"❌ Test failed: {e}\n")
+        import traceback
+        traceback.print_exc()
+        remove_db_files(db_path)
+        return False
+
+
+# =============================================================================
+# TEST 15: HOT/COLD RETENTION
+# =============================================================================
+
+def test_meal_retention():
+    """Test archiving old meals keeps rollups and reads them back transparently"""
+    print("=" * 70)
+    print("🧪 TEST 15: Hot/Cold Retention")
+    print("=" * 70)
+    print()
+
+    db_path = "data/test_retention.db"
+
+    try:
+        db = fresh_db(db_path)
+        test_phone = "whatsapp:+1234567890"
+        other_phone = "whatsapp:+1987654321"
+        now = datetime(2026, 6, 30, 20, 0)
+        for day in range(60):
+            for phone in (test_phone, other_phone):
+                log_test_meal(db, phone, calories=100 + day,
+                              timestamp=now - timedelta(days=day, hours=2), description=f"Day {day}")
+
+        old_day = now - timedelta(days=45)
+        before = {
+            'all': db.get_all_meals(),
+            'summary': db.get_daily_summary(test_phone, old_day),
+            'history': [m['description'] for m in db.get_all_meals(test_phone)],
+        }
+
+        # Test 1: Old meals move, rollups stay
+        print("Test 1: Archive meals older than 30 days...\n")
+        result = db.archive_meals(30, batch_size=7, now=now)
+        with db.connection() as conn:
+            hot = conn.execute("SELECT COUNT(*) FROM meals").fetchone()[0]
+            cold = conn.execute("SELECT COUNT(*) FROM meals_archive").fetchone()[0]
+        if (result['archived'], hot, cold, result['users']) != (58, 62, 58, 2):
+            print(f"❌ Archive result {result}, hot {hot}, cold {cold}\n")
+            return False
+        if db.get_daily_summary(test_phone, old_day) != before['summary']:
+            print("❌ Summary for an archived day changed\n")
+            return False
+        if db.verify_daily_totals()['drifted'] or db.rebuild_daily_totals() != 120:
+            print("❌ Rollups disagree with hot + archived meals\n")
+            return False
+        print(f"✅ Moved {result['archived']} meals before {result['boundary']}, rollups unchanged\n")
+
+        # Test 2: Reads reaching past the boundary include the archive
+        print("Test 2: Transparent reads across tiers...\n")
+        if db.get_all_meals() != before['all']:
+            print("❌ get_all_meals differs after archiving\n")
+            return False
+        walked = []
+        cursor = None
+        while True:
+            page = db.get_meal_history(test_phone, page_size=8, cursor=cursor)
+            walked.extend(m['description'] for m in page['meals'])
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        if walked != before['history']:
+            print(f"❌ History walk differs after archiving: {walked[-5:]}\n")
+            return False
+        window = list(db.iter_meals(test_phone, start=now - timedelta(days=40),
+                                    end=now - timedelta(days=20)))
+        if [m['description'] for m in window] != [f"Day {d}" for d in range(20, 40)]:
+            print(f"❌ Range across the boundary returned {[m['description'] for m in window]}\n")
+            return False
+        print("✅ Exports, history and ranges unchanged\n")
+
+        # Test 3: Recent reads stay in the hot table
+        print("Test 3: Recent reads skip the archive...\n")
+        queries = capture_summary_queries(db, [lambda: db.get_recent_meals(test_phone)])
+        if any('meals_archive' in sql for sql in queries):
+            print("❌ get_recent_meals touched meals_archive\n")
+            return False
+        print("✅ meals_archive not read\n")
+
+        db.close()
+        remove_db_files(db_path)
+
+        print("✅ Hot/cold retention test: PASSED\n")
+        return True
+
+    except Exception as e:
+        print(f"❌ Test failed: {e}\n")
+        import traceback
+        traceback.print_exc()
+        remove_db_files(db_path)
+        return False
+
+
+# =============================================================================
+# TEST 16: DATABASE MAINTENANCE
+# =============================================================================
+
+def test_database_maintenance():
+    """Test the maintenance run reclaims pages, refreshes stats and records itself"""
+    print("=" * 70)
+    print("🧪 TEST 16: Database Maintenance")
+    print("=" * 70)
+    print()
+
+    db_path = "data/test_maintenance.db"
+
+    try:
+        db = fresh_db(db_path)
+        test_phone = "whatsapp:+1234567890"
+        for i in range(1500):
+            log_test_meal(db, test_phone, description="A long meal description " * 8)
+        for i in range(1000):
+            db.delete_last_meal(test_phone)
+
+        # Test 1: Full run within budget
+        print("Test 1: Maintenance run on a file with free pages...\n")
+        result = run_maintenance(db, time_budget=30)
+        run = result['files'][0]
+        with db.connection() as conn:
+            analyzed = conn.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone()[0]
+        if run['error'] or not run['freelist_before'] or run['freelist_after']:
+            print(f"❌ Unexpected run: {run}\n")
+            return False
+        if run['page_count_after'] >= run['page_count_before'] or not analyzed:
+            print(f"❌ File not shrunk or not analyzed: {run}\n")
+            return False
+        print(f"✅ {run['page_count_before']} -> {run['page_count_after']} pages, steps {run['steps']}\n")
+
+        # Test 2: Exhausted budget skips work but still records the run
+        print("Test 2: Zero time budget...\n")
+        result = run_maintenance(db, time_budget=0)
+        history = maintenance_history(db, limit=5)
+        if 'skipped' not in result['files'][0]['steps']['optimize'] or len(history) != 2:
+            print(f"❌ Steps {result['files'][0]['steps']}, history {len(history)} runs\n")
+            return False
+        if history[0]['started_at'] != result['files'][0]['started_at']:
+            print("❌ History not newest first\n")
+            return False
+        print("✅ Steps skipped, 2 runs recorded\n")
+
+        db.close()
+
+        # Test 3: Files created without auto_vacuum need an explicit full vacuum
+        print("Test 3: Converting a file without auto_vacuum...\n")
+        remove_db_files(db_path)
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE users (phone_number TEXT PRIMARY KEY, name TEXT, "
+                     "created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+        conn.close()
+        db = MealDatabase(db_path=db_path)
+        skipped = run_maintenance(db)['files'][0]['steps']['incremental_vacuum']
+        converted = run_maintenance(db, full_vacuum=True)['files'][0]['steps']['incremental_vacuum']
+        with db.connection() as conn:
+            auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        if not skipped.startswith('skipped') or auto_vacuum != 2:
+            print(f"❌ Steps {skipped!r} / {converted!r}, auto_vacuum {auto_vacuum}\n")
+            return False
+        print(f"✅ {converted}\n")
+
+        # Test 4: The schedule follows recorded runs and one worker claims each run
+        print("Test 4: Two workers on a freshly maintained file...\n")
+        other = MealDatabase(db_path=db_path)
+        workers = [MaintenanceWorker(file_db, interval_seconds=3600) for file_db in (db, other)]
+        if workers[0].seconds_until_due() < 3500:
+            print(f"❌ New worker due in {workers[0].seconds_until_due():.0f}s despite a recent run\n")
+            return False
+        barrier = threading.Barrier(2)
+        results = []
+
+        def scheduled_run(worker):
+            barrier.wait()
+            results.append(worker.run_once())
+
+        threads = [threading.Thread(target=scheduled_run, args=(worker,)) for worker in workers]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        other.close()
+        ran = [result for result in results if result is not None]
+        runs_recorded = len(maintenance_history(db, limit=10))
+        if len(ran) != 1 or runs_recorded != 3 or workers[0].run_once() is not None:
+            print(f"❌ Scheduled runs {results}, {runs_recorded} recorded\n")
+            return False
+        print("✅ Due in an interval, one worker maintained, the other skipped\n")
+
+        db.close()
+        remove_db_files(db_path)
+
+        print("✅ Database maintenance test: PASSED\n")
+        return True
+
+    except Exception as e:
+        print(f"❌ Test failed: {e}\n")
+        import traceback
+        traceback.print_exc()
+        remove_db_files(db_path)
+        return False
+
+
+# =============================================================================
+# TEST 17: NORMALIZED MEAL ITEMS
+# =============================================================================
+
+def test_meal_items():
+    """Test meal_items is backfilled, written with each meal and aggregates per food"""
+    print("=" * 70)
+    print("🧪 TEST 17: Normalized Meal Items")
+    print("=" * 70)
+    print()
+
+    db_path = "data/test_meal_items.db"
+    test_phone = "whatsapp:+1234567890"
+    other_phone = "whatsapp:+9876543210"
+
+    try:
+        # Test 1: Backfill existing meals from parsed_items
+        print("Test 1: Backfill from parsed_items JSON...\n")
+        remove_db_files(db_path)
+        conn = sqlite3.connect(db_path)
+        migrate(conn, target=7)
+        old_meals = [
+            ('[{"food": "Dal", "quantity": 2}]', 300),
+            ('[{"food": "roti", "quantity": 2}, {"food": "dal", "quantity": 1}]', 400),
+            ('not json', 100),
+            ('[]', 200),
+        ]
+        for parsed_items, calories in old_meals:
+            conn.execute("INSERT INTO meals (phone_number, meal_description, timestamp, total_calories, "
+                         "total_protein, parsed_items, timestamp_epoch) VALUES (?, 'old meal', "
+                         "'2025-12-01T13:00:00', ?, 10, ?, ?)",
+                         (test_phone, calories, parsed_items, to_epoch(datetime(2025, 12, 1, 13))))
+        conn.commit()
+        conn.close()
+
+        db = MealDatabase(db_path=db_path)
+        totals = {row['food_name']: row for row in db.get_food_totals(test_phone)}
+        if set(totals) != {'dal', 'roti'} or totals['dal']['quantity'] != 3:
+            print(f"❌ Backfilled totals: {totals}\n")
+            return False
+        # Single-item meals carry the meal's totals; multi-item ones have no split
+        if totals['dal']['calories'] != 300 or totals['dal']['known_nutrition_meals'] != 1:
+            print(f"❌ Backfilled nutrition: {totals['dal']}\n")
+            return False
+        print(f"✅ Backfilled: {totals}\n")
+
+        # Test 2: New meals write their items in the same transaction
+        print("Test 2: log_meal and log_meals write items...\n")
+        items = [{'name': 'Roti', 'quantity': 2, 'calories': 240, 'protein': 6},
+                 {'name': 'Dal', 'quantity': 1, 'calories': 150, 'protein': 9}]
+        db.log_meal(test_phone, "2 roti and dal", 390, 15, '[]', "2x Roti, 1x Dal",
+                    timestamp=datetime(2026, 1, 5, 13), items=items)
+        db.log_meals([{'phone_number': other_phone, 'meal_description': "dal",
+                       'total_calories': 150, 'total_protein': 9,
+                       'parsed_items': '[{"food": "dal", "quantity": 1}]',
+                       'timestamp': datetime(2026, 1, 5, 20)},
+                      {'phone_number': other_phone, 'meal_description': "manual",
+                       'total_calories': 500, 'total_protein': 30, 'parsed_items': '[]',
+                       'timestamp': datetime(2026, 1, 5, 21)}])
+
+        january = db.get_food_totals(test_phone, start=datetime(2026, 1, 1), end=datetime(2026, 2, 1))
+        if [(row['food_name'], row['quantity'], row['calories']) for row in january] != \
+                [('roti', 2, 240), ('dal', 1, 150)]:
+            print(f"❌ January totals: {january}\n")
+            return False
+        dal = db.get_food_totals(food_name="DAL")
+        if len(dal) != 1 or dal[0]['meal_count'] != 4 or dal[0]['quantity'] != 5:
+            print(f"❌ Per-food totals across users: {dal}\n")
+            return False
+        with db.read_connection() as conn:
+            plan = " ".join(row[3] for row in conn.execute(
+                "EXPLAIN QUERY PLAN SELECT food_name, SUM(quantity) FROM meal_items "
+                "WHERE phone_number = ? AND timestamp_epoch >= ? GROUP BY food_name", (test_phone, 0)))
+        if 'idx_meal_items_phone_food' not in plan:
+            print(f"❌ Per-user totals not using the index: {plan}\n")
+            return False
+        print(f"✅ Per-user range: {january}\n✅ Dal across users: {dal[0]}\n")
+
+        # Test 3: Undo removes the meal's items
+        print("Test 3: delete_last_meal removes items...\n")
+        db.delete_last_meal(test_phone)
+        january = db.get_food_totals(test_phone, start=datetime(2026, 1, 1))
+        if january:
+            print(f"❌ Items left behind: {january}\n")
+            return False
+        print("✅ Items deleted with the meal\n")
+
+        db.close()
+        remove_db_files(db_path)
+
+        print("✅ Meal items test: PASSED\n")
+        return True
+
+    except Exception as e:
+        print(f"❌ Test failed: {e}\n")
+        import traceback
+        traceback.print_exc()
+        remove_db_files(db_path)
+        return False
+
+
+# =============================================================================
+# TEST 18: ATOMIC UNDO
+# =============================================================================
+
+def test_atomic_delete_last_meal():
+    """Test concurrent undos each delete a different meal"""
+    print("=" * 70)
+    print("🧪 TEST 18: Atomic delete_last_meal")
+    print("=" * 70)
+    print()
+
+    db_path = "data/test_atomic_undo.db"
+
+    try:
+        db = fresh_db(db_path, max_connections=4)
+        test_phone = "whatsapp:+1234567890"
+        base = datetime.now().replace(hour=12, minute=0, second=0, microsecond=0)
+        rounds = 20
+        for i in range(rounds * 2):
+            log_test_meal(db, test_phone, timestamp=base + timedelta(seconds=i), description=f"Meal {i}")
+
+        # Test 1: Pairs of undos racing each other
+        print(f"Test 1: {rounds} rounds of two parallel undos...\n")
+        deleted = []
+        lock = threading.Lock()
+
+        def undo(barrier):
+            barrier.wait()
+            result = db.delete_last_meal(test_phone)
+            with lock:
+                deleted.append(result['deleted_meal']['description'] if result['success'] else None)
+
+        for _ in range(rounds):
+            barrier = threading.Barrier(2)
+            threads = [threading.Thread(target=undo, args=(barrier,)) for _ in range(2)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+        expected = {f"Meal {i}" for i in range(rounds * 2)}
+        if None in deleted or len(set(deleted)) != rounds * 2 or set(deleted) != expected:
+            print(f"❌ Undos deleted {len(set(deleted))} distinct meals out of {len(deleted)}\n")
+            return False
+        summary = db.get_daily_summary(test_phone, base)
+        if summary['meal_count'] != 0 or db.delete_last_meal(test_phone)['success']:
+            print(f"❌ Meals or rollups left behind: {summary}\n")
+            return False
+        print(f"✅ {len(deleted)} undos removed {len(set(deleted))} distinct meals, rollups at zero\n")
+
+        # Test 2: The delete seeks the newest meal through the index
+        print("Test 2: Query plan...\n")
+        with db.read_connection() as conn:
+            plan = " ".join(row[3] for row in conn.execute('''
+                EXPLAIN QUERY PLAN
+                DELETE FROM meals WHERE id = (
+                    SELECT id FROM meals WHERE phone_number = ?
+                    ORDER BY timestamp_epoch DESC, id DESC LIMIT 1
+                ) RETURNING id
+            ''', (test_phone,)))
+        if 'idx_meals_phone_epoch' not in plan or 'TEMP B-TREE' in plan:
+            print(f"❌ Plan: {plan}\n")
+            return False
+        print(f"✅ {plan}\n")
+
+        db.close()
+        remove_db_files(db_path)
+
+        print("✅ Atomic delete_last_meal test: PASSED\n")
+        return True
+
+    except Exception as e:
+        print(f"❌ Test failed: {e}\n")
+        import traceback
+        traceback.print_exc()
+        remove_db_files(db_path)
+        return False
+
+
+# =============================================================================
+# TEST 19: RANGE SUMMARIES
+# =============================================================================
+
+def test_range_summary():
+    """Test day/week/month buckets and per-day averages from get_range_summary"""
+    print("=" * 70)
+    print("🧪 TEST 19: Range Summaries")
+    print("=" * 70)
+    print()
+
+    db_path = "data/test_range_summary.db"
+
+    try:
+        db = fresh_db(db_path)
+        test_phone = "whatsapp:+1234567890"
+        # Jan 30 (Fri): 2 meals, Feb 2 (Mon): 1 meal, Mar 1 (Sun): 1 meal
+        for day, calories in ((datetime(2026, 1, 30, 9), 300), (datetime(2026, 1, 30, 20), 500),
+                              (datetime(2026, 2, 2, 13), 400), (datetime(2026, 3, 1, 13), 600)):
+            log_test_meal(db, test_phone, calories=calories, timestamp=day)
+
+        # Test 1: Month buckets clipped to the range
+        print("Test 1: Month buckets...\n")
+        summary = db.get_range_summary(test_phone, datetime(2026, 1, 15), datetime(2026, 3, 2), 'month')
+        buckets = [(b['start'], b['end'], b['meal_count'], b['total_calories'], b['days'])
+                   for b in summary['buckets']]
+        expected = [('2026-01-15', '2026-02-01', 2, 800, 17), ('2026-02-01', '2026-03-01', 1, 400, 28),
+                    ('2026-03-01', '2026-03-02', 1, 600, 1)]
+        if buckets != expected:
+            print(f"❌ Buckets {buckets}\n")
+            return False
+        # 1800 kcal over 3 days with meals, not over 4 meals
+        if summary['avg_daily_calories'] != 600 or summary['days_with_meals'] != 3:
+            print(f"❌ Averages: {summary['avg_daily_calories']} over {summary['days_with_meals']} days\n")
+            return False
+        print(f"✅ {buckets}\n")
+
+        # Test 2: Week buckets start on Monday
+        print("Test 2: Week buckets...\n")
+        summary = db.get_range_summary(test_phone, datetime(2026, 1, 26), datetime(2026, 2, 9), 'week')
+        weeks = [(b['start'], b['meal_count']) for b in summary['buckets']]
+        if weeks != [('2026-01-26', 2), ('2026-02-02', 1)]:
+            print(f"❌ Weeks {weeks}\n")
+            return False
+        print(f"✅ {weeks}\n")
+
+        # Test 3: Wrappers agree with the range summary
+        print("Test 3: Daily summary and breakdown wrappers...\n")
+        daily = db.get_daily_summary(test_phone, datetime(2026, 1, 30))
+        breakdown = db.get_daily_breakdown(test_phone, days=7, end_date=datetime(2026, 2, 2))
+        if daily != {'date': '2026-01-30', 'meal_count': 2, 'total_calories': 800, 'total_protein': 10}:
+            print(f"❌ Daily summary {daily}\n")
+            return False
+        if breakdown['total_meals'] != 3 or breakdown['avg_daily_calories'] != 600:
+            print(f"❌ Breakdown {breakdown}\n")
+            return False
+        print("✅ Wrappers match\n")
+
+        # Test 4: Bad arguments
+        print("Test 4: Invalid granularity and empty range...\n")
+        for args in (('2026-01-01', '2026-02-01', 'year'), ('2026-02-01', '2026-02-01', 'day')):
+            try:
+                db.get_range_summary(test_phone, *args)
+                print(f"❌ No error for {args}\n")
+                return False
+            except ValueError:
+                pass
+        print("✅ ValueError raised\n")
+
+        db.close()
+        remove_db_files(db_path)
+
+        print("✅ Range summary test: PASSED\n")
+        return True
+
+    except Exception as e:
+        print(f"❌ Test failed: {e}\n")
+        import traceback
+        traceback.print_exc()
+        remove_db_files(db_path)
+        return False
+
+
+# =============================================================================
+# TEST 20: MONTHLY AND YEARLY ROLLUPS
+# =============================================================================
+
+def test_period_rollups():
+    """Test monthly/yearly rollups follow logs, bulk loads, undos and rebuilds"""
+    print("=" * 70)
+    print("🧪 TEST 20: Monthly and Yearly Rollups")
+    print("=" * 70)
+    print()
+
+    db_path = "data/test_period_rollups.db"
+
+    def period_rows(db):
+        with db.read_connection() as conn:
+            return (conn.execute("SELECT * FROM monthly_totals ORDER BY 1, 2").fetchall(),
+                    conn.execute("SELECT * FROM yearly_totals ORDER BY 1, 2").fetchall())
+
+    try:
+        db = fresh_db(db_path)
+        test_phone = "whatsapp:+1234567890"
+        now = datetime.now()
+        this_month = now.replace(day=1, hour=12, minute=0, second=0, microsecond=0)
+
+        # Test 1: log_meal and log_meals keep the rollups in step
+        print("Test 1: Rollups after logging...\n")
+        log_test_meal(db, test_phone, calories=500, protein=20, timestamp=this_month)
+        log_test_meal(db, test_phone, calories=300, protein=10, timestamp=this_month)
+        db.log_meals([{'phone_number': test_phone, 'meal_description': 'old', 'total_calories': 200,
+                       'total_protein': 5, 'parsed_items': '[]',
+                       'timestamp': datetime(now.year - 1, 12, day, 13)} for day in (1, 2, 31)])
+        month = db.get_monthly_summary(test_phone)
+        if (month['meal_count'], month['total_calories'], month['days_with_meals'],
+                month['avg_daily_calories']) != (2, 800, 1, 800):
+            print(f"❌ Monthly summary {month}\n")
+            return False
+        last_year = db.get_yearly_summary(test_phone, now.year - 1)
+        if (last_year['meal_count'], last_year['days_with_meals'], len(last_year['months'])) != (3, 3, 12):
+            print(f"❌ Last year's summary {last_year}\n")
+            return False
+        if [m['meal_count'] for m in last_year['months']] != [0] * 11 + [3]:
+            print(f"❌ Monthly trend {[m['meal_count'] for m in last_year['months']]}\n")
+            return False
+        print(f"✅ {month['label']}: {month['meal_count']} meals, {last_year['year']}: "
+              f"{last_year['meal_count']} meals\n")
+
+        # Test 2: Undo and rebuild leave the same rows incremental updates produce
+        print("Test 2: Undo and rebuild...\n")
+        db.delete_last_meal(test_phone)
+        db.delete_last_meal(test_phone)
+        incremental = period_rows(db)
+        if any(row[1] == this_month.strftime('%Y-%m') for row in incremental[0]):
+            print(f"❌ Empty month left a rollup row: {incremental[0]}\n")
+            return False
+        db.rebuild_daily_totals()
+        if period_rows(db) != incremental:
+            print(f"❌ Rebuilt rollups differ: {period_rows(db)} vs {incremental}\n")
+            return False
+        print(f"✅ {len(incremental[0])} monthly / {len(incremental[1])} yearly rows match a rebuild\n")
+
+        # Test 3: Each summary is a primary key lookup
+        print("Test 3: Query plans...\n")
+        with db.read_connection() as conn:
+            plans = [" ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+                     for sql, params in (
+                         ("SELECT * FROM monthly_totals WHERE phone_number = ? AND month = ?", (test_phone, '2026-01')),
+                         ("SELECT * FROM yearly_totals WHERE phone_number = ? AND year = ?", (test_phone, '2026')))]
+        if any('PRIMARY KEY' not in plan for plan in plans):
+            print(f"❌ Plans {plans}\n")
+            return False
+        print(f"✅ {plans}\n")
+
+        db.close()
+        remove_db_files(db_path)
+
+        print("✅ Monthly and yearly rollup test: PASSED\n")
+        return True
+
+    except Exception as e:
+        print(f"❌ Test failed: {e}\n")
+        import traceback
+        traceback.print_exc()
+        remove_db_files(db_path)
+        return False
+
+
+# =============================================================================
+# TEST 21: CUSTOM FOOD CATALOGUE VERSIONING
+# =============================================================================
+
+def test_custom_food_catalogue_sync():
+    """Test parsers sharing one database pick up each other's custom foods"""
+    print("=" * 70)
+    print("🧪 TEST 21: Custom Food Catalogue Versioning")
+    print("=" * 70)
+    print()
+
+    db_path = "data/test_food_catalogue.db"
+
+    try:
+        # Test 1: Foods added before versioning are in the catalogue
+        print("Test 1: Upgrade backfills the change log...\n")
+        remove_db_files(db_path)
+        conn = sqlite3.connect(db_path)
+        migrate(conn, target=9)
+        conn.execute("INSERT INTO custom_foods (name, aliases, calories, protein, serving_size) "
+                     "VALUES ('poha bowl', '[]', 250, 6, '1 bowl')")
+        conn.commit()
+        conn.close()
+
+        db = MealDatabase(db_path=db_path)
+        worker_a = FoodParser('data/indian_foods.json', use_llm=False, meal_db=db)
+        worker_b = FoodParser('data/indian_foods.json', use_llm=False, meal_db=db)
+        if 'poha bowl' not in worker_a.food_index or worker_a.catalogue_version != 1:
+            print(f"❌ Existing custom food not loaded (version {worker_a.catalogue_version})\n")
+            return False
+        print("✅ Existing custom food loaded at version 1\n")
+
+        # Test 2: A food added through one worker reaches the other on its next sync
+        print("Test 2: Add through worker A, sync worker B...\n")
+        worker_a.add_custom_food("protein shake", 120, 30, "1 scoop")
+        if 'protein shake' in worker_b.food_index:
+            print("❌ Worker B saw the food before syncing\n")
+            return False
+
+        with db.read_connection() as conn:
+            statements = []
+            conn.set_trace_callback(statements.append)
+            try:
+                applied = worker_b.sync_custom_foods()
+                idle = worker_b.sync_custom_foods()
+            finally:
+                conn.set_trace_callback(None)
+        result = worker_b.process_message("2 protein shake")
+        if applied != 1 or idle != 0 or result.get('total_calories') != 240:
+            print(f"❌ Sync applied {applied}, then {idle}; parse result {result}\n")
+            return False
+        if len(statements) != 2:
+            print(f"❌ Expected one query per sync, got {len(statements)}\n")
+            return False
+        print(f"✅ Worker B synced to version {worker_b.catalogue_version} with one query\n")
+
+        # Test 3: Deletes and re-adds apply as deltas
+        print("Test 3: Delete and re-add...\n")
+        base_foods = len(worker_b.food_db)
+        db.delete_custom_food("protein shake")
+        db.add_custom_food("protein shake", 150, 25, "1 scoop")
+        worker_b.sync_custom_foods()
+        shake = worker_b.food_index.get('protein shake')
+        if shake is None or shake['calories'] != 150 or len(worker_b.food_db) != base_foods:
+            print(f"❌ After re-add: {shake}, {len(worker_b.food_db)} foods (was {base_foods})\n")
+            return False
+        db.delete_custom_food("protein shake")
+        worker_b.sync_custom_foods()
+        if 'protein shake' in worker_b.food_index or len(worker_b.food_db) != base_foods - 1:
+            print("❌ Deleted food still indexed\n")
+            return False
+        print(f"✅ Re-add and delete applied (version {worker_b.catalogue_version})\n")
+
+        db.close()
+        remove_db_files(db_path)
+
+        print("✅ Custom food catalogue test: PASSED\n")
+        return True
+
+    except Exception as e:
+        print(f"❌ Test failed: {e}\n")
+        import traceback
+        traceback.print_exc()
+        remove_db_files(db_path)
+        return False
+
+
+# =============================================================================
+# TEST 22: STREAMING MEAL IMPORT
+# =============================================================================
+
+def test_meal_import():
+    """Test importing meal history from csv and xlsx files"""
+    print("=" * 70)
+    print("🧪 TEST 22: Streaming Meal Import")
+    print("=" * 70)
+    print()
+
+    db_path = "data/test_meal_import.db"
+    csv_path = "data/test_meal_import.csv"
+    xlsx_path = "data/test_meal_import.xlsx"
+
+    def cleanup():
+        remove_db_files(db_path)
+        for path in (csv_path, xlsx_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    try:
+        db = fresh_db(db_path)
+        test_phone = "whatsapp:+1234567890"
+
+        # Test 1: csv in the export layout; meal tags come from the timestamps
+        print("Test 1: Import a csv file...\n")
+        with open(csv_path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Phone Number", "Original Message", "Timestamp", "Meal Tag",
+                             "Items Extracted", "Total Calories", "Total Protein", "Source"])
+            writer.writerow([test_phone, "2 rotis and dal", "2026-01-05T08:30:00", "Lunch",
+                             "2x roti, 1x dal", "246", "13.8", "whatsapp"])
+            writer.writerow([test_phone, "biryani", "2026-01-05T20:00:00", "Lunch",
+                             "1x biryani (unmatched: raita)", "280", "12", "whatsapp"])
+            writer.writerow([test_phone, "no timestamp", "", "", "", "100", "5", ""])
+            writer.writerow([test_phone, "bad calories", "2026-01-05T21:00:00", "", "", "lots", "5", ""])
+            writer.writerow([])
+        result = db.import_meals(csv_path, chunk_size=1)
+        if (result['rows'], result['imported'], result['skipped']) != (4, 2, 2):
+            print(f"❌ Result {result}\n")
+            return False
+        meals = db.get_all_meals(phone_number=test_phone)
+        tags = sorted(meal['meal_tag'] for meal in meals)
+        foods = [row['food_name'] for row in db.get_food_totals(test_phone)]
+        if tags != ['breakfast', 'dinner'] or foods != ['roti', 'biryani', 'dal']:
+            print(f"❌ Tags {tags}, foods {foods}\n")
+            return False
+        if db.get_daily_summary(test_phone, datetime(2026, 1, 5))['total_calories'] != 526:
+            print("❌ Rollups not updated\n")
+            return False
+        print(f"✅ {result}\n")
+
+        # Test 2: xlsx without a phone column, phone given by the caller
+        print("Test 2: Import an xlsx file with a phone override...\n")
+        from openpyxl import Workbook
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("History")
+        ws.append(["Timestamp", "Description", "Calories", "Protein"])
+        for day in range(1, 11):
+            ws.append([datetime(2026, 2, day, 13), f"lunch {day}", 500, 20])
+        wb.save(xlsx_path)
+        result = db.import_meals(xlsx_path, phone_number="whatsapp:+1999", source="import")
+        month = db.get_monthly_summary("whatsapp:+1999", datetime(2026, 2, 1))
+        if result['imported'] != 10 or month['meal_count'] != 10 or month['total_calories'] != 5000:
+            print(f"❌ Result {result}, month {month}\n")
+            return False
+        print(f"✅ {result}\n")
+
+        # Test 3: Files the importer can't map
+        print("Test 3: Missing columns and unsupported files...\n")
+        for path, kwargs in ((xlsx_path, {}), ("README.md", {'phone_number': test_phone})):
+            try:
+                db.import_meals(path, **kwargs)
+                print(f"❌ No error for {path}\n")
+                return False
+            except ValueError as e:
+                print(f"✅ {e}")
+        print()
+
+        db.close()
+        cleanup()
+
+        print("✅ Meal import test: PASSED\n")
+        return True
+
+    except Exception as e:
+        print(f"❌ Test failed: {e}\n")
+        import traceback
+        traceback.print_exc()
+        cleanup()
+        return False
+
+
+# =============================================================================
+# TEST 23: ONLINE BACKUP
+# =============================================================================
+
+def test_online_backup():
+    """Test backups copy a consistent snapshot while writes continue, and rotate"""
+    print("=" * 70)
+    print("🧪 TEST 23: Online Backup")
+    print("=" * 70)
+    print()
+
+    db_path = "data/test_backup.db"
+    backup_dir = "data/test_backups"
+
+    def cleanup():
+        remove_db_files(db_path)
+        if os.path.isdir(backup_dir):
+            for name in os.listdir(backup_dir):
+                os.remove(os.path.join(backup_dir, name))
+            os.rmdir(backup_dir)
+
+    try:
+        cleanup()
+        db = fresh_db(db_path)
+        test_phone = "whatsapp:+1234567890"
+        db.log_meals(({
+            'phone_number': test_phone,
+            'meal_description': f"meal {i} " + "x" * 200,
+            'total_calories': 100,
+            'total_protein': 5,
+            'parsed_items': '[]',
+        } for i in range(5000)), chunk_size=1000)
+
+        # Test 1: Paced backup while another thread keeps logging meals
+        print("Test 1: Backup in small steps during writes...\n")
+        stop = threading.Event()
+        writes = []
+
+        def writer():
+            while not stop.is_set():
+                db.log_meal("whatsapp:+1999", "snack", 50, 1, '[]')
+                writes.append(1)
+                time.sleep(0.001)
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        result = run_backup(db, backup_dir, keep=2, pages=8, step_sleep=0.001)
+        stop.set()
+        thread.join()
+
+        run = result['files'][0]
+        if run['error'] or run['integrity'] != 'ok' or run['steps'] < 10 or run['restarts'] != 0:
+            print(f"❌ Backup run {run}\n")
+            return False
+        copy = sqlite3.connect(run['backup_path'])
+        copied = copy.execute("SELECT COUNT(*) FROM meals WHERE phone_number = ?", (test_phone,)).fetchone()[0]
+        copy.close()
+        if copied != 5000 or run['bytes'] != os.path.getsize(run['backup_path']):
+            print(f"❌ Copy has {copied} meals\n")
+            return False
+        print(f"✅ {run['pages']} pages in {run['steps']} steps, {len(writes)} writes meanwhile\n")
+
+        # Test 2: Rotation keeps the newest snapshots and history records each run
+        print("Test 2: Rotation and history...\n")
+        removed = [run_backup(db, backup_dir, keep=2)['files'][0]['removed'] for _ in range(2)]
+        snapshots = list_backups(db_path, backup_dir)
+        history = backup_history(db, limit=5)
+        if removed != [0, 1] or len(snapshots) != 2 or len(history) != 3:
+            print(f"❌ Removed {removed}, snapshots {snapshots}, history {len(history)}\n")
+            return False
+        if snapshots[-1] != history[0]['backup_path']:
+            print("❌ History doesn't point at the newest snapshot\n")
+            return False
+        print(f"✅ Kept {len(snapshots)} snapshots, {len(history)} runs recorded\n")
+
+        # Test 3: Workers starting together take one backup between them
+        print("Test 3: Two workers claim the same interval...\n")
+        other = MealDatabase(db_path=db_path)
+        workers = [BackupWorker(file_db, backup_dir, interval_seconds=3600, keep=10)
+                   for file_db in (db, other)]
+        barrier = threading.Barrier(2)
+        results = []
+
+        def scheduled_run(worker):
+            barrier.wait()
+            results.append(worker.run_once())
+
+        threads = [threading.Thread(target=scheduled_run, args=(worker,)) for worker in workers]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        other.close()
+        ran = [result for result in results if result is not None]
+        if len(ran) != 1 or ran[0]['files'][0]['error'] or workers[0].run_once() is not None:
+            print(f"❌ Scheduled runs {results}\n")
+            return False
+        restarted = BackupWorker(db, backup_dir, interval_seconds=3600)
+        if restarted.seconds_until_due() < 3500:
+            print(f"❌ Restarted worker due in {restarted.seconds_until_due():.0f}s\n")
+            return False
+        print("✅ One worker backed up, the other skipped, restarts keep the schedule\n")
+
+        db.close()
+        cleanup()
+
+        print("✅ Online backup test: PASSED\n")
+        return True
+
+    except Exception as e:
+        print(f"❌ Test failed: {e}\n")
+        import traceback
+        traceback.print_exc()
+        cleanup()
+        return False
+
+
+# =============================================================================
+# TEST 24: QUERY TIMING AND SLOW-QUERY LOG
+# =============================================================================
+
+def test_query_stats():
+    """Test method latency histograms and the slow-query log"""
+    print("=" * 70)
+    print("🧪 TEST 24: Query Timing and Slow-Query Log")
+    print("=" * 70)
+    print()
+
+    db_path = "data/test_query_stats.db"
+    shard_root = "data/test_query_stats_sharded.db"
+
+    def cleanup():
+        remove_db_files(db_path)
+        remove_db_files(shard_root)
+        for i in range(2):
+            remove_db_files(shard_path(shard_root, i, 2))
+
+    try:
+        cleanup()
+        db = fresh_db(db_path, slow_query_ms=None)
+        test_phone = "whatsapp:+1234567890"
+
+        # Test 1: Every call lands in its method's histogram, nested calls included
+        print("Test 1: Per-method histograms...\n")
+        for i in range(20):
+            db.log_meal(test_phone, f"meal {i}", 100, 5, '[]')
+        for _ in range(5):
+            db.get_daily_summary(test_phone)
+        stats = db.get_query_stats()
+        log_meal = stats.get('log_meal', {})
+        if log_meal.get('count') != 20 or sum(log_meal['buckets'].values()) != 20:
+            print(f"❌ log_meal stats {log_meal}\n")
+            return False
+        if stats['get_daily_summary']['count'] != 5 or stats['get_range_summary']['count'] != 5:
+            print("❌ Nested calls not counted\n")
+            return False
+        if not 0 < log_meal['p50_ms'] <= log_meal['p99_ms'] <= log_meal['max_ms']:
+            print(f"❌ Percentiles out of order {log_meal}\n")
+            return False
+        if db.get_slow_queries():
+            print("❌ Slow log should be off\n")
+            return False
+        print(f"✅ log_meal: {log_meal['count']} calls, p50 {log_meal['p50_ms']}ms, "
+              f"p99 {log_meal['p99_ms']}ms\n")
+
+        # Test 2: Calls over the threshold are logged with SQL, parameters and plans
+        print("Test 2: Slow-query log...\n")
+        db.query_stats.slow_query_ms = 0
+        db.get_range_summary(test_phone, datetime.now() - timedelta(days=7), datetime.now())
+        db.get_food_totals(test_phone)
+        slow = db.get_slow_queries()
+        if [entry['method'] for entry in slow] != ['get_food_totals', 'get_range_summary']:
+            print(f"❌ Slow log {[entry['method'] for entry in slow]}\n")
+            return False
+        statement = slow[1]['statements'][0]
+        if ('daily_totals' not in statement['sql'] or test_phone not in statement['parameters']
+                or not any('daily_totals' in line for line in statement['plan'])):
+            print(f"❌ Statement {statement}\n")
+            return False
+        print(f"✅ {statement['sql'][:60]}...")
+        print(f"   plan: {statement['plan']}\n")
+
+        db.reset_query_stats()
+        if db.get_query_stats() or db.get_slow_queries():
+            print("❌ Reset didn't clear the stats\n")
+            return False
+        db.close()
+
+        # Test 3: Sharded stats merge every file
+        print("Test 3: Merged across shards...\n")
+        sharded = ShardedMealDatabase(db_path=shard_root, shard_count=2, slow_query_ms=None)
+        for i in range(10):
+            sharded.log_meal(f"whatsapp:+1{i:03d}", "meal", 100, 5, '[]')
+        merged = sharded.get_query_stats()['log_meal']['count']
+        sharded.close()
+        cleanup()
+        if merged != 10:
+            print(f"❌ Merged count {merged}\n")
+            return False
+        print(f"✅ {merged} log_meal calls across 2 shards\n")
+
+        print("✅ Query stats test: PASSED\n")
+        return True
+
+    except Exception as e:
+        print(f"❌ Test failed: {e}\n")
+        import traceback
+        traceback.print_exc()
+        cleanup()
+        return False
+
+
+# =============================================================================
+# MAIN TEST RUNNER
+# =============================================================================
+
+def run_all_tests():
+    """Run all database layer tests"""
+    print()
+    print("=" * 70)
+    print("🚀 WhatsApp Calorie Tracker - Database Layer Test Suite")
+    print("=" * 70)
+    print()
+
+    results = {}
+    results['Connection Pool'] = test_connection_pool()
+    results['Storage Profiles'] = test_storage_profiles()
+    results['Summary Query Plans'] = test_summary_query_plans()
+    results['N-Day Breakdown'] = test_daily_breakdown_window()
+    results['Daily Totals Rollup'] = test_daily_totals_rollup()
+    results['Bulk Ingestion'] = test_bulk_log_meals()
+    results['Single-Transaction Writes'] = test_log_meal_write_path()
+    results['Schema Migrations'] = test_schema_migrations()
+    results['Streaming Iteration'] = test_iter_meals()
+    results['Keyset Pagination'] = test_meal_history_pagination()
+    results['Asyncio Facade'] = test_async_database()
+    results['Sharded Storage'] = test_sharded_database()
+    results['Write-Behind Logging'] = test_write_behind()
+    results['Read-Only Connections'] = test_read_only_connections()
+    results['Hot/Cold Retention'] = test_meal_retention()
+    results['Database Maintenance'] = test_database_maintenance()
+    results['Meal Items'] = test_meal_items()
+    results['Atomic Undo'] = test_atomic_delete_last_meal()
+    results['Range Summaries'] = test_range_summary()
+    results['Monthly/Yearly Rollups'] = test_period_rollups()
+    results['Custom Food Catalogue'] = test_custom_food_catalogue_sync()
+    results['Meal Import'] = test_meal_import()
+    results['Online Backup'] = test_online_backup()
+    results['Query Timing'] = test_query_stats()
+
+    # Summary
+    print("=" * 70)
+    print("📊 TEST SUMMARY")
+    print("=" * 70)
+    print()
+
+    for test_name, result in results.items():
+        status = "✅ PASS" if result else "❌ FAIL"
+        print(f"{test_name:.<40} {status}")
+
+    total_tests = len(results)
+    passed_tests = sum(1 for v in results.values() if v)
+
+    print()
+    print("=" * 70)
+    print(f"OVERALL RESULTS: {passed_tests}/{total_tests} tests passed")
+    print("=" * 70)
+    print()
+
+    return passed_tests == total_tests
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)